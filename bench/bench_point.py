@@ -0,0 +1,58 @@
+"""
+Times the `Point`-heavy inner loops against the same arithmetic done on plain
+floats, which is what `VariableWidthPolyline.iter_width_along` now does.
+
+    python bench/bench_point.py
+"""
+
+from timeit import timeit
+
+from timcam.types import Point
+from timcam.types.line import VariableWidthPolyline
+
+N = 100_000
+
+
+def points():
+    pt = Point(0.0, 0.0)
+    unit = Point(0.6, 0.8)
+    for _ in range(N):
+        pt += unit * 5
+    return pt
+
+
+def tuples():
+    px, py = 0.0, 0.0
+    ux, uy = 0.6, 0.8
+    for _ in range(N):
+        px += ux * 5
+        py += uy * 5
+    return Point(px, py)
+
+
+def width_along():
+    line = VariableWidthPolyline(Point(0, 0), 5000)
+    for i in range(1, 2001):
+        line.add_point(Point(i * 1000, (i % 7) * 100), 5000 + (i % 13) * 50)
+    return lambda: sum(1 for _ in line.iter_width_along(50))
+
+
+def lookups():
+    pts = [Point(x, y) for x in range(300) for y in range(300)]
+    seen = set(pts[::2])
+    return lambda: sum(p in seen for p in pts)
+
+
+def main():
+    assert points() == tuples()
+    for name, fn in [
+        ("Point +=, *", points),
+        ("float +=, *", tuples),
+        ("iter_width_along", width_along()),
+        ("set lookups", lookups()),
+    ]:
+        print("%-20s %8.1f ms" % (name, timeit(fn, number=5) / 5 * 1000))
+
+
+if __name__ == "__main__":
+    main()
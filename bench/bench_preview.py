@@ -0,0 +1,79 @@
+"""
+Per-frame cost of getting a full-size preview out of cairo: converting it to
+PIL (with and without the old extra copy) or numpy, and each of the
+`timcam.preview.ENCODERS`.
+
+    python bench/bench_preview.py [frames]
+"""
+
+import os
+import sys
+import tempfile
+from math import cos, pi as PI, sin
+from timeit import timeit
+
+import cairo
+from PIL import Image
+
+from timcam.base_steps import Status
+from timcam.cairo_pil import to_numpy, to_pil
+from timcam.preview import ENCODERS, fit_matrix
+
+
+def frame() -> cairo.ImageSurface:
+    """
+    Something like a busy overview: filled pockets and a lot of toolpath.
+    """
+    img = cairo.ImageSurface(cairo.FORMAT_ARGB32, *Status.viewport_size)
+    ctx = cairo.Context(img)
+    ctx.set_matrix(fit_matrix((0, 200_000, 0, 120_000), Status.viewport_size))
+    for i in range(40):
+        cx = 15_000 + (i % 8) * 24_000
+        cy = 15_000 + (i // 8) * 22_000
+        ctx.new_sub_path()
+        ctx.arc(cx, cy, 9_000, 0, 2 * PI)
+        ctx.set_source_rgb(0.7, 0.7, 0.7)
+        ctx.fill()
+        ctx.move_to(cx, cy)
+        for j in range(500):
+            r = j * 16
+            ctx.line_to(cx + r * cos(j / 5), cy + r * sin(j / 5))
+        ctx.set_source_rgb(0, 0.6, 0)
+        ctx.set_line_width(50)
+        ctx.stroke()
+    return img
+
+
+def to_pil_copy(surface):
+    # What `to_pil` used to do
+    with surface.get_data() as memory:
+        return Image.frombuffer(
+            "RGBA",
+            (surface.get_width(), surface.get_height()),
+            memory.tobytes(),
+            "raw",
+            "BGRa",
+            surface.get_stride(),
+        )
+
+
+def main(frames: int = 10) -> None:
+    img = frame()
+    print("%-12s %9s %10s" % ("", "ms/frame", "bytes"))
+    for name, fn in [
+        ("to_pil+copy", to_pil_copy),
+        ("to_pil", to_pil),
+        ("to_numpy", to_numpy),
+    ]:
+        t = timeit(lambda: fn(img), number=frames) / frames
+        print("%-12s %9.2f" % (name, t * 1000))
+
+    with tempfile.TemporaryDirectory() as d:
+        for name, (ext, save, load) in ENCODERS.items():
+            path = os.path.join(d, "frame" + ext)
+            t = timeit(lambda: save(img, path), number=frames) / frames
+            print("%-12s %9.2f %10d" % (name, t * 1000, os.path.getsize(path)))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
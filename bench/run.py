@@ -0,0 +1,266 @@
+"""
+Runs the pipeline stage by stage on the synthetic workloads in
+`bench.workloads`, and reports the time and peak memory for each stage as
+JSON, to compare across commits.
+
+    python -m bench.run [--scale N] [--only NAME ...] [--out FILE]
+
+Stages are run directly (not through `Status`), one at a time, and their
+times are summed over every shape in the workload.  Memory is the peak Python
+allocation (from `tracemalloc`, in a second pass so it doesn't skew the
+times) above what was allocated when the stage started.  It doesn't include
+what pyvoronoi and pyclipper allocate internally.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from timcam.base_steps import _WorkerStatus
+from timcam.tc0.loader.dxf import LoadDxf, add_entity
+from timcam.tc1 import ProcessShapes
+from timcam.tc2 import TOOL_RADIUS, PocketStep, ProfileStep
+from timcam.tc3 import AsymmetricStadiumStep, SpiralStep
+from timcam.types import Jumble, Loop, Poly, Voronoi
+from timcam.types.voronoi import Dag
+
+from .workloads import WORKLOADS
+
+STAGES = (
+    "load",
+    "close_loops",
+    "fixup",
+    "parent_info",
+    "offset",
+    "voronoi.construct",
+    "voronoi.readback",
+    "dag",
+    "simplify",
+    "tc3",
+)
+
+
+class Stages:
+    """
+    Adds up time (and with `memory`, peak allocation) per stage name.  Stages
+    can nest; the outer one's time excludes the inner one's.
+    """
+
+    def __init__(self, memory: bool = False) -> None:
+        self.memory = memory
+        self.seconds: dict[str, float] = defaultdict(float)
+        self.peak_bytes: dict[str, int] = defaultdict(int)
+        # [start memory, max memory, time in nested stages]
+        self._stack: list[list] = []
+
+    @contextmanager
+    def __call__(self, name: str):
+        if self.memory:
+            cur, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        else:
+            cur = 0
+        frame = [cur, cur, 0.0]
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._stack.pop()
+            self.seconds[name] += elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            if self.memory:
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                self.peak_bytes[name] = max(self.peak_bytes[name], frame[1] - frame[0])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], frame[1])
+
+
+def _count_edges(dag: Dag) -> int:
+    """
+    How many distinct edges `dag` has before `Dag.simplify`, which is when
+    it still has each edge in both directions (so isn't a tree).
+    """
+    seen = set()
+    stack = list(dag.next)
+    while stack:
+        edge = stack.pop()
+        if edge._edge_idx not in seen:
+            seen.add(edge._edge_idx)
+            stack.extend(edge.next)
+    return len(seen)
+
+
+def pipeline(path: Path, stages: Stages) -> dict[str, int]:
+    """
+    Runs every stage on the file at `path`, returning some counts of how big
+    the job was: among others, DAG edges before (`dag_edges_raw`) and after
+    (`dag_edges`) simplifying, and the deepest simplified DAG (`max_depth`).
+    Time spent counting those is left out of every stage.
+    """
+    size: dict[str, int] = defaultdict(int)
+    # Records what steps submit instead of running them
+    status = _WorkerStatus(None)
+
+    with stages("load"):
+        j = Jumble()
+        for entity in LoadDxf(path=path, key=(0,), status=status)._entities():
+            add_entity(j, entity)
+    with stages("close_loops"):
+        j.close_loops()
+    with stages("fixup"):
+        j.fixup()
+    with stages("parent_info"):
+        j.parent_info()
+    size["loops"] = len(j.full_loops)
+    size["vertices"] = sum(len(loop.coords) for loop in j.full_loops)
+
+    shapes = ProcessShapes(j, key=(0, 0), status=status)
+    shapes.prepare()
+    shapes.run()
+
+    simplify = Dag.simplify
+
+    def timed_simplify(self, *args):
+        with stages("stats"):
+            size["dag_edges_raw"] += _count_edges(self)
+        with stages("simplify"):
+            return simplify(self, *args)
+
+    Dag.simplify = timed_simplify
+    try:
+        for step in status.submitted:
+            if isinstance(step, ProfileStep):
+                size["profiles"] += 1
+                with stages("offset"):
+                    step._offset()
+                continue
+
+            assert isinstance(step, PocketStep)
+            size["pockets"] += 1
+            with stages("offset"):
+                outlines, islands = step._offset(TOOL_RADIUS)
+            island_loops = [Loop(i) for i in islands]
+            for outline in outlines:
+                poly = Poly(Loop(outline), island_loops)
+                segments = poly.segments()
+                size["segments"] += len(segments)
+                # What `Voronoi.__init__` does, in two parts
+                vor = Voronoi.__new__(Voronoi)
+                with stages("voronoi.construct"):
+                    vor._construct(segments)
+                with stages("voronoi.readback"):
+                    vor._readback(
+                        poly, np.array(segments, dtype=np.float64).reshape(-1, 2, 2)
+                    )
+                with stages("dag"):
+                    dag = vor.dag(step.path_threshold)
+                with stages("stats"):
+                    depth = {id(dag): 0}
+                    for parent, edge in dag.visit_preorder():
+                        if parent is not None:
+                            depth[id(edge)] = depth[id(parent)] + 1
+                            size["dag_edges"] += 1
+                    size["max_depth"] = max(size["max_depth"], *depth.values())
+                with stages("tc3"):
+                    SpiralStep(dag.start_pt, dag.start_rad, key=(), status=status).run()
+                    for parent, edge in dag.visit_preorder():
+                        if parent is not None:
+                            AsymmetricStadiumStep(
+                                edge.line, key=(), status=status
+                            ).run()
+    finally:
+        Dag.simplify = simplify
+    return dict(size)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply each workload's size"
+    )
+    parser.add_argument("--only", nargs="*", choices=sorted(WORKLOADS))
+    parser.add_argument("--out", type=Path, help="write JSON here, not stdout")
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the tracemalloc pass"
+    )
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "workloads": {},
+    }
+    with tempfile.TemporaryDirectory() as d:
+        for name in args.only or WORKLOADS:
+            func, params = WORKLOADS[name]
+            params = dict(params)
+            first = next(iter(params))
+            params[first] = max(1, round(params[first] * args.scale))
+            path = Path(d, name + ".dxf")
+            func(str(path), **params)
+
+            stages = Stages()
+            size = pipeline(path, stages)
+            if not args.no_memory:
+                mem = Stages(memory=True)
+                tracemalloc.start()
+                try:
+                    pipeline(path, mem)
+                finally:
+                    tracemalloc.stop()
+
+            results["workloads"][name] = {
+                "params": params,
+                "size": size,
+                "seconds": {s: round(stages.seconds[s], 6) for s in STAGES},
+                "total_seconds": round(sum(stages.seconds[s] for s in STAGES), 6),
+                "peak_bytes": (
+                    None if args.no_memory else {s: mem.peak_bytes[s] for s in STAGES}
+                ),
+            }
+            print(
+                "%-8s %8.3fs  %s"
+                % (name, results["workloads"][name]["total_seconds"], size),
+                file=sys.stderr,
+            )
+
+    text = json.dumps(results, indent=1)
+    if args.out is None:
+        print(text)
+    else:
+        args.out.write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Generators for synthetic DXF files shaped like the jobs that are slow in
+different ways.  Each takes the path to write and a size parameter (the first
+one, which `bench.run --scale` multiplies); dimensions are in mm.
+"""
+
+from math import ceil, cos, sin, sqrt
+from math import pi as PI
+
+import ezdxf
+
+
+def _rect(msp, x1, y1, x2, y2) -> None:
+    msp.add_lwpolyline([(x1, y1), (x2, y1), (x2, y2), (x1, y2)], close=True)
+
+
+def plate(path: str, holes: int = 100) -> None:
+    """
+    A perforated plate: one outline with a grid of round holes (many small
+    pockets, all arcs).
+    """
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    n = ceil(sqrt(holes))
+    pitch = 10
+    _rect(msp, 0, 0, n * pitch + 10, ceil(holes / n) * pitch + 10)
+    for i in range(holes):
+        msp.add_circle((10 + (i % n) * pitch, 10 + (i // n) * pitch), 3)
+    doc.saveas(path)
+
+
+def slots(path: str, length: int = 1000, n: int = 4) -> None:
+    """
+    Long narrow slots with a notch every 10mm along one side, like a comb.
+    Each notch leaves a whisker on the medial axis that survives simplifying,
+    so the DAGs get deeper the longer the slots are.
+    """
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    _rect(msp, 0, 0, length + 20, n * 20 + 10)
+    # 8mm wide, with 6mm wide, 4mm deep notches (still 2mm wide, and
+    # 4mm long whiskers, once offset by the tool radius)
+    x1, x2 = 10, 10 + length
+    notches = range(x1 + 5, x2 - 10, 10)
+    for i in range(n):
+        cy = 10 + i * 20
+        top = [(x2, cy + 4)]
+        for x in reversed(notches):
+            top += [(x + 6, cy + 4), (x + 6, cy + 8), (x, cy + 8), (x, cy + 4)]
+        top.append((x1, cy + 4))
+        msp.add_lwpolyline([(x1, cy - 4), (x2, cy - 4)] + top, close=True)
+    doc.saveas(path)
+
+
+def nested(path: str, count: int = 9, depth: int = 3) -> None:
+    """
+    A grid of `count` pockets, each with an island with a pocket in it, and so
+    on `depth` levels down.
+    """
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    n = ceil(sqrt(count))
+    # Rings 8mm wide, and 32mm across in the middle
+    size = depth * 32 + 16
+    _rect(msp, 0, 0, n * (size + 10) + 10, ceil(count / n) * (size + 10) + 10)
+    for i in range(count):
+        x = 10 + (i % n) * (size + 10)
+        y = 10 + (i // n) * (size + 10)
+        for level in range(depth * 2):
+            inset = level * 8
+            _rect(msp, x + inset, y + inset, x + size - inset, y + size - inset)
+    doc.saveas(path)
+
+
+def dense(path: str, points: int = 2000) -> None:
+    """
+    A plate with one pocket, a wavy spline through `points` fit points (ending
+    where it starts), which flattens to a dense outline.
+    """
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    _rect(msp, -120, -120, 120, 120)
+    fit = []
+    for i in range(points + 1):
+        t = 2 * PI * i / points
+        r = 100 + 5 * sin(t * points / 20)
+        fit.append((r * cos(t), r * sin(t)))
+    # So the ends are the same point, not just close
+    fit[-1] = fit[0]
+    msp.add_spline(fit)
+    doc.saveas(path)
+
+
+# name -> (generator, default params)
+WORKLOADS = {
+    "plate": (plate, {"holes": 100}),
+    "slots": (slots, {"length": 1000, "n": 4}),
+    "nested": (nested, {"count": 9, "depth": 3}),
+    "dense": (dense, {"points": 2000}),
+}
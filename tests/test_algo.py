@@ -1,7 +1,15 @@
 from math import pi as PI
 
 from timcam.types import Point
-from timcam.algo import outer_tangents, outer_tangent_angles
+from timcam.algo import (
+    arc_points,
+    arc_segments,
+    bulge_points,
+    dedupe_run,
+    sleeve_simplify,
+    outer_tangents,
+    outer_tangent_angles,
+)
 
 
 def test_outer_tangents_parallel():
@@ -59,3 +67,56 @@ def test_outer_tangent_angles():
     assert rv is not None
     assert rv[0] == 0  # theta
     assert rv[1] == PI * 3 / 4  # phi, isosocles (angle measured from c2)
+
+
+def test_arc_segments():
+    # 2 * acos(1 - 10 / 1000) is about 0.283 radians per chord
+    assert arc_segments(1000, PI / 2, 10) == 6
+    assert arc_segments(1000, -PI / 2, 10) == 6
+    # Only the radius and sweep matter, not where the arc is
+    assert len(arc_points((0, 0), 1000, 0, PI / 2, 10)) == 7
+    assert len(arc_points((5000, -300), 1000, 1, PI / 2, 10)) == 7
+    assert arc_segments(100_000, PI / 2, 10) > arc_segments(1000, PI / 2, 10)
+    assert arc_segments(1000, PI, 10) == 2 * arc_segments(1000, PI / 2, 10)
+    # Huge tolerance still makes a triangle
+    assert arc_segments(10, 2 * PI, 1000) == 3
+    assert arc_segments(0, PI, 10) == 1
+
+
+def test_bulge_points():
+    # Counterclockwise half circle below the chord
+    pts = bulge_points((0, 0), (10, 0), 1, 0.01)
+    assert pts[0] == (0, 0)
+    assert pts[-1] == (10, 0)
+    for x, y in pts:
+        assert abs(((x - 5) ** 2 + y**2) ** 0.5 - 5) < 1e-9
+        assert y <= 1e-9
+    # Clockwise goes above
+    assert all(y >= -1e-9 for x, y in bulge_points((0, 0), (10, 0), -1, 0.01))
+    assert bulge_points((0, 0), (10, 0), 0, 0.01) == [(0, 0), (10, 0)]
+
+
+def test_dedupe_run():
+    pts, n = dedupe_run([(0, 0), (0, 0), (5, 0), (5, 1), (10, 0), (10, 0)], 1)
+    assert pts == [(0, 0), (5, 0), (10, 0)]
+    assert n == 3
+
+
+def test_sleeve_simplify():
+    # Collinear runs collapse
+    assert sleeve_simplify([(0, 0), (1, 0), (2, 0), (3, 0), (3, 5)], 0) == [
+        (0, 0),
+        (3, 0),
+        (3, 5),
+    ]
+    # Wiggles within tolerance are removed, but not outside it
+    wiggle = [(i * 10, (i % 2) * 2) for i in range(11)]
+    assert sleeve_simplify(wiggle, 2) == [(0, 0), (100, 0)]
+    assert len(sleeve_simplify(wiggle, 0.5)) == 11
+    # Corners are kept
+    assert sleeve_simplify([(0, 0), (10, 0), (10, 10), (0, 10)], 1) == [
+        (0, 0),
+        (10, 0),
+        (10, 10),
+        (0, 10),
+    ]
@@ -0,0 +1,87 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from timcam.api import Main
+from timcam.cache import CACHE_VERSION, MARKER, StepCache
+from timcam.types import Loop, Point
+
+
+def test_key():
+    c = StepCache.__new__(StepCache)
+    loop = Loop([Point(0, 0), Point(10, 0), Point(10, 10)])
+    assert c.key("a", loop, 2000) == c.key("a", Loop(loop.coords.copy()), 2000)
+    assert c.key("a", loop, 2000) != c.key("a", loop, 2001)
+    assert c.key("a", loop, 2000) != c.key("a", loop, 2000.0)
+    assert c.key(("a", "b")) != c.key("a", "b")
+    assert c.key(np.array([1, 2])) != c.key(np.array([[1, 2]]))
+
+
+def test_get_put_evict(tmp_path):
+    c = StepCache(tmp_path, max_bytes=800)
+    assert c.get("x") == (False, None)
+    c.put("x", b"1" * 300)
+    assert c.get("x") == (True, b"1" * 300)
+    assert c.get_or_compute("y", lambda: b"2" * 300) == b"2" * 300
+    assert c.get_or_compute("y", lambda: 1 / 0) == b"2" * 300
+
+    # Make "x" the least recently used
+    os.utime(c.dir / "x", (0, 0))
+    c.put("z", b"3" * 300)
+    assert not (c.dir / "x").exists()
+    assert (c.dir / "y").exists()
+    assert (c.dir / "z").exists()
+
+
+def test_put_replace(tmp_path):
+    c = StepCache(tmp_path)
+    c.put("x", b"1" * 300)
+    c.put("x", b"1" * 100)
+    assert c.counts()[2] == (c.dir / "x").stat().st_size
+
+
+def test_version_change(tmp_path):
+    (tmp_path / "0-old").mkdir()
+    (tmp_path / "0-old" / MARKER).write_bytes(b"")
+    (tmp_path / "0-old" / "x").write_bytes(b"")
+    # Not made by StepCache, so left alone
+    (tmp_path / "other").mkdir()
+    c = StepCache(tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [c.dir.name, "other"]
+    assert c.dir.name.startswith("%d-" % CACHE_VERSION)
+
+
+def test_workflow_reuse(tmp_path):
+    def run():
+        m = Main(2, cache=StepCache(tmp_path))
+        m.load(Path("tests/shapes/11_5spot.dxf"))
+        m.wait()
+        return m
+
+    first = run()
+    assert first.cache.hits == 0
+    second = run()
+    assert second.cache.misses == 0
+    assert second.cache.hits == first.cache.misses
+    assert sorted(first.results) == sorted(second.results)
+    assert (
+        first.results[(0, 0, 0)]._offset_islands
+        == second.results[(0, 0, 0)]._offset_islands
+    )
+
+
+def test_workflow_reuse_processes(tmp_path):
+    def run():
+        m = Main(2, processes=True, cache=StepCache(tmp_path))
+        m.load(Path("tests/shapes/11_5spot.dxf"))
+        m.wait()
+        return m
+
+    first = run()
+    assert first.cache.misses > 0
+    assert first.cache.counts()[2] == sum(
+        p.stat().st_size for p in first.cache.dir.iterdir() if p.name[0] != "."
+    )
+    second = run()
+    assert second.cache.hits == first.cache.misses
@@ -1,5 +1,5 @@
 import cairo
-from timcam.cairo_pil import to_pil
+from timcam.cairo_pil import from_pil, to_numpy, to_pil
 
 
 def test_argb32():
@@ -44,3 +44,28 @@ def test_rgb24():
     assert pil_image.getpixel((20, 0)) == (0, 0, 0)
     assert pil_image.getpixel((0, 19)) == (0, 0, 0)
     assert pil_image.getpixel((20, 19)) == (0, 0, 0)
+
+
+def test_numpy_view():
+    img = cairo.ImageSurface(cairo.FORMAT_ARGB32, 21, 20)
+    ctx = cairo.Context(img)
+    ctx.rectangle(0, 0, 10, 10)
+    ctx.set_source_rgb(1, 0, 0)
+    ctx.fill()
+
+    pixels = to_numpy(img)
+    assert pixels.shape == (20, 21, 4)
+    assert pixels[0, 0].tolist() == [0, 0, 255, 255]
+    assert pixels[19, 20].tolist() == [0, 0, 0, 0]
+    # It's the surface's own memory
+    pixels[19, 20] = (255, 0, 0, 255)
+    img.mark_dirty()
+    assert to_pil(img).getpixel((20, 19)) == (0, 0, 255, 255)
+
+
+def test_from_pil():
+    img = cairo.ImageSurface(cairo.FORMAT_ARGB32, 21, 20)
+    to_numpy(img)[3, 4] = (0, 255, 0, 255)
+    img.mark_dirty()
+    back = from_pil(to_pil(img))
+    assert to_numpy(back).tolist() == to_numpy(img).tolist()
@@ -1,7 +1,19 @@
+import asyncio
+import json
 from concurrent.futures import Future
 from pathlib import Path
-from timcam.api import Main
+
+import ezdxf
+import pytest
+
+from timcam import trace
+from timcam.api import Main, run_many
+from timcam.base_steps import StepError
+from timcam.tc0.job import JobSource
+from timcam.tc0.loader.dxf import LoadDxf
+from timcam.tc1 import ProcessShapes
 from timcam.tc2 import PocketStep, ProfileStep
+from timcam.tc3 import SpiralStep
 
 
 class LockstepMain(Main):
@@ -88,3 +100,216 @@ def test_full_workflow():
 def width(lst):
     xs = [i[0] for i in lst]
     return max(xs) - min(xs)
+
+
+def test_process_backend():
+    m = Main(2, processes=True)
+    m.load(Path("tests/shapes/11_5spot.dxf"))
+    m.wait()
+    assert len(m.results[(0,)].jumble.full_loops) == 7
+    pocket = m.results[(0, 0, 0)]
+    assert isinstance(pocket, PocketStep)
+    assert pocket._status is m
+    assert width(pocket._offset_islands[0]) == 11000
+    assert isinstance(m.results[(0, 0, 0, 0)], SpiralStep)
+    assert m.cairo_matrix is not None
+    assert list(m.cairo_matrices) == [(0,)]
+
+
+def test_matrix_per_file():
+    m = Main(2)
+    m.start(Path("tests/shapes/11_5spot.dxf"))
+    m.start(Path("tests/shapes/01_rectangle_pocket.dxf"))
+    m.wait()
+    # Each file's previews are drawn with its own bounds
+    assert sorted(m.cairo_matrices) == [(0,), (1,)]
+    assert tuple(m.cairo_matrices[(0,)]) != tuple(m.cairo_matrices[(1,)])
+
+
+def test_completion_events():
+    m = Main(2)
+    seen = []
+    m.subscribe(lambda key, step, error: seen.append(key))
+    # Not submitted yet
+    pocket_tree = m.tree_future((0, 0, 0))
+    m.load(Path("tests/shapes/11_5spot.dxf"))
+
+    tree = pocket_tree.result(timeout=10)
+    assert isinstance(tree[(0, 0, 0)], PocketStep)
+    assert isinstance(tree[(0, 0, 0, 0)], SpiralStep)
+    assert all(k[:3] == (0, 0, 0) for k in tree)
+
+    everything = m.tree_future().result(timeout=10)
+    m.wait()
+    assert sorted(seen) == sorted(everything) == sorted(m.results)
+    # Already done
+    assert m.tree_future((0,)).result(timeout=0) == m.results
+
+
+def test_load_many():
+    paths = [
+        Path("tests/shapes/11_5spot.dxf"),
+        Path("tests/shapes/01_rectangle_pocket.dxf"),
+        Path("tests/shapes/missing.stl"),
+    ]
+    results = asyncio.run(run_many(paths, threads=2, max_in_flight=1))
+    assert set(results) == set(paths)
+    assert isinstance(results[paths[2]], NotImplementedError)
+    # Keys are assigned in start order
+    spot = results[paths[0]]
+    assert len(spot[(0,)].jumble.full_loops) == 7
+    assert all(k[0] == 0 for k in spot)
+    rect = results[paths[1]]
+    assert len(rect[(1,)].jumble.full_loops) == 2
+
+
+def test_load_many_timings(tmp_path):
+    paths = [
+        Path("tests/shapes/11_5spot.dxf"),
+        Path("tests/shapes/01_rectangle_pocket.dxf"),
+    ]
+    timings = tmp_path / "timings.json"
+    asyncio.run(run_many(paths, threads=2, timings_path=timings))
+    data = json.loads(timings.read_text())
+    assert {"0", "1"} <= set(data["keys"])
+
+
+def test_replan(tmp_path):
+    m = Main(2)
+    m.load(Path("tests/shapes/11_5spot.dxf"))
+    first = m.tree_future((0,)).result(timeout=10)
+
+    # Unchanged file
+    key = m.replan(Path("tests/shapes/11_5spot.dxf"), (0,))
+    second = m.tree_future(key).result(timeout=10)
+    assert len(m.results[(1, 0)].reused) == 8
+    assert sorted(k[1:] for k in second) == sorted(k[1:] for k in first)
+    assert second[(1, 0, 0)].dags is first[(0, 0, 0)].dags
+
+    # Move one spot (an island of the pocket) by 1mm
+    doc = ezdxf.readfile("tests/shapes/11_5spot.dxf")
+    for line in doc.modelspace().query("LINE"):
+        if line.dxf.start.x > 5 and line.dxf.start.y > 5 and line.dxf.start.x < 20:
+            line.translate(1, 0, 0)
+    doc.saveas(tmp_path / "moved.dxf")
+
+    key = m.replan(tmp_path / "moved.dxf", (0,))
+    third = m.tree_future(key).result(timeout=10)
+    m.wait()
+    shapes = m.results[(2, 0)]
+    # The pocket and that spot's profile are redone
+    assert len(shapes.reused) == 6
+    assert (2, 0, 0) not in shapes.reused
+    assert third[(2, 0, 0)].dags is not first[(0, 0, 0)].dags
+
+
+def test_replan_processes(monkeypatch):
+    monkeypatch.setattr(trace, "LEVEL", trace.STAGE)
+    monkeypatch.setattr(trace, "_counts", trace.Counter())
+    m = Main(2, processes=True)
+    m.load(Path("tests/shapes/11_5spot.dxf"))
+    first = m.tree_future((0,)).result(timeout=30)
+    assert trace.take_counts()["DagEdge"] > 0
+
+    key = m.replan(Path("tests/shapes/11_5spot.dxf"), (0,))
+    second = m.tree_future(key).result(timeout=30)
+    m.wait()
+    assert len(m.results[(1, 0)].reused) == 8
+    assert sorted(k[1:] for k in second) == sorted(k[1:] for k in first)
+    assert second[(1, 0, 0)].fingerprint() == first[(0, 0, 0)].fingerprint()
+    # Nothing was planned again
+    assert "DagEdge" not in trace.take_counts()
+
+
+def _square(msp, x, y, size, layer):
+    pts = [(x, y), (x + size, y), (x + size, y + size), (x, y + size)]
+    for a, b in zip(pts, pts[1:] + pts[:1]):
+        msp.add_line(a, b, dxfattribs={"layer": layer})
+
+
+def test_load_job(tmp_path):
+    doc = ezdxf.new()
+    _square(doc.modelspace(), -100, -100, 300, "STOCK")
+    doc.saveas(tmp_path / "stock.dxf")
+
+    doc = ezdxf.new()
+    _square(doc.modelspace(), 150, 0, 20, "A")
+    _square(doc.modelspace(), 150, 50, 20, "B")
+    doc.saveas(tmp_path / "layers.dxf")
+
+    m = Main(4)
+    key = m.load_job(
+        [
+            JobSource(tmp_path / "stock.dxf", stock=True),
+            JobSource(Path("tests/shapes/01_rectangle_pocket.dxf")),
+            JobSource(tmp_path / "layers.dxf", layers=frozenset({"A"})),
+        ]
+    )
+    tree = m.tree_future(key).result(timeout=10)
+    m.wait()
+    assert not m.errors
+
+    # Sources are (0, i), the merge is (0, 3) and shapes continue under it
+    assert len(tree[(0, 2)].jumble.full_loops) == 1
+    merge = tree[(0, 3)]
+    assert merge.job.outer.bounds() == (-100_000, 200_000, -100_000, 200_000)
+    assert len(merge.jumble.full_loops) == 3
+    assert len(merge.job.inner) == 2
+    assert sorted(len(p.holes) for p in merge.job.inner) == [0, 1]
+    assert isinstance(tree[(0, 3, 0)], ProcessShapes)
+    assert any(isinstance(s, PocketStep) for s in tree.values())
+
+
+def test_load_job_failed_source(tmp_path):
+    m = Main(2)
+    key = m.load_job(
+        [
+            JobSource(Path("tests/shapes/01_rectangle_pocket.dxf")),
+            JobSource(tmp_path / "missing.dxf"),
+        ]
+    )
+    with pytest.raises(StepError) as e:
+        m.tree_future(key).result(timeout=10)
+    m.wait()
+    # The merge fails too, rather than with an AttributeError
+    assert e.value.args == ((0, 1), (0, 2))
+    assert (0, 2, 0) not in m.results
+
+
+def test_load_job_empty(tmp_path):
+    ezdxf.new().saveas(tmp_path / "empty.dxf")
+    m = Main(2)
+    key = m.load_job([JobSource(tmp_path / "empty.dxf")])
+    tree = m.tree_future(key).result(timeout=10)
+    m.wait()
+    assert not m.errors
+    assert tree[(0, 1)].job is None
+    assert (0, 1, 0) not in tree
+
+
+def test_pocket_offsets():
+    m = Main(2)
+    j = LoadDxf(
+        path=Path("tests/shapes/01_rectangle_pocket.dxf"), key=(0,), status=m
+    )._load()
+    shapes = ProcessShapes(j, pocket_offsets=(500, 0), key=(0,), status=m)
+    m.submit(shapes.lifecycle)
+    tree = m.tree_future((0,)).result(timeout=10)
+    m.wait()
+    (pocket,) = [s for s in tree.values() if isinstance(s, PocketStep)]
+    # One diagram, trimmed for roughing then finishing
+    assert len(pocket.vors) == 1
+    assert len(pocket.dags) == 2
+    rough, finish = pocket.dags
+    assert finish.start_rad - rough.start_rad == 500
+    assert len([s for s in tree.values() if isinstance(s, SpiralStep)]) == 2
+
+
+def test_load_pocket_offsets():
+    m = Main(2)
+    key = m.start(Path("tests/shapes/01_rectangle_pocket.dxf"), pocket_offsets=(500, 0))
+    tree = m.tree_future(key).result(timeout=10)
+    m.wait()
+    (pocket,) = [s for s in tree.values() if isinstance(s, PocketStep)]
+    assert pocket.offsets == (500, 0)
+    assert len(pocket.dags) == 2
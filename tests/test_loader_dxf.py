@@ -0,0 +1,153 @@
+from pathlib import Path
+
+import ezdxf
+import numpy as np
+import pytest
+
+from timcam.tc0.loader.dxf import CHORD_TOLERANCE, LoadDxf
+from timcam.types import Point
+
+
+class NoStatus:
+    cache = None
+
+
+@pytest.mark.parametrize(
+    "name", ["01_rectangle_pocket", "06_double_spiral", "11_5spot", "13_dice"]
+)
+def test_streaming_matches(name):
+    path = Path("tests/shapes/%s.dxf" % name)
+    loaded = LoadDxf(path=path, streaming=False, key=(0,), status=NoStatus())._load()
+    streamed = LoadDxf(path=path, streaming=True, key=(0,), status=NoStatus())._load()
+    assert len(streamed.full_loops) == len(loaded.full_loops)
+    for a, b in zip(loaded.full_loops, streamed.full_loops):
+        assert a.coords.tolist() == b.coords.tolist()
+
+
+def _curves(path):
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_circle((0, 0), 10)
+    msp.add_circle((50, 0), 1)
+    # Rounded rectangle from arcs and lines
+    msp.add_line((100, 0), (120, 0))
+    msp.add_arc((120, 5), 5, -90, 0)
+    msp.add_line((125, 5), (125, 15))
+    msp.add_arc((120, 15), 5, 0, 90)
+    msp.add_line((120, 20), (100, 20))
+    msp.add_arc((100, 10), 10, 90, 270)
+    # Closed polyline with one half-circle side
+    msp.add_lwpolyline(
+        [(0, 50, 0), (20, 50, 1), (20, 60, 0), (0, 60, 0)], format="xyb", close=True
+    )
+    msp.add_spline(fit_points=[(50, 50), (60, 60), (70, 50), (60, 40), (50, 50)])
+    doc.saveas(path)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_curves(tmp_path, streaming):
+    _curves(tmp_path / "curves.dxf")
+    j = LoadDxf(
+        path=tmp_path / "curves.dxf",
+        streaming=streaming,
+        native_arcs=False,
+        key=(0,),
+        status=NoStatus(),
+    )._load()
+    assert len(j.full_loops) == 5
+    assert not j.partial_loops
+    big, small, rounded, poly, spline = j.full_loops
+
+    # Within tolerance (plus rounding) of the real circle
+    r = np.hypot(big.coords[:, 0], big.coords[:, 1])
+    assert r.max() <= 10_001
+    assert r.min() >= 10_000 - CHORD_TOLERANCE - 1
+    # Point count goes with curvature, not size
+    assert len(small) < len(big) < 4 * len(small)
+
+    assert rounded.bounds() == (90_000, 125_000, 0, 20_000)
+    x1, x2, y1, y2 = poly.bounds()
+    assert (x1, y1, y2) == (0, 50_000, 60_000)
+    assert 25_000 - CHORD_TOLERANCE <= x2 <= 25_000
+    assert len(spline) > 10
+
+
+def test_chord_tolerance(tmp_path):
+    _curves(tmp_path / "curves.dxf")
+    coarse = LoadDxf(
+        path=tmp_path / "curves.dxf",
+        chord_tolerance=100,
+        native_arcs=False,
+        key=(0,),
+        status=NoStatus(),
+    )._load()
+    fine = LoadDxf(
+        path=tmp_path / "curves.dxf", native_arcs=False, key=(0,), status=NoStatus()
+    )._load()
+    assert len(coarse.full_loops[0]) < len(fine.full_loops[0])
+
+
+def test_native_arcs(tmp_path):
+    _curves(tmp_path / "curves.dxf")
+    j = LoadDxf(path=tmp_path / "curves.dxf", key=(0,), status=NoStatus())._load()
+    assert len(j.full_loops) == 5
+    big, small, rounded, poly, spline = j.full_loops
+
+    # Circles are two half circles
+    assert len(big) == 2
+    assert np.allclose(np.abs(big.bulges), 1)
+    flat = big.flattened()
+    r = np.hypot(flat.coords[:, 0], flat.coords[:, 1])
+    assert r.max() <= 10_001
+    assert r.min() >= 10_000 - CHORD_TOLERANCE - 1
+    assert Point(0, 0) in big
+    assert Point(0, 10_100) not in big
+
+    assert len(rounded) == 6
+    assert np.count_nonzero(rounded.bulges) == 3
+    x1, x2, y1, y2 = rounded.bounds()
+    assert (x2, y1, y2) == (125_000, 0, 20_000)
+    assert 90_000 <= x1 <= 90_000 + CHORD_TOLERANCE
+
+    assert len(poly) == 4
+    assert spline.bulges is None
+
+
+def test_native_arcs_chord_tolerance(tmp_path):
+    _curves(tmp_path / "curves.dxf")
+    coarse = LoadDxf(
+        path=tmp_path / "curves.dxf", chord_tolerance=100, key=(0,), status=NoStatus()
+    )._load()
+    lines = LoadDxf(
+        path=tmp_path / "curves.dxf",
+        chord_tolerance=100,
+        native_arcs=False,
+        key=(0,),
+        status=NoStatus(),
+    )._load()
+    big = coarse.full_loops[0]
+    assert big.tolerance == 100
+    # About the same as loading it as lines (each half circle rounds up)
+    assert len(big.flattened()) <= len(lines.full_loops[0]) + 2
+    fine = LoadDxf(path=tmp_path / "curves.dxf", key=(0,), status=NoStatus())._load()
+    assert len(fine.full_loops[0].flattened()) > len(big.flattened())
+    assert fine.full_loops[0].fingerprint() != big.fingerprint()
+
+
+def test_join_tolerance(tmp_path):
+    # A square whose lines miss each other's ends by a couple of microns
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    corners = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    for (x1, y1), (x2, y2) in zip(corners, corners[1:] + corners[:1]):
+        msp.add_line((x1 + 0.002, y1), (x2, y2 + 0.001))
+    doc.saveas(tmp_path / "gaps.dxf")
+
+    exact = LoadDxf(path=tmp_path / "gaps.dxf", key=(0,), status=NoStatus())._load()
+    assert not exact.full_loops
+    j = LoadDxf(
+        path=tmp_path / "gaps.dxf", join_tolerance=5, key=(0,), status=NoStatus()
+    )._load()
+    assert not j.partial_loops
+    (loop,) = j.full_loops
+    assert len(loop) == 4
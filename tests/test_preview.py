@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+import pytest
+
+from timcam.base_steps import Step
+from timcam.cairo_pil import to_numpy
+from timcam.draw import decimate
+from timcam.preview import ENCODERS, Composite, PreviewQueue, fit_matrix
+
+
+def test_coalesce_and_drop():
+    gate = threading.Event()
+    started = threading.Event()
+    drawn = []
+
+    def render(key, step, matrix):
+        started.set()
+        assert gate.wait(5)
+        drawn.append((key, step))
+
+    q = PreviewQueue(render, max_pending=2)
+    assert q.put((0,), "a", None)
+    # Wait for the renderer to be stuck on (0,)
+    assert started.wait(5)
+    assert q.put((1,), "b", None)
+    assert q.put((1,), "c", None)  # replaces "b"
+    assert q.put((2,), "d", None)
+    assert not q.put((3,), "e", None)
+    assert q.dropped == 1
+
+    gate.set()
+    assert q.flush(5)
+    assert drawn == [((0,), "a"), ((1,), "c"), ((2,), "d")]
+    q.close()
+    assert not q.put((4,), "f", None)
+
+
+def test_errors_dont_stop_it():
+    drawn = []
+
+    def render(key, step, matrix):
+        if step is None:
+            raise ValueError()
+        drawn.append(key)
+
+    q = PreviewQueue(render)
+    q.put((0,), None, None)
+    q.put((1,), "x", None)
+    q.close()
+    assert drawn == [(1,)]
+    assert q.rendered == 2
+
+
+def test_decimate():
+    # A dense run inside one 10-unit pixel, then a jump
+    coords = [(0, 0), (1, 1), (2, 3), (9, 9), (15, 0), (16, 0), (40, 0)]
+    assert decimate(coords, 10).tolist() == [0, 4, 6]
+    assert decimate(coords, 0.5).tolist() == list(range(7))
+    assert decimate(np.zeros((2, 2)), 10).tolist() == [0, 1]
+
+
+class Drawn(Step):
+    def __init__(self, log, bounds=None, **kwargs):
+        self.log = log
+        self.bounds = bounds
+        super().__init__(**kwargs)
+
+    def preview(self, ctx):
+        self.log.append(self._key)
+        ctx.rectangle(0, 0, 1000, 1000)
+        ctx.fill()
+
+    def preview_bounds(self):
+        return self.bounds
+
+
+def test_composite(tmp_path):
+    log = []
+    c = Composite(tmp_path, (64, 48), crops=True, crop_size=(32, 32))
+    matrix = fit_matrix((0, 10000, 0, 10000), (64, 48))
+
+    def step(key, bounds=None):
+        return Drawn(log, bounds, key=key, status=None)
+
+    # The stadium under a pocket finishes before the pocket does
+    c((0, 0, 1, 0), step((0, 0, 1, 0)), matrix)
+    assert log == [(0, 0, 1, 0)]
+    c((0,), step((0,)), matrix)
+    c((0, 0), step((0, 0)), matrix)
+    c((0, 0, 1), step((0, 0, 1), (0, 1000, 0, 1000)), matrix)
+    c.write()
+    # Everything goes on the overview; the stadium also goes in the pocket's
+    # crop, once it knows about the pocket
+    assert log == [(0, 0, 1, 0), (0,), (0, 0), (0, 0, 1), (0, 0, 1), (0, 0, 1, 0)]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.0.1.png", "0.png"]
+
+
+def test_composite_dropped(tmp_path):
+    log = []
+    c = Composite(tmp_path, (64, 48), crops=True, crop_size=(32, 32))
+    matrix = fit_matrix((0, 10000, 0, 10000), (64, 48))
+
+    def step(key, bounds=None):
+        return Drawn(log, bounds, key=key, status=None)
+
+    c((0,), step((0,)), matrix)
+    c((0, 0), step((0, 0)), matrix)
+    c((0, 0, 1, 0), step((0, 0, 1, 0)), matrix)
+    # The pocket was dropped, so the stadium only goes on the overview
+    c.dropped((0, 0, 1))
+    assert not c._waiting
+    c((0, 0, 1, 1), step((0, 0, 1, 1)), matrix)
+    assert log == [(0,), (0, 0), (0, 0, 1, 0), (0, 0, 1, 1)]
+
+    # One whose ancestor never arrives isn't kept past `close`
+    c((1, 0), step((1, 0)), matrix)
+    assert c._waiting
+    c.close()
+    assert not c._waiting
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.png", "1.png"]
+
+
+def test_on_drop():
+    gate = threading.Event()
+    started = threading.Event()
+    dropped = []
+
+    def render(key, step, matrix):
+        started.set()
+        assert gate.wait(5)
+
+    q = PreviewQueue(render, max_pending=1, on_drop=dropped.append)
+    q.put((0,), "a", None)
+    assert started.wait(5)
+    q.put((1,), "b", None)
+    assert not q.put((2,), "c", None)
+    gate.set()
+    assert q.flush(5)
+    assert dropped == [(2,)]
+    q.close()
+
+
+class Pixel(Step):
+    def preview(self, ctx):
+        surface = ctx.get_target()
+        to_numpy(surface)[0, self._key[-1]] = (255, 255, 255, 255)
+        surface.mark_dirty()
+
+
+@pytest.mark.parametrize("encoder", sorted(ENCODERS))
+def test_encoders(tmp_path, encoder):
+    c = Composite(tmp_path, (8, 4), crops=True, max_surfaces=1, encoder=encoder)
+    matrix = fit_matrix((0, 8, 0, 4), (8, 4))
+    c((0,), Pixel(key=(0,), status=None), matrix)
+    c.write()
+    # Another file pushes the first out of memory...
+    c((1,), Pixel(key=(1,), status=None), matrix)
+    # ...so this has to load it back
+    c((0, 2), Pixel(key=(0, 2), status=None), matrix)
+    c.write()
+
+    ext, save, load = ENCODERS[encoder]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0" + ext, "1" + ext]
+    pixels = to_numpy(load(str(tmp_path / ("0" + ext))))
+    assert pixels[0, :, 3].tolist() == [255, 0, 255, 0, 0, 0, 0, 0]
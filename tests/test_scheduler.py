@@ -0,0 +1,73 @@
+import threading
+
+from timcam.base_steps import Status, Step
+from timcam.scheduler import Scheduler, critical_paths
+
+
+def test_priority_order():
+    s = Scheduler(1)
+    gate = threading.Event()
+    order = []
+    s.submit(gate.wait)
+    futures = [
+        s.submit(lambda i=i: order.append(i), priority=p)
+        for i, p in enumerate([5, 1, 3, 1])
+    ]
+    gate.set()
+    for f in futures:
+        f.result()
+    s.shutdown()
+    # ties are FIFO
+    assert order == [1, 3, 2, 0]
+
+
+def test_exception():
+    s = Scheduler(1)
+    f = s.submit(lambda: 1 / 0)
+    assert isinstance(f.exception(), ZeroDivisionError)
+    s.shutdown()
+
+
+def test_critical_paths():
+    durations = {
+        (0,): 1.0,
+        (0, 0): 2.0,
+        (0, 0, 0): 5.0,
+        (0, 0, 1): 1.0,
+        (0, 0, 1, 0): 1.0,
+    }
+    assert critical_paths(durations) == {
+        (0,): 8.0,
+        (0, 0): 7.0,
+        (0, 0, 0): 5.0,
+        (0, 0, 1): 2.0,
+        (0, 0, 1, 0): 1.0,
+    }
+
+
+class Cheap(Step):
+    cost = 0.1
+
+
+class Expensive(Step):
+    cost = 10.0
+
+
+def test_status_priority(tmp_path):
+    s = Status(1)
+    cheap = Cheap(key=(0, 0), status=s)
+    expensive = Expensive(key=(0, 1), status=s)
+    assert s.priority(expensive) < s.priority(cheap)
+
+    s.durations = {(0, 0): 3.0, (0, 1): 1.0}
+    s._classes = {(0, 0): "Cheap", (0, 1): "Expensive"}
+    s.save_timings(tmp_path / "timings.json")
+    s.executor.shutdown()
+
+    s = Status(1, timings_path=tmp_path / "timings.json")
+    # From history, by key
+    assert s.priority(cheap) == -3.0
+    assert s.priority(expensive) == -1.0
+    # From history, by class
+    assert s.priority(Cheap(key=(1, 0), status=s)) == -3.0
+    s.executor.shutdown()
@@ -0,0 +1,65 @@
+import io
+import json
+from pathlib import Path
+
+from timcam import trace
+from timcam.api import Main
+
+
+def test_levels(monkeypatch):
+    monkeypatch.setattr(trace, "LEVEL", trace.STAGE)
+
+    def f():
+        return 1
+
+    # Below the level it's the very same function, with no wrapper
+    assert trace.ktrace(level=trace.DETAILED)(f) is f
+    assert trace.ktrace()(f) is not f
+    assert trace.ktrace()(f)() == 1
+
+    with trace.kev("x", level=trace.DETAILED) as v:
+        assert v is None
+
+    trace.set_level(trace.OFF)
+    assert trace.ktrace()(f) is f
+
+
+def test_counts(monkeypatch):
+    monkeypatch.setattr(trace, "LEVEL", trace.STAGE)
+    monkeypatch.setattr(trace, "_counts", trace.Counter())
+    buf = io.StringIO()
+    buf.close = lambda: None
+    with trace.output(buf):
+        for _ in range(1000):
+            trace.count("a")
+        trace.count("b", 5)
+        with trace.kev("span"):
+            pass
+
+    events = json.loads(buf.getvalue())
+    counters = [e for e in events if e.get("ph") == "C"]
+    assert [(e["name"], e["args"]["value"]) for e in counters] == [
+        ("a", 1000),
+        ("b", 5),
+    ]
+    assert "span" in [e["name"] for e in events if e.get("ph") == "X"]
+
+
+def test_take_counts(monkeypatch):
+    monkeypatch.setattr(trace, "LEVEL", trace.STAGE)
+    monkeypatch.setattr(trace, "_counts", trace.Counter())
+    trace.count("a", 2)
+    assert trace.take_counts() == {"a": 2}
+    assert trace.take_counts() == {}
+
+
+def test_worker_counts(monkeypatch):
+    monkeypatch.setattr(trace, "LEVEL", trace.STAGE)
+    monkeypatch.setattr(trace, "_counts", trace.Counter())
+    m = Main(2, processes=True)
+    m.load(Path("tests/shapes/11_5spot.dxf"))
+    m.wait()
+    counts = trace.take_counts()
+    # Dag.simplify only runs in the workers
+    assert counts["DagEdge"] > 0
+    assert counts["steps"] == len(m.results)
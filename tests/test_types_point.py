@@ -29,3 +29,17 @@ def test_perpendicular():
         .perpendicular(True)
         == pt
     )
+
+
+def test_arithmetic_with_tuples():
+    assert Point(1, 2) + (3, 4) == Point(4, 6)
+    assert Point(1, 2) - (3, 4) == Point(-2, -2)
+
+
+def test_integer_equality():
+    # Integer points are equal exactly when they hash the same
+    a = Point(10**12, -(10**12))
+    assert a == Point(10**12, -(10**12))
+    assert a != Point(10**12 + 1, -(10**12))
+    assert {a: 1}[Point(10**12, -(10**12))] == 1
+    assert Point(3, 4) == Point(3.0, 4.0)
@@ -1,4 +1,7 @@
-from timcam.types.poly import Loop, Jumble
+import numpy as np
+
+from timcam.types import poly as poly_module
+from timcam.types.poly import Loop, Jumble, Poly
 from timcam.types.point import Point
 
 
@@ -25,3 +28,198 @@ def test_jumble():
     j.add_line(Point(10, 0), Point(5, 5))
     j.close_loops()
     assert len(j.full_loops) == 1
+
+
+def test_jumble_reversed_interleaved():
+    j = Jumble()
+    # Two squares, segments in mixed direction and interleaved
+    j.add_line(Point(0, 0), Point(10, 0))
+    j.add_line(Point(20, 0), Point(30, 0))
+    j.add_line(Point(10, 10), Point(10, 0))
+    j.add_line(Point(0, 10), Point(0, 0))
+    j.add_line(Point(30, 10), Point(20, 10))
+    j.add_line(Point(30, 0), Point(30, 10))
+    j.add_line(Point(20, 0), Point(20, 10))
+    j.add_line(Point(10, 10), Point(0, 10))
+    j.close_loops()
+    assert len(j.full_loops) == 2
+    assert not j.partial_loops
+    assert sorted(j.full_loops[0].points) == [
+        Point(0, 0),
+        Point(0, 10),
+        Point(10, 0),
+        Point(10, 10),
+    ]
+    assert len(j.full_loops[1].points) == 4
+
+
+def test_jumble_tolerance():
+    j = Jumble(tolerance=2)
+    j.add_line(Point(0, 0), Point(10, 0))
+    j.add_line(Point(11, 1), Point(5, 5))
+    j.add_line(Point(5, 5), Point(1, -1))
+    j.close_loops()
+    assert len(j.full_loops) == 1
+    # Snapped to the ends that were there first
+    assert list(j.full_loops[0].points) == [Point(0, 0), Point(10, 0), Point(5, 5)]
+
+    j = Jumble()
+    j.add_line(Point(0, 0), Point(10, 0))
+    j.add_line(Point(11, 1), Point(5, 5))
+    j.add_line(Point(5, 5), Point(1, -1))
+    j.close_loops()
+    assert not j.full_loops
+    assert len(j.partial_loops) == 2
+
+
+def test_parent_info_grid():
+    def square(x, y, w):
+        return [Point(x, y), Point(x + w, y), Point(x + w, y + w), Point(x, y + w)]
+
+    j = Jumble()
+    j.full_loops.append(Loop(square(0, 0, 100)))
+    j.full_loops.append(Loop(square(10, 10, 80)))
+    for i in range(4):
+        j.full_loops.append(Loop(square(20 + 15 * i, 20, 10)))
+    # Overlapping bounding box, but not inside
+    j.full_loops.append(Loop([Point(-10, -10), Point(50, 5), Point(-10, 20)]))
+
+    assert j.parent_info() == {
+        0: set(),
+        1: {0},
+        2: {0, 1},
+        3: {0, 1},
+        4: {0, 1},
+        5: {0, 1},
+        6: set(),
+    }
+
+
+def test_winding_of_many():
+    p = Loop([Point(0, 0), Point(10, 0), Point(10, 10), Point(5, 3), Point(0, 10)])
+    pts = [Point(x, y) for x in range(-1, 12) for y in range(-1, 12)]
+    expected = [p.winding_of(pt) for pt in pts]
+    assert list(p.winding_of_many(pts)) == expected
+    assert list(Loop(p.points[::-1]).winding_of_many(pts)) == [-i for i in expected]
+
+
+def test_winding_of_many_batches(monkeypatch):
+    # A star that crosses itself, with points on and between its vertices
+    rng = np.random.default_rng(0)
+    star = Loop([Point(50 + (i * 37) % 100, 50 + (i * 61) % 100) for i in range(23)])
+    pts = np.concatenate(
+        [rng.integers(0, 160, (300, 2)), star.coords, rng.random((100, 2)) * 160]
+    )
+    expected = [star.winding_of(Point(*pt)) for pt in pts.tolist()]
+    monkeypatch.setattr(poly_module, "BATCH_ELEMENTS", 50)
+    assert list(star.winding_of_many(pts)) == expected
+
+
+def test_contains_many():
+    outline = Loop([Point(0, 0), Point(10, 0), Point(10, 10), Point(0, 10)])
+    hole = Loop([Point(2, 2), Point(4, 2), Point(4, 4), Point(2, 4)])
+    poly = Poly(outline, [hole])
+    pts = [Point(1, 1), Point(3, 3), Point(5, 5), Point(11, 5)]
+    assert list(poly.contains_many(pts)) == [True, False, True, False]
+    assert list(poly.contains_many(pts)) == [pt in poly for pt in pts]
+    assert len(poly.contains_many([])) == 0
+
+
+def test_loop_storage():
+    coords = np.array([[0, 0], [10, 0], [10, 10]], dtype=np.int64)
+    p = Loop(coords)
+    assert p.coords is coords
+    assert len(p) == 3
+    assert p.points[1] == Point(10, 0)
+    assert p.points[-1] == Point(10, 10)
+    assert list(p.points) == [Point(0, 0), Point(10, 0), Point(10, 10)]
+    assert p.bounds() == (0, 10, 0, 10)
+    assert p.segments() == [[[0, 0], [10, 0]], [[10, 0], [10, 10]], [[10, 10], [0, 0]]]
+
+    # From pyclipper-style lists, and floats get rounded
+    assert Loop([[0, 0], [10, 0], [10, 10]]).coords.tolist() == coords.tolist()
+    assert (
+        Loop([Point(0.0, 0.0), Point(9.9999, 0.0), Point(10.0, 10.0)]).coords.tolist()
+        == coords.tolist()
+    )
+
+
+def _directed(loop):
+    c = [tuple(p) for p in loop.coords.tolist()]
+    b = loop.bulges.tolist()
+    forward = {(p1, p2, bulge) for p1, p2, bulge in zip(c, c[1:] + c[:1], b)}
+    backward = {(p2, p1, -bulge) for p1, p2, bulge in forward}
+    return forward, backward
+
+
+def test_jumble_arcs():
+    # Rounded square, as (start, end, bulge) in order around it
+    segments = [
+        ((10, 0), (90, 0), 0.0),
+        ((90, 0), (100, 10), 0.4),
+        ((100, 10), (100, 90), 0.0),
+        ((90, 100), (10, 100), 0.0),
+        ((100, 90), (90, 100), 0.4),
+        ((0, 90), (0, 10), 0.0),
+        ((10, 100), (0, 90), 0.4),
+        ((0, 10), (10, 0), 0.4),
+    ]
+    expected = {(a, b, bulge) for a, b, bulge in segments}
+
+    for order in ([0, 1, 2, 3, 4, 5, 6, 7], [7, 2, 5, 0, 3, 6, 1, 4]):
+        for flip in (False, True):
+            j = Jumble()
+            for i in order:
+                a, b, bulge = segments[i]
+                if flip and i % 2:
+                    j.add_arc(Point(*b), Point(*a), -bulge)
+                else:
+                    j.add_arc(Point(*a), Point(*b), bulge)
+            j.close_loops()
+            assert len(j.full_loops) == 1
+            assert expected in _directed(j.full_loops[0])
+
+
+def test_loop_arcs():
+    # Circle of radius 1000 as two half circles
+    loop = Loop([(1000, 0), (-1000, 0)], [1.0, 1.0])
+    assert len(loop) == 2
+    assert loop.bounds() == (-1000, 1000, -1000, 1000)
+    assert loop.direction() > 0
+    assert Point(0, 999) in loop
+    assert Point(0, 1001) not in loop
+    assert len(loop.flattened(1)) > len(loop.flattened(100))
+    # All-straight loops don't keep bulges
+    assert Loop([(0, 0), (1, 0), (0, 1)], [0, 0, 0]).bulges is None
+    assert loop.fingerprint() != Loop([(1000, 0), (-1000, 0)]).fingerprint()
+
+
+def test_fixup():
+    j = Jumble()
+    # Square with a collinear run, a duplicate-ish vertex and sub-micron noise
+    pts = [(0, 0), (250, 0), (500, 1), (750, 0), (1000, 0), (1000, 1000)]
+    pts += [(1000, 1000), (0, 1000)]
+    for a, b in zip(pts, pts[1:] + pts[:1]):
+        j.add_line(Point(*a), Point(*b))
+    # Rounded corner arcs are kept
+    j.add_arc(Point(2000, 0), Point(2000, 1000), 1.0)
+    j.add_line(Point(2000, 1000), Point(1900, 1000))
+    j.add_line(Point(1900, 1000), Point(1800, 1000))
+    j.add_arc(Point(1800, 1000), Point(1800, 0), 1.0)
+    j.add_line(Point(1800, 0), Point(2000, 0))
+    j.close_loops()
+
+    stats = j.fixup(1)
+    assert sorted(map(tuple, j.full_loops[0].coords.tolist())) == [
+        (0, 0),
+        (0, 1000),
+        (1000, 0),
+        (1000, 1000),
+    ]
+    assert len(j.full_loops[1]) == 4
+    assert np.count_nonzero(j.full_loops[1].bulges) == 2
+    assert stats.loops == 2
+    assert stats.vertices_before == 12
+    assert stats.vertices_after == 8
+    assert stats.removed == 4
+    assert j.fixup_stats is stats
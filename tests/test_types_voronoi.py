@@ -1,4 +1,10 @@
+from math import hypot
+import pickle
+
+import pytest
+
 from timcam.types import Voronoi, Loop, Poly, Point
+from timcam.types.voronoi import INSIDE, Dag, DagEdge
 
 
 def test_smoke():
@@ -67,3 +73,172 @@ def test_smoke_mountain():
     assert dag.next[2].end_rad == 2.7567446261403217
 
     assert len(dag.next[2].next) == 1
+
+
+def test_offset_trim():
+    loop = Loop(
+        points=[
+            Point(0, 0),
+            Point(100, 0),
+            Point(100, 50),
+            Point(0, 50),
+        ]
+    )
+    v = Voronoi(Poly(loop, []))
+    full = v.dag(1)
+    trimmed = v.dag(1, offset=10)
+    assert full.start_rad == 25
+    assert trimmed.start_rad == 15
+    assert trimmed.start_pt == full.start_pt
+    for _, edge in trimmed.visit_preorder():
+        if edge is not trimmed:
+            assert edge.end_rad >= 0
+            # The medial axis of the shrunk rectangle stays 10 from the sides
+            assert 10 <= edge.end_pt.x <= 90
+            assert 10 <= edge.end_pt.y <= 40
+
+    # The same diagram can still be used at offset zero
+    assert v.dag(1).start_rad == 25
+
+
+def _boundary_distance(loop, pt):
+    best = float("inf")
+    for (x1, y1), (x2, y2) in loop.segments():
+        vx, vy = x2 - x1, y2 - y1
+        t = ((pt.x - x1) * vx + (pt.y - y1) * vy) / (vx * vx + vy * vy)
+        t = min(max(t, 0), 1)
+        best = min(best, hypot(pt.x - x1 - vx * t, pt.y - y1 - vy * t))
+    return best
+
+
+def test_offset_trim_curved():
+    # Where the neck meets each square, the medial axis runs between a corner
+    # (a point site) and a side, so it's parabolic
+    loop = Loop(
+        points=[
+            Point(0, 0),
+            Point(100, 0),
+            Point(100, 45),
+            Point(150, 45),
+            Point(150, 0),
+            Point(250, 0),
+            Point(250, 100),
+            Point(150, 100),
+            Point(150, 55),
+            Point(100, 55),
+            Point(100, 100),
+            Point(0, 100),
+        ]
+    )
+    v = Voronoi(Poly(loop, []))
+    for offset in (8, 15, 20, 30):
+        for dag in v.dags(1, offset=offset):
+            for _, edge in dag.visit_preorder():
+                if edge is not dag and not edge.next:
+                    assert edge.end_rad == 0
+                    # Really `offset` from the outline, even on curved edges
+                    d = _boundary_distance(loop, edge.end_pt)
+                    assert d == pytest.approx(offset)
+
+
+def test_offset_splits():
+    # Two squares joined by a narrow neck, which disappears when shrunk
+    loop = Loop(
+        points=[
+            Point(0, 0),
+            Point(100, 0),
+            Point(100, 45),
+            Point(150, 45),
+            Point(150, 0),
+            Point(250, 0),
+            Point(250, 100),
+            Point(150, 100),
+            Point(150, 55),
+            Point(100, 55),
+            Point(100, 100),
+            Point(0, 100),
+        ]
+    )
+    v = Voronoi(Poly(loop, []))
+    assert len(v.dags(1)) == 1
+    dags = v.dags(1, offset=20)
+    assert len(dags) == 2
+    assert {d.start_rad for d in dags} == {30}
+    # Largest first, ties to the right
+    assert dags[0].start_pt.x > dags[1].start_pt.x
+
+
+def test_offset_pinch():
+    # The notch's tip is 30 from the bottom, so the medial axis under it dips
+    # to radius 15 while both ends of that edge are over 20
+    loop = Loop(
+        points=[
+            Point(0, 0),
+            Point(200, 0),
+            Point(200, 100),
+            Point(110, 100),
+            Point(100, 30),
+            Point(90, 100),
+            Point(0, 100),
+        ]
+    )
+    v = Voronoi(Poly(loop, []))
+    assert len(v.dags(1)) == 1
+    dags = v.dags(1, offset=20)
+    assert len(dags) == 2
+    for dag in dags:
+        for _, edge in dag.visit_preorder():
+            if edge is not dag:
+                assert edge.end_rad >= 0
+                assert _boundary_distance(loop, edge.end_pt) >= 20 - 1e-6
+
+
+def test_deep_chain():
+    # Far more edges in a row than the recursion limit, as in a long slot
+    n = 20000
+    dag = Dag(Point(0, 0))
+    parent = dag
+    for i in range(n):
+        edge = DagEdge(
+            i, INSIDE, i, i + 1, -1, (i * 10, i % 2), ((i + 1) * 10, (i + 1) % 2), 5, 5
+        )
+        parent.next.append(edge)
+        parent = edge
+    dag.start_rad = 5
+
+    assert sum(1 for _ in dag.visit_postorder()) == n + 1
+    dag.simplify(1)
+    assert dag.next[0].start_pt == Point(0, 0)
+    assert dag.next[0].path_length > n * 10
+
+
+def test_pickle_deep():
+    n = 5000
+    dag = Dag(Point(0, 0))
+    dag.start_rad = 5
+    parent = dag
+    for i in range(n):
+        edge = DagEdge(i, INSIDE, i, i + 1, -1, (i, 0), (i + 1, 0), 5, 5)
+        parent.next.append(edge)
+        parent = edge
+
+    copy = pickle.loads(pickle.dumps(dag))
+    assert copy.start_rad == 5
+    edges = [edge for _, edge in copy.visit_preorder()][1:]
+    assert len(edges) == n
+    assert edges[-1].end_pt == Point(n, 0)
+    assert edges[-1].next == []
+
+
+def test_compact_edges():
+    loop = Loop(points=[Point(0, 0), Point(10, 0), Point(10, 5), Point(0, 5)])
+    dag = Voronoi(Poly(loop, [])).dag(1)
+    for _, edge in dag.visit_preorder():
+        assert not hasattr(edge, "__dict__")
+
+    edge = DagEdge(0, INSIDE, 0, 1, -1, (0, 0), (10, 0), 5, 3)
+    assert edge._line is None
+    edge.trim(1, [[0, -5], [10, -3]], [[0, 5], [10, 3]])
+    assert edge.line.ptr[0].radius == 4
+    assert edge.line.ptr[-1].radius == 2
+    assert edge.vector == Point(10, 0)
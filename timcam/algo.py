@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from math import cos, sin, acos, atan2, pi as PI
+from math import ceil, cos, sin, acos, asin, atan, atan2, hypot, tan, pi as PI
 
 from .types.point import Point
 
@@ -132,3 +132,157 @@ def lines(it):
     """
     t = list(it)
     yield from zip(t, t[1:] + t[:1])
+
+
+def arc_segments(radius: float, sweep: float, tolerance: float) -> int:
+    """
+    Number of equal chords needed so that an arc of `radius` and `sweep`
+    (radians, either sign) strays no more than `tolerance` from them.
+
+    The count depends only on the curvature and tolerance, not on how big the
+    arc is, and a full circle always gets at least 3.
+    """
+    if radius <= 0 or sweep == 0:
+        return 1
+    # Each chord subtends at most this angle for a sagitta of `tolerance`
+    step = 2 * acos(max(1 - tolerance / radius, -1.0))
+    step = min(step, 2 * PI / 3)
+    return max(1, ceil(abs(sweep) / step - 1e-9))
+
+
+def arc_points(
+    center: tuple[float, float],
+    radius: float,
+    start_angle: float,
+    sweep: float,
+    tolerance: float,
+) -> list[tuple[float, float]]:
+    """
+    Points along an arc (angles in radians, positive `sweep` is
+    counterclockwise), including both ends, within `tolerance` of it.
+    """
+    cx, cy = center
+    n = arc_segments(radius, sweep, tolerance)
+    return [
+        (
+            cx + radius * cos(start_angle + sweep * i / n),
+            cy + radius * sin(start_angle + sweep * i / n),
+        )
+        for i in range(n + 1)
+    ]
+
+
+def bulge_arc(
+    p1: tuple[float, float], p2: tuple[float, float], bulge: float
+) -> tuple[tuple[float, float], float, float, float]:
+    """
+    Converts a DXF polyline "bulge" arc from `p1` to `p2` (bulge is
+    tan(sweep / 4); positive is counterclockwise) to (center, radius,
+    start_angle, sweep).  `bulge` must be nonzero and the points distinct.
+    """
+    (x1, y1), (x2, y2) = p1, p2
+    d = hypot(x2 - x1, y2 - y1)
+    sweep = 4 * atan(bulge)
+    # Center is this far to the left of the chord's midpoint (negative is to
+    # the right), which works out for sweeps either side of a half circle.
+    h = (d / 2) / tan(sweep / 2)
+    cx = (x1 + x2) / 2 - (y2 - y1) / d * h
+    cy = (y1 + y2) / 2 + (x2 - x1) / d * h
+    return (cx, cy), hypot(x1 - cx, y1 - cy), atan2(y1 - cy, x1 - cx), sweep
+
+
+def bulge_points(
+    p1: tuple[float, float], p2: tuple[float, float], bulge: float, tolerance: float
+) -> list[tuple[float, float]]:
+    """
+    Points along a bulge arc (see `bulge_arc`) from `p1` to `p2`, including
+    both ends, within `tolerance` of it.  Zero bulge is a straight line.
+
+    The ends are returned exactly as given so they still match up with
+    neighboring segments.
+    """
+    if bulge == 0 or p1 == p2:
+        return [p1, p2]
+    pts = arc_points(*bulge_arc(p1, p2, bulge), tolerance)
+    pts[0] = p1
+    pts[-1] = p2
+    return pts
+
+
+def dedupe_run(
+    points: list[tuple[int, int]], tolerance: float
+) -> tuple[list[tuple[int, int]], int]:
+    """
+    Drops points within `tolerance` of the previous kept point, always keeping
+    both ends.  Returns (points, number dropped).
+    """
+    if len(points) <= 2:
+        return list(points), 0
+    tol2 = tolerance * tolerance
+    out = [points[0]]
+    for x, y in points[1:-1]:
+        px, py = out[-1]
+        if (x - px) ** 2 + (y - py) ** 2 > tol2:
+            out.append((x, y))
+    # The last point wins over a near-duplicate before it
+    lx, ly = points[-1]
+    px, py = out[-1]
+    if len(out) > 1 and (lx - px) ** 2 + (ly - py) ** 2 <= tol2:
+        out.pop()
+    out.append(points[-1])
+    return out, len(points) - len(out)
+
+
+def sleeve_simplify(
+    points: list[tuple[int, int]], tolerance: float
+) -> list[tuple[int, int]]:
+    """
+    Simplifies an open polyline (keeping both ends) so that every dropped
+    point is within `tolerance` of the line through the segment that replaced
+    it.  Runs of collinear points always collapse.
+
+    This is the sector ("sleeve-fitting") algorithm of Zhao and Saalfeld, which
+    is linear time: each point is looked at no more than twice, unlike
+    Douglas-Peucker which is quadratic in the worst case.
+    """
+    n = len(points)
+    if n <= 2:
+        return list(points)
+    out = [points[0]]
+    ax, ay = points[0]
+    prev = points[0]
+    # Directions from the anchor that stay within tolerance of every point so
+    # far, relative to `ref` to avoid wrapping; None before the first point
+    # that's far enough from the anchor to constrain it.
+    lo = hi = ref = None
+    i = 1
+    while i < n:
+        x, y = points[i]
+        d = hypot(x - ax, y - ay)
+        if d <= tolerance:
+            prev = points[i]
+            i += 1
+            continue
+        a = atan2(y - ay, x - ax)
+        # The tiny extra is for exactly collinear points that don't quite get
+        # the same atan2
+        w = asin(min(1.0, tolerance / d)) + 1e-12
+        if lo is None:
+            ref = a
+            lo, hi = -w, w
+        else:
+            rel = (a - ref + PI) % (2 * PI) - PI
+            if not lo <= rel <= hi:
+                # Doesn't fit; the segment ends at the previous point, and this
+                # one gets looked at again from there.
+                out.append(prev)
+                ax, ay = prev
+                lo = hi = ref = None
+                continue
+            lo = max(lo, rel - w)
+            hi = min(hi, rel + w)
+        prev = points[i]
+        i += 1
+    if out[-1] != points[-1]:
+        out.append(points[-1])
+    return out
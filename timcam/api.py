@@ -1,36 +1,211 @@
 from __future__ import annotations
+import argparse
+import asyncio
 import os
-import sys
 import logging
+from typing import AsyncIterator, Iterable, Union
 
-import keke
 from vmodule import vmodule_init
 from pathlib import Path
 
-from .base_steps import Status
+from . import trace
+from .base_steps import Status, StepError
+from .cache import StepCache
 
+from .tc0.job import JobSource, LoadJob
 from .tc0.loader import load_file_cls
 
+logger = logging.getLogger(__name__)
+
 
 class Main(Status):
-    # TODO the intent is that we might have a config that tells us to load
-    # multiple files, like stock, pockets, outlines, and their respective
-    # "operations" along with polygons.  This could be called multiple times,
-    # incrementing the key.
-    def load(self, path: Path) -> None:
+    # TODO the intent is that we might have a config that tells us the
+    # respective "operations" for each file along with polygons; see `load_job`
+    # for the loading part.
+    def load(self, path: Path, pocket_offsets=None) -> None:
+        """
+        Load `path` and wait for its load step (not everything under it).
+
+        `pocket_offsets`, here and in the other loading methods, are amounts
+        of stock to leave for several passes over each pocket (see
+        `PocketStep`).
+        """
         key = (self.next_file_number,)
         self.next_file_number += 1
-        obj = load_file_cls(path)(path=path, key=key, status=self)
+        obj = load_file_cls(path)(
+            path=path, pocket_offsets=pocket_offsets, key=key, status=self
+        )
         n = self.submit(obj.lifecycle)
         n.result()
 
+    def replan(
+        self, path: Path, previous_key: tuple[int, ...], pocket_offsets=None
+    ) -> tuple[int, ...]:
+        """
+        Load `path` again (typically after an edit), reusing each profile or
+        pocket from the tree at `previous_key` whose loops (including islands)
+        are unchanged, and only running the steps for ones that changed.
+
+        Subtrees that had an error are never reused.  Returns the new key; the
+        previous tree is left in `results`.
+        """
+        n = len(previous_key)
+        failed = [e for e in self.errors if e[:n] == previous_key]
+        previous = {
+            k: v
+            for k, v in self.results.items()
+            if k[:n] == previous_key and not any(e[: len(k)] == k for e in failed)
+        }
+        key = (self.next_file_number,)
+        self.next_file_number += 1
+        obj = load_file_cls(path)(
+            path=path,
+            previous=previous,
+            pocket_offsets=pocket_offsets,
+            key=key,
+            status=self,
+        )
+        self.submit(obj.lifecycle).result()
+        return key
+
+    def load_job(
+        self, sources: list[JobSource], pocket_offsets=None
+    ) -> tuple[int, ...]:
+        """
+        Load several files or layers (for example stock, pockets and outlines)
+        concurrently as one `Job`, whose shapes are then processed together.
+        Doesn't wait; returns the key for the job's tree.
+        """
+        key = (self.next_file_number,)
+        self.next_file_number += 1
+        obj = LoadJob(sources, pocket_offsets=pocket_offsets, key=key, status=self)
+        self.submit(obj.lifecycle)
+        return key
+
+    def start(self, path: Path, pocket_offsets=None) -> tuple[int, ...]:
+        """
+        Like `load` but doesn't wait; returns the key for this file's tree.
+        """
+        key = (self.next_file_number,)
+        self.next_file_number += 1
+        obj = load_file_cls(path)(
+            path=path, pocket_offsets=pocket_offsets, key=key, status=self
+        )
+        self.submit(obj.lifecycle)
+        return key
+
+    async def load_many(
+        self,
+        paths: Iterable[Path],
+        max_in_flight: int = 4,
+        keep_results=False,
+        pocket_offsets=None,
+    ) -> AsyncIterator[tuple[Path, Union[dict, BaseException]]]:
+        """
+        Runs many files on this one set of workers, with at most
+        `max_in_flight` files started but not finished, and yields
+        `(path, {key: step})` for each file as its whole tree finishes (or
+        `(path, exception)` if something in it failed).
+
+        Unless `keep_results` is set, finished files are removed from
+        `self.results` so memory stays bounded for long batches.
+        """
+        sem = asyncio.Semaphore(max_in_flight)
+
+        async def one(path):
+            async with sem:
+                try:
+                    key = self.start(path, pocket_offsets)
+                    tree = await self.wait_async(key)
+                # Unsupported file types, or a step in the tree failed
+                except (NotImplementedError, StepError) as e:
+                    return path, e
+                if not keep_results:
+                    for k in tree:
+                        self.results.pop(k, None)
+                return path, tree
+
+        tasks = [asyncio.ensure_future(one(p)) for p in paths]
+        try:
+            for t in asyncio.as_completed(tasks):
+                yield await t
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+async def run_many(
+    paths: Iterable[Path],
+    threads: int = 8,
+    max_in_flight: int = 4,
+    pocket_offsets=None,
+    **kwargs,
+) -> dict[Path, Union[dict, BaseException]]:
+    """
+    Convenience wrapper around `Main.load_many` that returns all the results.
+    Like `Status.wait`, it writes timings at the end if `timings_path` is given.
+    """
+    m = Main(threads, **kwargs)
+    results = {}
+    try:
+        async for path, result in m.load_many(
+            paths, max_in_flight, pocket_offsets=pocket_offsets
+        ):
+            if isinstance(result, BaseException):
+                logger.error("%s: %r", path, result)
+            else:
+                logger.info("%s: %d steps", path, len(result))
+            results[path] = result
+    finally:
+        m.executor.shutdown()
+        if m.process_executor is not None:
+            m.process_executor.shutdown()
+        m.close_previews()
+        if m.timings_path is not None:
+            m.save_timings(m.timings_path)
+    return results
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m timcam.api")
+    parser.add_argument("paths", nargs="+", type=Path)
+    parser.add_argument(
+        "--pocket-offsets",
+        type=lambda s: [float(x) for x in s.split(",")],
+        metavar="N,N,...",
+        help="stock to leave (microns) for each pass over pockets, e.g. 500,0",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        metavar="DIR",
+        help="reuse unchanged step results from (and save them to) DIR",
+    )
+    parser.add_argument(
+        "--timings",
+        type=Path,
+        metavar="FILE",
+        help="schedule by step timings from FILE, and save this run's there",
+    )
+    args = parser.parse_args()
+    cache = StepCache(args.cache) if args.cache is not None else None
+
     vmodule_init(logging.DEBUG, "ezdxf=-1")
     # We don't clear out the preview/ dir to make it easier for eog to refresh
     # open files.
     os.makedirs("preview", exist_ok=True)
-    with keke.TraceOutput(file=open("trace.out", "w")):
-        m = Main(8, True)
-        m.load(Path(sys.argv[1]))
-        m.wait()
+    with trace.output(open("trace.out", "w")):
+        if len(args.paths) > 1:
+            asyncio.run(
+                run_many(
+                    args.paths,
+                    pocket_offsets=args.pocket_offsets,
+                    save_previews=True,
+                    timings_path=args.timings,
+                    cache=cache,
+                )
+            )
+        else:
+            m = Main(8, True, timings_path=args.timings, cache=cache)
+            m.load(args.paths[0], args.pocket_offsets)
+            m.wait()
@@ -1,126 +1,534 @@
 from __future__ import annotations
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from logging import getLogger
-from typing import Optional
-import keke
+from typing import TYPE_CHECKING, Callable, Optional
+import asyncio
+import copy
+import json
+import multiprocessing
 import cairo
 import threading
+import time
 
-# from .cairo_pil import to_pil
+from . import trace
+from .preview import Composite, PreviewQueue, fit_matrix
+from .scheduler import Scheduler, critical_paths
+
+if TYPE_CHECKING:
+    from .cache import StepCache
 
 logger = getLogger(__name__)
 
+# How often `Status.wait` logs while it's still waiting; it doesn't affect how
+# soon it returns.
+PROGRESS_INTERVAL = 10.0
+
 
 class Step:
+    # Rough relative run time (including the steps it submits), used to
+    # schedule when there are no timings from a previous run.
+    cost = 1.0
+
     def __init__(self, key: tuple[int, ...], status: Status) -> None:
         self._key = key
         self._status = status
 
+    def __getstate__(self):
+        # Steps are shipped to worker processes without their Status; see
+        # `Status.execute`.
+        state = self.__dict__.copy()
+        state.pop("_status", None)
+        return state
+
     def preview(self, ctx: cairo.Context) -> None:
         raise NotImplementedError
 
+    def preview_bounds(self) -> Optional[tuple[int, int, int, int]]:
+        """
+        For steps worth their own preview crop (see `Composite`), the bounds
+        (x1, x2, y1, y2) of everything they and the steps under them draw.
+        """
+        return None
+
+    def prepare(self) -> None:
+        """
+        Called just before `run`, always in the parent process.  Steps that
+        need other steps' results (see `Status.submit_after`) pick them up
+        here.
+        """
+
+    def finish(self) -> None:
+        """
+        Called just after a successful `run`, always in the parent process,
+        for anything that has to use the parent's `Status` directly.
+        """
+
+    def cached(self, name: str, parts: tuple, func):
+        """
+        Returns `func()`, or a copy of what it returned on a previous run with
+        the same `parts` (everything the result depends on: input geometry,
+        distances, thresholds...) if the status has a `StepCache`.
+
+        Each entry is a file, so this is only worth it for results that take
+        much longer to compute than to read back, like a whole profile or
+        pocket plan, and not for the many small steps under them.
+        """
+        cache = self._status.cache
+        if cache is None:
+            return func()
+        return cache.get_or_compute(
+            cache.key(self.__class__.__name__, name, *parts), func
+        )
+
     # TODO better error reporting back to status object too, this ~always
     # happens in threads.
-    @keke.ktrace()
+    @trace.ktrace(level=trace.DETAILED)
     def lifecycle(self):
         self._status.report(self._key, done=False, error=False, obj=self)
         try:
-            with keke.kev(self.__class__.__name__, key=str(self._key)):
-                self.run()
+            with trace.kev(self.__class__.__name__, key=str(self._key)):
+                self.prepare()
+                self._status.execute(self)
+                self.finish()
         except Exception:
             logger.exception("lifecycle")
             self._status.report(self._key, done=True, error=True, obj=self)
         else:
             self._status.report(self._key, done=True, error=False, obj=self)
 
+    def reuse_lifecycle(self):
+        """
+        Stands in for `lifecycle` on a step carried over from a previous run
+        (see `Status.adopt`), which reports without running.
+        """
+        self._status.report(self._key, done=False, error=False, obj=self)
+        self._status.report(self._key, done=True, error=False, obj=self)
+
     def run(self):
         raise NotImplementedError
 
 
 class LoadStep(Step):
-    def __init__(self, path: Path, **kwargs) -> None:
+    cost = 100.0
+
+    def __init__(self, path: Path, previous=None, **kwargs) -> None:
+        """
+        `previous` is an optional {key: step} tree from an earlier load of the
+        same file, whose unchanged parts may be reused.
+        """
         self._path = path
+        self._previous = previous
         super().__init__(**kwargs)
 
 
+class _WorkerStatus:
+    """
+    Stands in for `Status` while a step runs in a worker process, recording what
+    `run` asked for so that the parent can replay it.
+    """
+
+    def __init__(self, cache) -> None:
+        self.submitted: list[Step] = []
+        self.submitted_after: list[tuple[list[tuple[int, ...]], Step]] = []
+        self.bounds: Optional[tuple[int, int, int, int]] = None
+        self.bounds_key: tuple[int, ...] = ()
+        self.cache = cache
+        # The change in `cache.counts()` while running, for `StepCache.merge`
+        self.cache_counts: Optional[tuple[int, int, int]] = None
+        # What `trace.count` counted while running
+        self.trace_counts: dict[str, int] = {}
+
+    def submit(self, func):
+        # Only bound `Step.lifecycle` methods can be routed back to the parent.
+        self.submitted.append(func.__self__)
+        f = Future()
+        f.set_result(None)
+        return f
+
+    def submit_after(self, keys, func):
+        self.submitted_after.append((list(keys), func.__self__))
+
+    def set_bounds(
+        self, bounds: tuple[int, int, int, int], key: tuple[int, ...] = ()
+    ) -> None:
+        self.bounds = bounds
+        self.bounds_key = key
+
+
+def _run_in_worker(step: Step, cache) -> tuple[Step, _WorkerStatus]:
+    status = _WorkerStatus(cache)
+    step._status = status
+    before = cache.counts() if cache is not None else None
+    # Only what this step counts, not anything since the worker started
+    trace.take_counts()
+    step.run()
+    status.trace_counts = trace.take_counts()
+    if cache is not None:
+        status.cache_counts = tuple(a - b for a, b in zip(cache.counts(), before))
+    status.cache = None
+    return step, status
+
+
+class StepError(Exception):
+    """
+    Set on a `Status.tree_future` when any step in that tree failed; the args
+    are the failed keys.
+    """
+
+
 class Status:
     viewport_size = (1920, 1080)
     cairo_matrix: Optional[cairo.Matrix] = None
 
-    def __init__(self, threads, save_previews=False) -> None:
-        self.executor = ThreadPoolExecutor(max_workers=threads)
+    def __init__(
+        self,
+        threads,
+        save_previews=False,
+        processes=False,
+        timings_path: Optional[Path] = None,
+        cache: Optional[StepCache] = None,
+        preview_crops=False,
+        preview_encoder="png",
+    ) -> None:
+        """
+        With `processes=True`, each step's `run` happens in a pool of `threads`
+        worker processes, which avoids the GIL for the pure-Python stages.
+        Steps (and whatever they compute) must be picklable.  Workers are
+        spawned rather than forked, because this process already has threads
+        running, so they only see what's importable or sent to them.
+
+        If `timings_path` is given, step timings from the previous run are read
+        from it to prioritize steps on the critical path, and this run's
+        timings are written back at the end of `wait`.
+
+        If `cache` is given, steps reuse results from previous runs whose inputs
+        were the same (see `Step.cached`).
+
+        With `save_previews`, each finished step is drawn onto an overview
+        image per file in `preview/` by a background `PreviewQueue`, rather
+        than by the worker that ran it.  `preview_crops` adds an image per
+        profile and pocket (see `Composite`), and `preview_encoder` picks the
+        file format from `timcam.preview.ENCODERS`.
+        """
+        self.executor = Scheduler(threads)
+        self.process_executor = (
+            ProcessPoolExecutor(
+                max_workers=threads, mp_context=multiprocessing.get_context("spawn")
+            )
+            if processes
+            else None
+        )
         self.next_file_number = 0
         self.results = {}
         self._pending = 0
         self._done = False
         self._condition = threading.Condition()
         self.save_previews = save_previews
+        self.previews = None
+        if save_previews:
+            composite = Composite(
+                Path("preview"),
+                self.viewport_size,
+                crops=preview_crops,
+                encoder=preview_encoder,
+            )
+            self.previews = PreviewQueue(
+                composite, after_batch=composite.write, on_drop=composite.dropped
+            )
+            self._composite = composite
+        self.cache = cache
+        # Root key -> matrix for that file's overview, from `set_bounds`
+        self.cairo_matrices: dict[tuple[int, ...], cairo.Matrix] = {}
+
+        self.durations: dict[tuple[int, ...], float] = {}
+        self._started: dict[tuple[int, ...], float] = {}
+        self._classes: dict[tuple[int, ...], str] = {}
+        self.estimates: dict[tuple[int, ...], float] = {}
+        self.class_estimates: dict[str, float] = {}
+        self.timings_path = timings_path
+        if timings_path is not None and timings_path.exists():
+            self.load_timings(timings_path)
 
-    @keke.ktrace()
+        self.errors: set[tuple[int, ...]] = set()
+        # key prefix -> number of submitted-but-not-done steps under it
+        self._tree_pending: dict[tuple[int, ...], int] = {}
+        self._tree_futures: dict[tuple[int, ...], list[Future]] = {}
+        self._subscribers: list[Callable[[tuple[int, ...], Step, bool], None]] = []
+
+    @trace.ktrace(level=trace.DETAILED)
     def report(self, key: tuple[int, ...], done: bool, error: bool, obj: Step) -> None:
         logger.info("reporting %s done=%s", key, done)
+        if not done:
+            self._started[key] = time.monotonic()
+            self._classes[key] = obj.__class__.__name__
+        else:
+            self.durations[key] = time.monotonic() - self._started.pop(
+                key, time.monotonic()
+            )
         if error:
             with self._condition:
+                self.errors.add(key)
                 self._done = True
                 self._condition.notify_all()
         if done:
+            trace.count("steps")
             self.results[key] = obj
-            if self.save_previews:
+            if self.previews is not None:
+                self.previews.put(
+                    key, obj, self.cairo_matrices.get(key[:1], self.cairo_matrix)
+                )
+            for callback in list(self._subscribers):
                 try:
-                    img = self.get_preview(obj)
-                    with keke.kev("write_to_png"):
-                        img.write_to_png(
-                            "preview/%s.png" % (".".join(str(i) for i in key))
-                        )
-                        # im = to_pil(img)
-                        # im.save("preview/%s.png" % (".".join(str(i) for i in key)))
+                    callback(key, obj, error)
                 except Exception:
-                    logger.exception(".".join(str(i) for i in key))
-            self._pending -= 1
+                    logger.exception("subscriber %r", callback)
+
+            finished = []
             with self._condition:
+                self._pending -= 1
                 if self._pending == 0:
                     self._done = True
                     self._condition.notify_all()
+                for i in range(len(key) + 1):
+                    prefix = key[:i]
+                    if prefix not in self._tree_pending:
+                        continue
+                    self._tree_pending[prefix] -= 1
+                    if self._tree_pending[prefix] == 0:
+                        del self._tree_pending[prefix]
+                        finished.extend(
+                            (prefix, f) for f in self._tree_futures.pop(prefix, ())
+                        )
+            for prefix, f in finished:
+                self._resolve(prefix, f)
+
+    def subscribe(self, callback: Callable[[tuple[int, ...], Step, bool], None]):
+        """
+        Call `callback(key, step, error)` as each step finishes (in the thread
+        that ran it, so it should be quick).
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        self._subscribers.remove(callback)
 
-    def get_preview(self, obj: Step) -> cairo.ImageSurface:
+    def tree_future(self, key: tuple[int, ...] = ()) -> Future:
+        """
+        Returns a Future that resolves once `key` and all the steps under it
+        (including ones they submit later) are done, with a {key: step} dict
+        of that tree.  If any of them failed, it raises `StepError` instead.
+
+        The default empty key means everything.  A key that hasn't been
+        submitted yet is waited for.
+        """
+        f: Future = Future()
+        with self._condition:
+            if key not in self._tree_pending and (not key or key in self.results):
+                ready = True
+            else:
+                ready = False
+                self._tree_futures.setdefault(key, []).append(f)
+        if ready:
+            self._resolve(key, f)
+        return f
+
+    async def wait_async(self, key: tuple[int, ...] = ()) -> dict:
+        """
+        Awaitable version of `tree_future(key).result()`.
+        """
+        return await asyncio.wrap_future(self.tree_future(key))
+
+    def _resolve(self, prefix: tuple[int, ...], f: Future) -> None:
+        n = len(prefix)
+        tree = {k: v for k, v in list(self.results.items()) if k[:n] == prefix}
+        failed = sorted(k for k in self.errors if k[:n] == prefix)
+        if failed:
+            f.set_exception(StepError(*failed))
+        else:
+            f.set_result(tree)
+
+    def get_preview(
+        self, obj: Step, matrix: Optional[cairo.Matrix] = None
+    ) -> cairo.ImageSurface:
         img = cairo.ImageSurface(cairo.FORMAT_ARGB32, *self.viewport_size)
         ctx = cairo.Context(img)
-        ctx.set_matrix(self.cairo_matrix)
-        with keke.kev(
-            "preview",
-            cls=obj.__class__.__name__,
-        ):
+        ctx.set_matrix(self.cairo_matrix if matrix is None else matrix)
+        with trace.kev("preview", level=trace.DETAILED, cls=obj.__class__.__name__):
             obj.preview(ctx)
         return img
 
-    def set_bounds(self, bounds: tuple[int, int, int, int]) -> None:
-        w = bounds[1] - bounds[0]
-        h = bounds[3] - bounds[2]
-        x = bounds[0]
-        y = bounds[3]
-        mx = (bounds[0] + bounds[1]) / 2
-        my = (bounds[2] + bounds[3]) / 2
-        self.cairo_matrix = cairo.Matrix()
-        sx = self.viewport_size[0] / w
-        sy = self.viewport_size[1] / h
-        self.cairo_matrix.translate(
-            self.viewport_size[0] / 2, self.viewport_size[1] / 2
-        )
-        self.cairo_matrix.scale(min(sx, sy), -min(sx, sy))
-        self.cairo_matrix.translate(-mx, -my)
+    def close_previews(self) -> None:
+        """
+        Waits for any queued previews to be written.
+        """
+        if self.previews is not None:
+            self.previews.close()
+            self._composite.close()
+
+    def set_bounds(
+        self, bounds: tuple[int, int, int, int], key: tuple[int, ...] = ()
+    ) -> None:
+        """
+        Sets the overview matrix for the file at `key` (its load step's key),
+        which also becomes the default `cairo_matrix`.
+        """
+        self.cairo_matrix = fit_matrix(bounds, self.viewport_size)
+        if key:
+            self.cairo_matrices[key[:1]] = self.cairo_matrix
+
+    def priority(self, step: Step) -> float:
+        """
+        Lower runs first.  This is the negated estimate of the longest chain of
+        work starting at `step`, from the previous run's timings if there were
+        any.
+        """
+        estimate = self.estimates.get(step._key)
+        if estimate is None:
+            estimate = self.class_estimates.get(step.__class__.__name__, step.cost)
+        return -estimate
+
+    def _track(self, step) -> None:
+        with self._condition:
+            self._pending += 1
+            if isinstance(step, Step):
+                for i in range(len(step._key) + 1):
+                    prefix = step._key[:i]
+                    self._tree_pending[prefix] = self._tree_pending.get(prefix, 0) + 1
 
     def submit(self, func):
-        self._pending += 1
+        step = getattr(func, "__self__", None)
+        self._track(step)
+        if isinstance(step, Step):
+            return self.executor.submit(func, self.priority(step))
         return self.executor.submit(func)
 
+    def submit_after(self, keys: list[tuple[int, ...]], func) -> Future:
+        """
+        Like `submit`, but `func` (a bound `Step.lifecycle`) only starts once
+        the trees at all of `keys` are done, whether or not they succeeded.
+        No worker is tied up in the meantime.
+
+        It counts as pending from now, so `wait` and any `tree_future` that
+        includes it don't finish early.
+        """
+        step = func.__self__
+        self._track(step)
+        outer: Future = Future()
+        remaining = [len(keys)]
+        lock = threading.Lock()
+
+        def copy_result(inner: Future) -> None:
+            if inner.exception() is not None:
+                outer.set_exception(inner.exception())
+            else:
+                outer.set_result(inner.result())
+
+        def start():
+            self.executor.submit(func, self.priority(step)).add_done_callback(
+                copy_result
+            )
+
+        def dep_done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                start()
+
+        if not keys:
+            start()
+        for k in keys:
+            self.tree_future(k).add_done_callback(dep_done)
+        return outer
+
+    def adopt(
+        self,
+        tree: dict[tuple[int, ...], Step],
+        old_root: tuple[int, ...],
+        new_root: tuple[int, ...],
+    ) -> None:
+        """
+        Carry over already-finished steps from `tree` (for example part of
+        `results` from an earlier run), re-keyed from `old_root` to `new_root`,
+        without running them again.  They're otherwise reported like any other
+        step.
+        """
+        n = len(old_root)
+        for old_key, step in sorted(tree.items()):
+            step = copy.copy(step)
+            step._key = new_root + old_key[n:]
+            step._status = self
+            self.submit(step.reuse_lifecycle)
+
+    def execute(self, step: Step) -> None:
+        """
+        Called from `Step.lifecycle` to do the actual `run`.
+
+        In process mode, this thread blocks while a worker process runs a copy
+        of `step`; the results are copied back onto `step`, and any steps it
+        submitted are submitted here instead.
+        """
+        if self.process_executor is None:
+            step.run()
+            return
+
+        result, worker = self.process_executor.submit(
+            _run_in_worker, step, self.cache
+        ).result()
+        step.__dict__.update(result.__dict__)
+        if worker.cache_counts is not None:
+            self.cache.merge(*worker.cache_counts)
+        for name, n in worker.trace_counts.items():
+            trace.count(name, n)
+        if worker.bounds is not None:
+            self.set_bounds(worker.bounds, worker.bounds_key)
+        for child in worker.submitted:
+            child._status = self
+            self.submit(child.lifecycle)
+        for keys, child in worker.submitted_after:
+            child._status = self
+            self.submit_after(keys, child.lifecycle)
+
     def wait(self) -> None:
-        i = 1
-        while not self._done:
-            with self._condition:
-                if not self._done:
-                    result = self._condition.wait(1)
+        """
+        Blocks until everything submitted is done (or something failed), then
+        shuts down the workers.
+        """
+        with self._condition:
+            while not self._done:
+                if not self._condition.wait(PROGRESS_INTERVAL):
+                    logger.warning("Still waiting, %d pending", self._pending)
+        self.executor.shutdown()
+        if self.process_executor is not None:
+            self.process_executor.shutdown()
+        self.close_previews()
+        if self.timings_path is not None:
+            self.save_timings(self.timings_path)
+
+    def load_timings(self, path: Path) -> None:
+        with open(path) as f:
+            data = json.load(f)
+        self.estimates = {
+            tuple(int(i) for i in k.split(".")): v for k, v in data["keys"].items()
+        }
+        self.class_estimates = data["classes"]
 
-            logger.warning("After %d seconds, %d pending", i, self._pending)
-            i += 1
-        self.executor.__exit__(None, None, None)
+    def save_timings(self, path: Path) -> None:
+        """
+        Writes the critical path (in seconds) starting at each step of this run,
+        plus the average for each class of step.
+        """
+        crit = critical_paths(self.durations)
+        by_class: dict[str, list[float]] = {}
+        for key, v in crit.items():
+            by_class.setdefault(self._classes[key], []).append(v)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "keys": {".".join(str(i) for i in k): v for k, v in crit.items()},
+                    "classes": {c: sum(v) / len(v) for c, v in by_class.items()},
+                },
+                f,
+                indent=1,
+            )
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from .types import Loop, Point
+
+logger = getLogger(__name__)
+
+# Bump when the pickled form of anything cached changes incompatibly.
+CACHE_VERSION = 3
+
+# Marks the directories `StepCache` made, which are the only ones it removes
+MARKER = ".timcam-cache"
+
+
+@lru_cache(maxsize=None)
+def _timcam_version() -> str:
+    """
+    The installed version plus a hash of timcam's own source, so that entries
+    from different code (including a source checkout or editable install with
+    local changes, where the version doesn't change) aren't reused.
+    """
+    try:
+        dist = version("timcam")
+    except PackageNotFoundError:
+        dist = "unknown"
+    h = hashlib.sha256()
+    package = Path(__file__).parent
+    for path in sorted(package.rglob("*.py")):
+        _feed(h, path.relative_to(package).as_posix())
+        _feed(h, path.read_bytes())
+    return "%s+%s" % (dist, h.hexdigest()[:12])
+
+
+def _feed(h, obj) -> None:
+    """
+    Feed a canonical encoding of `obj` into hash `h`.  Only types whose value
+    is fully described by the encoding are accepted.
+    """
+    if obj is None:
+        h.update(b"N")
+    elif isinstance(obj, bool):
+        h.update(b"B1" if obj else b"B0")
+    elif isinstance(obj, int):
+        s = str(obj).encode()
+        h.update(b"I%d:" % len(s) + s)
+    elif isinstance(obj, float):
+        h.update(b"F" + struct.pack("<d", obj))
+    elif isinstance(obj, str):
+        s = obj.encode()
+        h.update(b"S%d:" % len(s) + s)
+    elif isinstance(obj, bytes):
+        h.update(b"Y%d:" % len(obj) + obj)
+    elif isinstance(obj, np.ndarray):
+        a = np.ascontiguousarray(obj)
+        h.update(b"A" + a.dtype.str.encode() + repr(a.shape).encode())
+        h.update(a.tobytes())
+    elif isinstance(obj, Loop):
+        h.update(b"L")
+        _feed(h, obj.coords)
+        _feed(h, obj.bulges)
+        _feed(h, obj.tolerance)
+    elif isinstance(obj, Point):
+        h.update(b"P")
+        _feed(h, obj.x)
+        _feed(h, obj.y)
+    elif isinstance(obj, (tuple, list)):
+        h.update(b"T%d:" % len(obj))
+        for i in obj:
+            _feed(h, i)
+    else:
+        raise TypeError("Can't make a cache key from %r" % type(obj))
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StepCache:
+    """
+    Content-addressed on-disk cache of step results.
+
+    Keys are a hash of whatever a step's result depends on (see `Step.cached`),
+    values are pickles.  Entries live in a subdirectory named for
+    `CACHE_VERSION` and the timcam version and source, and other versions'
+    directories (only ones with a `MARKER` file, so `root` can be shared) are
+    removed on startup.  When the total size goes over `max_bytes`, the least
+    recently used entries are removed.
+
+    Copies used in worker processes don't update `hits`, `misses` or the size
+    here themselves; `Status` passes their counts to `merge`.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 1 << 30) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.dir = self.root / ("%d-%s" % (CACHE_VERSION, _timcam_version()))
+        self.dir.mkdir(parents=True, exist_ok=True)
+        (self.dir / MARKER).touch()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        for d in self.root.iterdir():
+            if d != self.dir and (d / MARKER).is_file():
+                logger.info("Removing old cache %s", d)
+                shutil.rmtree(d, ignore_errors=True)
+        self._size = sum(p.stat().st_size for p in self._entries())
+
+    def __getstate__(self):
+        # So that it can be shipped to worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        # Skips the marker and any temp files being written
+        return (p for p in self.dir.iterdir() if not p.name.startswith("."))
+
+    def counts(self) -> tuple[int, int, int]:
+        with self._lock:
+            return self.hits, self.misses, self._size
+
+    def merge(self, hits: int, misses: int, size: int) -> None:
+        """
+        Adds what a copy of this cache in a worker process did (the difference
+        in its `counts`), evicting if that took it over `max_bytes`.
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def key(self, *parts) -> str:
+        h = hashlib.sha256()
+        for p in parts:
+            _feed(h, p)
+        return h.hexdigest()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """
+        Returns (found, value).
+        """
+        path = self.dir / key
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False, None
+        except Exception:
+            logger.exception("Ignoring bad cache entry %s", key)
+            with self._lock:
+                self.misses += 1
+            return False, None
+        # mtime is what eviction uses as "last used"
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return True, value
+
+    def put(self, key: str, value: Any) -> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        # Written to a temp file and renamed, so readers in other threads or
+        # processes never see a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=self.dir, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = self.dir / key
+        with self._lock:
+            # Replacing an entry (say, one another thread computed at the same
+            # time) only adds the difference
+            try:
+                old = path.stat().st_size
+            except FileNotFoundError:
+                old = 0
+            os.replace(tmp, path)
+            self._size += len(data) - old
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get_or_compute(self, key: str, func: Callable[[], Any]) -> Any:
+        found, value = self.get(key)
+        if not found:
+            value = func()
+            self.put(key, value)
+        return value
+
+    def _evict(self) -> None:
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        self._size = sum(e[1] for e in entries)
+        # Down to 90%, so we aren't doing this on every put
+        target = self.max_bytes * 0.9
+        for _, size, p in entries:
+            if self._size <= target:
+                break
+            p.unlink(missing_ok=True)
+            self._size -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self._entries():
+                p.unlink(missing_ok=True)
+            self._size = 0
@@ -1,20 +1,48 @@
 import cairo
+import numpy as np
 from PIL import Image
 
 
+def to_numpy(surface: cairo.ImageSurface) -> np.ndarray:
+    """
+    A (height, width, 4) uint8 view of `surface`'s pixels, without copying.
+    The channels are cairo's (B, G, R, A premultiplied, or X for RGB24, on
+    little-endian machines).  It's only valid while the surface is alive, and
+    shows later drawing once `surface.flush()` is called.
+    """
+    surface.flush()
+    h = surface.get_height()
+    w = surface.get_width()
+    stride = surface.get_stride()
+    rows = np.frombuffer(surface.get_data(), dtype=np.uint8).reshape(h, stride)
+    # Drops any padding at the end of each row, which is still a view
+    return rows[:, : w * 4].reshape(h, w, 4)
+
+
 def to_pil(surface: cairo.ImageSurface) -> Image:
     format = surface.get_format()
     size = (surface.get_width(), surface.get_height())
     stride = surface.get_stride()
 
+    surface.flush()
+    # The buffer goes straight to the decoder, which is the only copy (PIL
+    # can't use cairo's channel order in place).
     with surface.get_data() as memory:
         if format == cairo.Format.RGB24:
-            return Image.frombuffer(
-                "RGB", size, memory.tobytes(), "raw", "BGRX", stride
-            )
+            return Image.frombuffer("RGB", size, memory, "raw", "BGRX", stride)
         elif format == cairo.Format.ARGB32:
-            return Image.frombuffer(
-                "RGBA", size, memory.tobytes(), "raw", "BGRa", stride
-            )
+            return Image.frombuffer("RGBA", size, memory, "raw", "BGRa", stride)
         else:
             raise NotImplementedError(repr(format))
+
+
+def from_pil(image: Image) -> cairo.ImageSurface:
+    """
+    The reverse of `to_pil`, always as ARGB32.
+    """
+    w, h = image.size
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, w, h)
+    pixels = image.convert("RGBA").tobytes("raw", "BGRa")
+    to_numpy(surface)[:] = np.frombuffer(pixels, dtype=np.uint8).reshape(h, w, 4)
+    surface.mark_dirty()
+    return surface
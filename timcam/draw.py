@@ -0,0 +1,58 @@
+"""
+Helpers for drawing geometry onto a cairo context at preview resolution.
+They only call methods on the context they're given, so the geometry types
+can use them without importing cairo (or the rest of `timcam.preview`).
+"""
+
+from __future__ import annotations
+
+from math import hypot
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import cairo
+
+
+def pixel_size(ctx: cairo.Context) -> float:
+    """
+    The length of one device pixel in user units.
+    """
+    return hypot(*ctx.device_to_user_distance(1.0, 0.0))
+
+
+def decimate(coords, size: float) -> np.ndarray:
+    """
+    Returns the indices of the points in (N, 2) `coords` worth drawing when
+    one pixel is `size`: of consecutive points that fall in the same pixel,
+    only the first is kept (and the last point always is).
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) <= 2 or not size > 0:
+        return np.arange(len(coords))
+    cells = np.floor(coords / size)
+    keep = np.empty(len(coords), dtype=bool)
+    keep[0] = True
+    keep[1:] = (cells[1:] != cells[:-1]).any(axis=1)
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+
+def path_points(ctx: cairo.Context, coords, close: bool = False) -> None:
+    """
+    Adds a polyline through `coords` to the path (closed, starting from the
+    last point, with `close`), leaving out points that wouldn't show.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return
+    pts = coords[decimate(coords, pixel_size(ctx))].tolist()
+    if close:
+        ctx.move_to(*pts[-1])
+    else:
+        ctx.move_to(*pts[0])
+    for x, y in pts:
+        ctx.line_to(x, y)
+    if close:
+        ctx.close_path()
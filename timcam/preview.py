@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import cairo
+import numpy as np
+from PIL import Image
+
+from . import trace
+from .cairo_pil import from_pil, to_numpy, to_pil
+
+logger = getLogger(__name__)
+
+# Previews waiting to be drawn beyond this many are dropped rather than queued.
+MAX_PENDING = 256
+
+# How many images `Composite` keeps in memory; others are reloaded from their
+# PNG when something new is drawn on them.
+MAX_SURFACES = 8
+
+CROP_SIZE = (640, 640)
+
+
+def _load_raw(path: str) -> cairo.ImageSurface:
+    pixels = np.load(path)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, *pixels.shape[1::-1])
+    to_numpy(surface)[:] = pixels
+    surface.mark_dirty()
+    return surface
+
+
+# name -> (file extension, save(surface, path), load(path) -> surface).
+#
+# "png" is cairo's own writer at zlib's default level; "png-fast" is zlib's
+# fastest level, for bigger files; lossless "webp" at its fastest setting is
+# usually quicker still, and small; "raw" is just the pixels (a .npy of cairo's
+# BGRA), which costs only the disk.  (Pillow's QOI writer is pure Python, so
+# slower than any of these.)  See bench/bench_preview.py for numbers.
+ENCODERS: dict[str, tuple[str, Callable, Callable]] = {
+    "png": (
+        ".png",
+        lambda surface, path: surface.write_to_png(path),
+        cairo.ImageSurface.create_from_png,
+    ),
+    "png-fast": (
+        ".png",
+        lambda surface, path: to_pil(surface).save(path, "PNG", compress_level=1),
+        cairo.ImageSurface.create_from_png,
+    ),
+    "webp": (
+        ".webp",
+        lambda surface, path: to_pil(surface).save(
+            path, "WEBP", lossless=True, method=0
+        ),
+        lambda path: from_pil(Image.open(path)),
+    ),
+    "raw": (
+        ".npy",
+        lambda surface, path: np.save(path, to_numpy(surface)),
+        _load_raw,
+    ),
+}
+
+
+def fit_matrix(
+    bounds: tuple[float, float, float, float], size: tuple[int, int]
+) -> cairo.Matrix:
+    """
+    A matrix that fits `bounds` (x1, x2, y1, y2, in microns) centered in an
+    image of `size` pixels, with y up.
+    """
+    w = bounds[1] - bounds[0]
+    h = bounds[3] - bounds[2]
+    mx = (bounds[0] + bounds[1]) / 2
+    my = (bounds[2] + bounds[3]) / 2
+    matrix = cairo.Matrix()
+    sx = size[0] / w
+    sy = size[1] / h
+    matrix.translate(size[0] / 2, size[1] / 2)
+    matrix.scale(min(sx, sy), -min(sx, sy))
+    matrix.translate(-mx, -my)
+    return matrix
+
+
+class PreviewQueue:
+    """
+    Draws step previews on a background thread, so the worker that finished a
+    step goes straight on to the next one instead of rasterizing and
+    compressing an image first.
+
+    Only a reference to the (finished) step and the cairo matrix at the time
+    are queued; `render(key, step, matrix)` does the actual work.  A burst of
+    reports is taken all at once, and a key that's reported again before it
+    was drawn is only drawn once, with the latest step.  Beyond `max_pending`
+    waiting keys, new ones are dropped (and counted in `dropped`) so previews
+    can't hold up planning or pile up memory.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[tuple[int, ...], Any, Any], None],
+        max_pending: int = MAX_PENDING,
+        after_batch: Optional[Callable[[], None]] = None,
+        on_drop: Optional[Callable[[tuple[int, ...]], None]] = None,
+    ) -> None:
+        """
+        `after_batch()`, if given, is called after each batch is drawn (for
+        example to write out images once rather than per step).
+        `on_drop(key)` is called for each dropped key, on the same thread as
+        `render` and before the next batch.
+        """
+        self.render = render
+        self.after_batch = after_batch
+        self.on_drop = on_drop
+        self._dropped_keys: list[tuple[int, ...]] = []
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.rendered = 0
+        self._pending: dict[tuple[int, ...], tuple[Any, Any]] = {}
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, key: tuple[int, ...], step, matrix) -> bool:
+        """
+        Queue a preview of `step`; returns False if it was dropped.  Never
+        blocks on rendering.
+        """
+        with self._condition:
+            if self._closed:
+                return False
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self._dropped_keys.append(key)
+                return False
+            self._pending[key] = (step, matrix)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="preview", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify_all()
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._dropped_keys:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+                batch, self._pending = self._pending, {}
+                dropped, self._dropped_keys = self._dropped_keys, []
+                self._busy = True
+
+            for key in dropped:
+                try:
+                    self.on_drop(key)
+                except Exception:
+                    logger.exception("on_drop")
+            with trace.kev("previews", n=len(batch)):
+                for key, (step, matrix) in batch.items():
+                    try:
+                        self.render(key, step, matrix)
+                    except Exception:
+                        logger.exception(".".join(str(i) for i in key))
+                    self.rendered += 1
+                if self.after_batch is not None:
+                    try:
+                        self.after_batch()
+                    except Exception:
+                        logger.exception("after_batch")
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until everything queued so far has been drawn.  Returns False
+        on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not (self._pending or self._dropped_keys or self._busy),
+                timeout,
+            )
+
+    def close(self) -> None:
+        """
+        Draws whatever is still queued, then stops the thread.  Anything put
+        afterwards is dropped.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+class Composite:
+    """
+    A `PreviewQueue` renderer that draws every step onto one overview image
+    per file (root key) instead of an image per step, and with `crops`, also
+    onto an image for each subtree whose root has `preview_bounds` (profiles
+    and pockets), zoomed to those bounds.
+
+    Images are `<key>.png` (or whatever `encoder`, from `ENCODERS`, makes)
+    in `directory`, rewritten after each batch that drew on them.
+
+    Each step goes on the overview straight away, but only goes on a crop
+    once its ancestors have been seen, so pass `dropped` as the queue's
+    `on_drop`; under a dropped ancestor, steps only go on an ancestor's crop
+    further up (if any).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        size: tuple[int, int],
+        crops: bool = False,
+        crop_size: tuple[int, int] = CROP_SIZE,
+        max_surfaces: int = MAX_SURFACES,
+        encoder: str = "png",
+    ) -> None:
+        self.directory = directory
+        self._ext, self._save, self._load = ENCODERS[encoder]
+        self.size = size
+        self.crops = crops
+        self.crop_size = crop_size
+        self.max_surfaces = max_surfaces
+        # key -> surface, least recently drawn first
+        self._surfaces: OrderedDict[tuple[int, ...], cairo.ImageSurface] = OrderedDict()
+        self._dirty: set[tuple[int, ...]] = set()
+        # Keys whose PNG is from this run (so can be reloaded)
+        self._written: set[tuple[int, ...]] = set()
+        # crop key -> matrix
+        self._crop_matrices: dict[tuple[int, ...], cairo.Matrix] = {}
+        # Keys already sorted into crops, and ones waiting for an ancestor
+        self._seen: set[tuple[int, ...]] = set()
+        self._waiting: dict[tuple[int, ...], list] = {}
+
+    def __call__(self, key: tuple[int, ...], step, matrix) -> None:
+        if matrix is not None:
+            self._draw(key[:1], self.size, matrix, step)
+        if self.crops:
+            self._crop(key, step)
+
+    def _crop(self, key: tuple[int, ...], step) -> None:
+        # Which crop (if any) this goes in depends on its ancestors, which can
+        # occasionally finish after it does.
+        for i in range(1, len(key)):
+            if key[:i] not in self._seen:
+                self._waiting.setdefault(key[:i], []).append((key, step))
+                return
+        self._seen.add(key)
+
+        for i in range(1, len(key) + 1):
+            if key[:i] in self._crop_matrices:
+                crop = key[:i]
+                break
+        else:
+            bounds = step.preview_bounds()
+            crop = key
+            if bounds is not None:
+                self._crop_matrices[key] = fit_matrix(bounds, self.crop_size)
+        if crop in self._crop_matrices:
+            self._draw(crop, self.crop_size, self._crop_matrices[crop], step)
+
+        for k, s in self._waiting.pop(key, ()):
+            self._crop(k, s)
+
+    def dropped(self, key: tuple[int, ...]) -> None:
+        """
+        Stands in for drawing `key`, which a `PreviewQueue` dropped, as far as
+        the crops of the steps under it are concerned.
+        """
+        if not self.crops or key in self._seen:
+            return
+        self._seen.add(key)
+        for k, s in self._waiting.pop(key, ()):
+            self._crop(k, s)
+
+    def close(self) -> None:
+        """
+        Forgets steps still waiting for an ancestor that never arrived (they're
+        on the overview already), and writes out any images not yet written.
+        """
+        if self._waiting:
+            logger.info(
+                "%d previews left out of crops",
+                sum(len(v) for v in self._waiting.values()),
+            )
+        self._waiting.clear()
+        self.write()
+
+    def _path(self, key: tuple[int, ...]) -> str:
+        name = ".".join(map(str, key)) + self._ext
+        return os.path.join(self.directory, name)
+
+    def _draw(self, key, size, matrix, step) -> None:
+        surface = self._surfaces.pop(key, None)
+        if surface is None:
+            if key in self._written:
+                surface = self._load(self._path(key))
+            else:
+                surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+        self._surfaces[key] = surface
+        while len(self._surfaces) > self.max_surfaces:
+            old, old_surface = self._surfaces.popitem(last=False)
+            if old in self._dirty:
+                self._write(old, old_surface)
+
+        ctx = cairo.Context(surface)
+        ctx.set_matrix(matrix)
+        with trace.kev("preview", level=trace.DETAILED, cls=step.__class__.__name__):
+            step.preview(ctx)
+        self._dirty.add(key)
+
+    def _write(self, key, surface) -> None:
+        with trace.kev("encode", ext=self._ext):
+            self._save(surface, self._path(key))
+        self._dirty.discard(key)
+        self._written.add(key)
+
+    def write(self) -> None:
+        """
+        Writes out every image drawn on since the last time.
+        """
+        for key in sorted(self._dirty):
+            surface = self._surfaces.get(key)
+            if surface is not None:
+                self._write(key, surface)
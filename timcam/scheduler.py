@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class Scheduler:
+    """
+    A fixed pool of threads that run submitted callables in priority order.
+
+    Lower `priority` runs first, and ties run in submission order.  This is
+    otherwise a small subset of `concurrent.futures.Executor`.
+    """
+
+    def __init__(self, threads: int) -> None:
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._worker, name="timcam-%d" % i, daemon=True)
+            for i in range(threads)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, func, priority: float = 0.0) -> Future:
+        f: Future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            heapq.heappush(self._heap, (priority, next(self._seq), func, f))
+            self._condition.notify()
+        return f
+
+    def queued(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap and not self._shutdown:
+                    self._condition.wait()
+                if not self._heap:
+                    return
+                _, _, func, f = heapq.heappop(self._heap)
+            if not f.set_running_or_notify_cancel():
+                continue
+            try:
+                f.set_result(func())
+            # Like ThreadPoolExecutor, everything goes to whoever has the future
+            except BaseException as e:  # noqa: BLE001
+                f.set_exception(e)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting work; threads exit once the queue is drained.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for t in self._threads:
+                if t is not threading.current_thread():
+                    t.join()
+
+
+def critical_paths(durations: dict[tuple[int, ...], float]) -> dict:
+    """
+    Given {key: seconds} for each step, returns {key: seconds} for the longest
+    chain of steps starting at that key (itself plus its slowest child's
+    critical path), using the dotted-key parent/child relationship.
+    """
+    children: dict[tuple[int, ...], list[tuple[int, ...]]] = {}
+    for key in durations:
+        if key[:-1] in durations:
+            children.setdefault(key[:-1], []).append(key)
+
+    result: dict[tuple[int, ...], float] = {}
+    # Longest keys first, so children are always done before their parent.
+    for key in sorted(durations, key=len, reverse=True):
+        result[key] = durations[key] + max(
+            (result[c] for c in children.get(key, ())), default=0.0
+        )
+    return result
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from timcam import trace
+from timcam.base_steps import Step, StepError
+from timcam.tc0.loader import load_file_cls
+from timcam.tc1 import ProcessShapes
+from timcam.types import Jumble, Loop
+from timcam.types.poly import Job, containment
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class JobSource:
+    path: Path
+    # Only these DXF layers (None for all)
+    layers: Optional[frozenset[str]] = None
+    # The stock outline rather than shapes to cut
+    stock: bool = False
+
+
+def _box_area(loop: Loop) -> int:
+    x1, x2, y1, y2 = loop.bounds()
+    return (x2 - x1) * (y2 - y1)
+
+
+class LoadJob(Step):
+    """
+    Loads several files (or layers of files) as one job.
+
+    Each source is loaded concurrently under this key as `(..., i)`, then a
+    `MergeJob` at `(..., len(sources))` combines them once they're all done.
+    `pocket_offsets` is passed on to its `ProcessShapes`.
+    """
+
+    def __init__(self, sources: list[JobSource], pocket_offsets=None, **kwargs) -> None:
+        self.sources = sources
+        self.pocket_offsets = pocket_offsets
+        super().__init__(**kwargs)
+
+    def run(self):
+        keys = []
+        for i, src in enumerate(self.sources):
+            key = self._key + (i,)
+            step = load_file_cls(src.path)(
+                path=src.path,
+                layers=src.layers,
+                process=False,
+                key=key,
+                status=self._status,
+            )
+            self._status.submit(step.lifecycle)
+            keys.append(key)
+
+        merge = MergeJob(
+            self.sources,
+            keys,
+            pocket_offsets=self.pocket_offsets,
+            key=self._key + (len(keys),),
+            status=self._status,
+        )
+        self._status.submit_after(keys, merge.lifecycle)
+
+    def preview(self, ctx):
+        pass
+
+
+class MergeJob(Step):
+    """
+    Combines the `Jumble`s from a `LoadJob`'s sources into a `Job` and sends
+    all the non-stock loops to `ProcessShapes` at once.  If any source failed,
+    so does this.
+    """
+
+    cost = 50.0
+
+    def __init__(
+        self,
+        sources: list[JobSource],
+        source_keys: list[tuple[int, ...]],
+        pocket_offsets=None,
+        **kwargs,
+    ) -> None:
+        self.sources = sources
+        self.source_keys = source_keys
+        self.pocket_offsets = pocket_offsets
+        super().__init__(**kwargs)
+
+    def prepare(self):
+        failed = sorted(
+            e
+            for e in self._status.errors
+            if any(e[: len(k)] == k for k in self.source_keys)
+        )
+        if failed:
+            raise StepError(*failed)
+        self._jumbles = [self._status.results[k].jumble for k in self.source_keys]
+
+    def run(self):
+        shapes = Jumble()
+        stock = Jumble()
+        with trace.kev("merge", sources=len(self._jumbles)):
+            for src, j in zip(self.sources, self._jumbles):
+                (stock if src.stock else shapes).extend(j)
+
+        self.jumble = shapes
+        self._jumbles = None
+        if not stock.full_loops and not shapes.full_loops:
+            logger.warning("Nothing to cut in %s", [str(s.path) for s in self.sources])
+            self.job = None
+            return
+
+        if stock.full_loops:
+            # The outermost stock loop (any others are ignored for now)
+            outer = max(stock.full_loops, key=_box_area)
+        else:
+            # Without any stock, assume it's the bounding box of the shapes
+            x1, x2, y1, y2 = shapes.bounds()
+            outer = Loop([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+
+        # Shared with `ProcessShapes`, so it isn't worked out twice
+        with trace.kev("containment"):
+            parents = containment(shapes.full_loops)
+        self.job = Job.from_loops(outer, shapes.full_loops, parents)
+        bounds = [outer.bounds()]
+        if shapes.full_loops:
+            bounds.append(shapes.bounds())
+        self._status.set_bounds(
+            (
+                min(b[0] for b in bounds),
+                max(b[1] for b in bounds),
+                min(b[2] for b in bounds),
+                max(b[3] for b in bounds),
+            ),
+            self._key,
+        )
+
+        self._next = ProcessShapes(
+            shapes,
+            pocket_offsets=self.pocket_offsets,
+            parents=parents,
+            key=self._key + (0,),
+            status=self._status,
+        )
+        self._status.submit(self._next.lifecycle)
+
+    def preview(self, ctx):
+        if self.job is None:
+            return
+        self.job.outer.path(ctx)
+        ctx.set_source_rgb(0.6, 0.5, 0.3)
+        ctx.set_line_width(50)
+        ctx.stroke()
+
+        for poly in self.job.inner:
+            for loop in poly.loop_iter():
+                loop.path(ctx)
+        ctx.set_source_rgb(0.2, 0.2, 0.5)
+        ctx.set_line_width(50)
+        ctx.stroke()
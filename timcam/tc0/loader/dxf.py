@@ -1,69 +1,238 @@
+import os
 from logging import getLogger
+from math import cos, pi as PI, radians, sin, tan
+from typing import Iterable, Optional
 
 import ezdxf
-import keke
+from ezdxf.addons import iterdxf
+from ezdxf.entities import DXFGraphic
 
 from timcam.types import Jumble, Point
+from timcam.algo import arc_points, bulge_points
+from timcam import trace
 from timcam.base_steps import LoadStep
+from timcam.cache import file_digest
 from timcam.tc1 import ProcessShapes
 
 logger = getLogger(__name__)
 
 SCALE_FACTOR = 1_000  # mm -> micron
 
+# Curves are split into lines that stray at most this far (in microns).
+CHORD_TOLERANCE = 10
 
-class LoadDxf(LoadStep):
-    def run(self):
-        from timcam.algo import lines
+ENTITY_TYPES = ("LINE", "LWPOLYLINE", "ARC", "CIRCLE", "SPLINE")
 
-        with keke.kev("ezdxf.readfile", filename=str(self._path)):
-            e = ezdxf.readfile(self._path)
 
-        self.jumble = j = Jumble()
-        # TODO make sure modelspace is correct
-        for line in e.modelspace().query("LINE"):
-            j.add_line(
-                Point.from_dxf_vec(line.dxf.start, SCALE_FACTOR),
-                Point.from_dxf_vec(line.dxf.end, SCALE_FACTOR),
-            )
+def _add_path(j: Jumble, points: list[Point], bulges=None) -> None:
+    if bulges is None:
+        bulges = [0.0] * (len(points) - 1)
+    for pt1, pt2, bulge in zip(points, points[1:], bulges):
+        if pt1 != pt2:
+            j.add_arc(pt1, pt2, bulge)
+
+
+def _to_wcs(ocs, points) -> list[Point]:
+    return [Point.from_dxf_vec(v, SCALE_FACTOR) for v in ocs.points_to_wcs(points)]
+
+
+def _arc(entity, start_angle: float, sweep: float) -> tuple[list, list[float]]:
+    """
+    Returns (OCS points, bulges) for an arc of `entity` (which has a center and
+    radius), split in half if needed so each piece is under a full circle.
+    """
+    n = 2 if sweep >= 2 * PI - 1e-9 else 1
+    cx, cy = entity.dxf.center.x, entity.dxf.center.y
+    r = entity.dxf.radius
+    points = [
+        (
+            cx + r * cos(start_angle + sweep * i / n),
+            cy + r * sin(start_angle + sweep * i / n),
+        )
+        for i in range(n + 1)
+    ]
+    return points, [tan(sweep / n / 4)] * n
 
-        for poly in e.modelspace().query("LWPOLYLINE"):
-            points = poly.get_points()
-            for pt1, pt2 in zip(points, points[1:]):
-                # TODO bendy lines
-                j.add_line(
-                    Point(float(pt1[0]) * SCALE_FACTOR, float(pt1[1]) * SCALE_FACTOR),
-                    Point(float(pt2[0]) * SCALE_FACTOR, float(pt2[1]) * SCALE_FACTOR),
-                )
-
-        for arc in e.modelspace().query("ARC"):
-            # TODO discretize
-            start_point = arc.start_point
-            end_point = arc.end_point
-            j.add_line(
-                Point(start_point[0], start_point[1]),
-                Point(end_point[0], end_point[1]),
+
+def add_entity(
+    j: Jumble,
+    entity: DXFGraphic,
+    tolerance: float = CHORD_TOLERANCE,
+    native_arcs: bool = True,
+) -> None:
+    """
+    Adds the segments of one DXF entity to `j`.
+
+    With `native_arcs`, arcs, circles and polyline bulges are added as arcs;
+    otherwise they're split into as few lines as stay within `tolerance`
+    microns of them, as are splines either way.
+    """
+    kind = entity.dxftype()
+    # DXF units are mm
+    tol = tolerance / SCALE_FACTOR
+    # Arcs in an upside-down OCS go the other way in WCS
+    flip = -1 if kind != "LINE" and entity.dxf.extrusion[2] < 0 else 1
+    if kind == "LINE":
+        j.add_line(
+            Point.from_dxf_vec(entity.dxf.start, SCALE_FACTOR),
+            Point.from_dxf_vec(entity.dxf.end, SCALE_FACTOR),
+        )
+    elif kind == "LWPOLYLINE":
+        vertices = list(entity.get_points("xyb"))
+        pairs = list(zip(vertices, vertices[1:]))
+        if entity.closed and len(vertices) > 1:
+            pairs.append((vertices[-1], vertices[0]))
+        if native_arcs:
+            points = [(x, y) for x, y, _ in vertices[:1] + [b for a, b in pairs]]
+            bulges = [bulge * flip for (_, _, bulge), _ in pairs]
+            _add_path(j, _to_wcs(entity.ocs(), points), bulges)
+            return
+        points: list[tuple[float, float]] = []
+        for (x1, y1, bulge), (x2, y2, _) in pairs:
+            seg = bulge_points((x1, y1), (x2, y2), bulge, tol)
+            points.extend(seg[1:] if points else seg)
+        _add_path(j, _to_wcs(entity.ocs(), points))
+    elif kind in ("ARC", "CIRCLE"):
+        if kind == "ARC":
+            start = radians(entity.dxf.start_angle)
+            sweep = radians(
+                (entity.dxf.end_angle - entity.dxf.start_angle) % 360 or 360
+            )
+        else:
+            start, sweep = 0.0, 2 * PI
+        if native_arcs:
+            points, bulges = _arc(entity, start, sweep)
+            bulges = [b * flip for b in bulges]
+        else:
+            points = arc_points(
+                (entity.dxf.center.x, entity.dxf.center.y),
+                entity.dxf.radius,
+                start,
+                sweep,
+                tol,
             )
+            bulges = None
+        wcs = _to_wcs(entity.ocs(), points)
+        if kind == "CIRCLE":
+            wcs[-1] = wcs[0]
+        _add_path(j, wcs, bulges)
+    elif kind == "SPLINE":
+        # ezdxf already subdivides adaptively to a max distance
+        wcs = [Point.from_dxf_vec(v, SCALE_FACTOR) for v in entity.flattening(tol)]
+        if entity.closed and wcs[-1] != wcs[0]:
+            wcs.append(wcs[0])
+        _add_path(j, wcs)
 
-        with keke.kev("Jumble.close_loops"):
-            j.close_loops()
+
+class LoadDxf(LoadStep):
+    # Files larger than this are read with `iterdxf` (one entity at a time)
+    # rather than building a whole ezdxf document.
+    streaming_threshold = 64 << 20
+
+    def __init__(
+        self,
+        streaming: Optional[bool] = None,
+        layers: Optional[Iterable[str]] = None,
+        process: bool = True,
+        chord_tolerance: float = CHORD_TOLERANCE,
+        native_arcs: bool = True,
+        pocket_offsets: Optional[Iterable[float]] = None,
+        join_tolerance: float = 0,
+        **kwargs,
+    ) -> None:
+        """
+        `streaming` forces streaming on or off; the default is to decide based
+        on file size.
+
+        `chord_tolerance` is how far (in microns) the lines that replace arcs,
+        circles and splines can be from the real curve.  Smaller is more
+        accurate, but makes more points for everything downstream.  With
+        `native_arcs` (the default) arcs stay arcs in the loops, which are
+        flattened to this tolerance (`Loop.tolerance`) when needed.
+
+        `join_tolerance` is how far apart (in microns) the ends of two entities
+        can be and still be joined into one loop (`Jumble.tolerance`); the
+        default only joins ends that are exactly the same point.
+
+        `layers` limits loading to entities on those DXF layers.  With
+        `process=False` this only produces `self.jumble` (for `MergeJob` to
+        pick up) rather than going on to `ProcessShapes`, which is otherwise
+        given `pocket_offsets`.
+        """
+        self.streaming = streaming
+        self.layers = frozenset(layers) if layers is not None else None
+        self.process = process
+        self.chord_tolerance = chord_tolerance
+        self.native_arcs = native_arcs
+        self.pocket_offsets = pocket_offsets
+        self.join_tolerance = join_tolerance
+        super().__init__(**kwargs)
+
+    def run(self):
+        with trace.kev("file_digest", filename=str(self._path)):
+            digest = file_digest(self._path)
+        layers = tuple(sorted(self.layers)) if self.layers is not None else None
+        self.jumble = j = self.cached(
+            "jumble",
+            (
+                digest,
+                SCALE_FACTOR,
+                layers,
+                self.chord_tolerance,
+                self.native_arcs,
+                self.join_tolerance,
+            ),
+            self._load,
+        )
+        if not self.process:
+            return
         # N.b. today j only contains "loops" which are easy to get bounds; if
         # fixup transforms to arcs/circles those will be a little more complex
         # to handle.
-        self._status.set_bounds(j.bounds())
-        with keke.kev("Jumble.fixup"):
-            j.fixup()
-        self._next = ProcessShapes(j, key=self._key + (0,), status=self._status)
+        self._status.set_bounds(j.bounds(), self._key)
+        self._next = ProcessShapes(
+            j,
+            previous=self._previous,
+            pocket_offsets=self.pocket_offsets,
+            key=self._key + (0,),
+            status=self._status,
+        )
         self._status.submit(self._next.lifecycle)
 
+    def _entities(self) -> Iterable[DXFGraphic]:
+        """
+        Yields the modelspace entities we know how to load, in file order.
+        """
+        streaming = self.streaming
+        if streaming is None:
+            streaming = os.path.getsize(self._path) > self.streaming_threshold
+
+        if streaming:
+            # Only one entity is in memory at a time
+            yield from iterdxf.modelspace(self._path, types=ENTITY_TYPES)
+        else:
+            with trace.kev("ezdxf.readfile", filename=str(self._path)):
+                e = ezdxf.readfile(self._path)
+            # TODO make sure modelspace is correct
+            yield from e.modelspace().query(" ".join(ENTITY_TYPES))
+
+    def _load(self) -> Jumble:
+        j = Jumble(self.join_tolerance, flatten_tolerance=self.chord_tolerance)
+        with trace.kev("entities", filename=str(self._path)):
+            for entity in self._entities():
+                if self.layers is None or entity.dxf.layer in self.layers:
+                    add_entity(j, entity, self.chord_tolerance, self.native_arcs)
+
+        with trace.kev("Jumble.close_loops"):
+            j.close_loops()
+        with trace.kev("Jumble.fixup"):
+            j.fixup()
+        return j
+
     def preview(self, ctx) -> None:
         # print(ctx.get_matrix())
         for loop in self.jumble.full_loops:
-            ctx.move_to(*loop.points[-1])
-            for p in loop.points:
-                # print(p, ctx.get_matrix().transform_point(*p))
-                ctx.line_to(*p)
-            ctx.close_path()
+            loop.path(ctx)
 
         ctx.set_source_rgb(0.2, 0.2, 0.5)
         ctx.set_line_width(50)
@@ -1,7 +1,7 @@
 from __future__ import annotations
-import keke
 
 from logging import getLogger
+from timcam import trace
 from timcam.base_steps import Step
 from timcam.types import Loop
 
@@ -13,17 +13,51 @@ logger = getLogger(__name__)
 
 
 class ProcessShapes(Step):
-    def __init__(self, jumble, **kwargs) -> None:
+    cost = 50.0
+
+    def __init__(
+        self, jumble, previous=None, pocket_offsets=None, parents=None, **kwargs
+    ) -> None:
+        """
+        `previous` is an optional {key: step} tree from an earlier run; any
+        profile or pocket whose inputs are unchanged is carried over from it
+        (with everything under it) instead of being recomputed.  `run` only
+        sees their fingerprints, and `finish` adopts them, so the tree stays
+        in the parent process.
+
+        `pocket_offsets` is passed to each `PocketStep` as `offsets`.
+
+        `parents` is `jumble.parent_info()`, if the caller already has it.
+        """
         self._jumble = jumble
+        self._parents = parents
+        self._previous = previous or {}
+        self.pocket_offsets = pocket_offsets
         super().__init__(**kwargs)
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("_kept", None)
+        return state
+
+    def prepare(self):
+        # fingerprint -> keys of matching steps in `previous`
+        self._reusable: dict[tuple, list[tuple[int, ...]]] = {}
+        for k, step in sorted(self._previous.items()):
+            if isinstance(step, (ProfileStep, PocketStep)):
+                self._reusable.setdefault(step.fingerprint(), []).append(k)
+        # Kept for `finish`, but not sent to a worker for `run`
+        self._kept, self._previous = self._previous, {}
+
     def run(self):
         # TODO this should obey some sort of config for identification.  Right
         # now, we assume outermost is a profile, next inner is profile [with
         # opposite offset direction] and pocket boundary, and next are islands.
         # And even-odd repeat past there, pocket/island
 
-        parents = self._jumble.parent_info()
+        parents = self._parents
+        if parents is None:
+            parents = self._jumble.parent_info()
 
         self.jobs = jobs = []
         islands: dict[int, tuple[set[int], Loop]] = {}
@@ -55,6 +89,7 @@ class ProcessShapes(Step):
                         PocketStep(
                             self._jumble.full_loops[i],
                             islands=inner_islands,
+                            offsets=self.pocket_offsets,
                             key=self._key + (n,),
                             status=self._status,
                         )
@@ -82,29 +117,46 @@ class ProcessShapes(Step):
 
         assert not islands
 
+        self.reused = []
+        # (old key, new key) for `finish`
+        self._adopt = []
         for j in jobs:
-            self._status.submit(j.lifecycle)
+            old_keys = self._reusable.get(j.fingerprint())
+            if old_keys:
+                self._adopt.append((old_keys.pop(0), j._key))
+                self.reused.append(j._key)
+            else:
+                self._status.submit(j.lifecycle)
+        if self._reusable:
+            logger.info("Reused %d of %d shapes", len(self.reused), len(jobs))
+        self._reusable = None
+
+    def finish(self):
+        for old_key, new_key in self._adopt:
+            n = len(old_key)
+            tree = {k: v for k, v in self._kept.items() if k[:n] == old_key}
+            self._status.adopt(tree, old_key, new_key)
+        self._kept = self._adopt = None
 
     def preview(self, ctx):
         # ctx.set_fill_rule(cairo.FILL_RULE_WINDING)
 
         for j in self.jobs:
             if isinstance(j, ProfileStep):
-                loop = j._outline
-                ctx.move_to(*loop.points[-1])
-                for v in loop.points:
-                    ctx.line_to(*v)
-                with keke.kev("render", cls=j.__class__.__name__):
+                j._outline.path(ctx)
+                with trace.kev(
+                    "render", level=trace.DETAILED, cls=j.__class__.__name__
+                ):
                     ctx.set_source_rgb(0.5, 0.5, 0.5)
                     ctx.set_line_width(50)
                     ctx.stroke()
             elif isinstance(j, PocketStep):
                 for loop in (j._outline, *j._islands):
-                    ctx.move_to(*loop.points[-1])
-                    for v in loop.points:
-                        ctx.line_to(*v)
+                    loop.path(ctx)
 
-                with keke.kev("render", cls=j.__class__.__name__):
+                with trace.kev(
+                    "render", level=trace.DETAILED, cls=j.__class__.__name__
+                ):
                     ctx.set_source_rgb(0.7, 0.7, 0.7)
                     ctx.set_line_width(50)
                     ctx.fill()
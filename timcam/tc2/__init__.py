@@ -4,118 +4,136 @@ import logging
 import sys
 
 import cairo
-import keke
 import pyclipper
 
-from timcam.types import Point, Poly, Voronoi, Loop
+from timcam.types import Poly, Voronoi, Loop
+from timcam import trace
 from timcam.base_steps import Step
+from timcam.draw import path_points
 from timcam.tc3 import SpiralStep, AsymmetricStadiumStep
 
 logger = logging.getLogger(__name__)
 
+TOOL_RADIUS = 2000  # 2mm, in microns
+
 
 class ProfileStep(Step):
     def __init__(self, outline, **kwargs):
         self._outline = outline
         super().__init__(**kwargs)
 
+    def fingerprint(self) -> tuple:
+        """
+        Everything `run` depends on, to match against a previous run.
+        """
+        return (self.__class__.__name__, self._outline.fingerprint(), TOOL_RADIUS)
+
+    def preview_bounds(self):
+        # Outside profiles draw a tool's width beyond the outline
+        x1, x2, y1, y2 = self._outline.bounds()
+        m = 2 * TOOL_RADIUS
+        return (x1 - m, x2 + m, y1 - m, y2 + m)
+
     def run(self):
+        self._offset_outlines = self.cached(
+            "offset", (self._outline, TOOL_RADIUS), self._offset
+        )
+
+    def _offset(self):
         pc = pyclipper.PyclipperOffset()
         # TODO JT_ROUND and resulting arcs
         pc.AddPath(
-            self._outline.points, pyclipper.JT_SQUARE, pyclipper.ET_CLOSEDPOLYGON
+            self._outline.flattened().coords,
+            pyclipper.JT_SQUARE,
+            pyclipper.ET_CLOSEDPOLYGON,
         )
         # Pyclipper considers offset to be irrespective of polygon winding
         # order, so we negate when necessary here to offset "outside" or
         # "inside"
-        with keke.kev("pyclipper"):
+        with trace.kev("pyclipper"):
             if self._outline.direction() < 0:
-                self._offset_outlines = pc.Execute(-2000)  # 2mm
+                return pc.Execute(-TOOL_RADIUS)
             else:
-                self._offset_outlines = pc.Execute(2000)  # 2mm
+                return pc.Execute(TOOL_RADIUS)
 
     def preview(self, ctx):
         # border
-        pts = self._outline.points
-        ctx.move_to(*pts[-1])
-        for v in pts:
-            ctx.line_to(*v)
-        ctx.close_path()
+        self._outline.path(ctx)
         ctx.set_source_rgb(0.5, 0.5, 0.5)
         ctx.set_line_width(50)
         ctx.stroke()
 
         # cut width
         for pts in self._offset_outlines:
-            ctx.move_to(*pts[-1])
-            for v in pts:
-                ctx.line_to(*v)
-            ctx.close_path()
+            path_points(ctx, pts, close=True)
         ctx.set_source_rgb(0, 0, 0.5)
         ctx.set_line_width(4000)  # 4mm
         ctx.set_line_join(cairo.LineJoin.ROUND)
         ctx.stroke()
         # cut center
         for pts in self._offset_outlines:
-            ctx.move_to(*pts[-1])
-            for v in pts:
-                ctx.line_to(*v)
-            ctx.close_path()
+            path_points(ctx, pts, close=True)
         ctx.set_source_rgb(0, 0, 0)
         ctx.set_line_width(50)
         ctx.stroke()
 
 
 class PocketStep(Step):
-    def __init__(self, outline, islands, **kwargs):
+    # Voronoi, then lots of children
+    cost = 20.0
+
+    def __init__(self, outline, islands, path_threshold=500.0, offsets=None, **kwargs):
+        """
+        `offsets`, if given, are amounts of stock to leave (in microns, beyond
+        the tool radius) for several passes over this pocket, for example
+        `(1000, 0)` for roughing then finishing.  In that mode one Voronoi
+        diagram of the pocket itself is trimmed to each radius, rather than
+        building one per offset outline.
+        """
         self._outline = outline
         self._islands = islands
+        self.path_threshold = path_threshold
+        self.offsets = tuple(offsets) if offsets is not None else None
         super().__init__(**kwargs)
 
-    def run(self):
-        # TODO why am I passing around these two things rather than just storing
-        # a poly on self?
-        pc = pyclipper.PyclipperOffset()
-        # TODO JT_ROUND and resulting arcs
-        pc.AddPath(
-            self._outline.points, pyclipper.JT_SQUARE, pyclipper.ET_CLOSEDPOLYGON
+    def fingerprint(self) -> tuple:
+        """
+        Everything `run` depends on, to match against a previous run.
+        """
+        return (
+            self.__class__.__name__,
+            self._outline.fingerprint(),
+            tuple(sorted(i.fingerprint() for i in self._islands)),
+            TOOL_RADIUS,
+            self.path_threshold,
+            self.offsets,
         )
-        # Pyclipper considers offset to be irrespective of polygon winding
-        # order, so we negate when necessary here to offset "outside" or
-        # "inside"
-        with keke.kev("pyclipper"):
-            if self._outline.direction() < 0:
-                self._offset_outlines = pc.Execute(-2000)  # 2mm
-            else:
-                self._offset_outlines = pc.Execute(2000)  # 2mm
 
-        pc.Clear()
-        for isl in self._islands:
-            pc.AddPath(isl.points, pyclipper.JT_SQUARE, pyclipper.ET_CLOSEDPOLYGON)
+    def preview_bounds(self):
+        return self._outline.bounds()
 
-        if self._outline.direction() < 0:
-            self._offset_islands = pc.Execute(2000)  # 2mm
-        else:
-            self._offset_islands = pc.Execute(-2000)  # 2mm
-
-        with keke.kev("pyvoronoi"):
-            self.vors = [
-                Voronoi(
-                    Poly(
-                        Loop([Point(*i) for i in x]),
-                        [Loop([Point(*i) for i in y]) for y in self._offset_islands],
-                    )
-                )
-                for x in self._offset_outlines
-            ]
+    def run(self):
+        (
+            self._offset_outlines,
+            self._offset_islands,
+            self.vors,
+            self.dags,
+        ) = self.cached(
+            "plan",
+            (
+                self._outline,
+                self._islands,
+                TOOL_RADIUS,
+                self.path_threshold,
+                self.offsets,
+            ),
+            self._plan if self.offsets is None else self._plan_offsets,
+        )
 
-        with keke.kev("traverse"):
+        with trace.kev("traverse"):
             jobs = []
             n = 0
-            self.dags = []
-            for vor in self.vors:
-                dag = vor.dag()
-                self.dags.append(dag)
+            for dag in self.dags:
                 jobs.append(
                     SpiralStep(
                         dag.start_pt,
@@ -141,13 +159,86 @@ class PocketStep(Step):
         for j in jobs:
             self._status.submit(j.lifecycle)
 
+    def _plan(self):
+        """
+        Returns (offset outlines, offset islands, voronois, dags)
+        """
+        # TODO why am I passing around these two things rather than just storing
+        # a poly on self?
+        offset_outlines, offset_islands = self._offset(TOOL_RADIUS)
+
+        with trace.kev("pyvoronoi"):
+            islands = [Loop(y) for y in offset_islands]
+            vors = [Voronoi(Poly(Loop(x), islands)) for x in offset_outlines]
+
+        with trace.kev("dag"):
+            dags = [vor.dag(self.path_threshold) for vor in vors]
+
+        return offset_outlines, offset_islands, vors, dags
+
+    def _offset(self, distance, join=pyclipper.JT_SQUARE):
+        """
+        Returns (offset outlines, offset islands) from pyclipper, shrinking the
+        pocket by `distance`.  With `join=pyclipper.JT_ROUND` that's the exact
+        offset (to within the outline's `tolerance`), which is what the medial
+        axis trimmed to `distance` follows.
+        """
+        pc = pyclipper.PyclipperOffset()
+        pc.ArcTolerance = self._outline.tolerance
+        # TODO JT_ROUND and resulting arcs
+        pc.AddPath(
+            self._outline.flattened().coords,
+            join,
+            pyclipper.ET_CLOSEDPOLYGON,
+        )
+        # Pyclipper considers offset to be irrespective of polygon winding
+        # order, so we negate when necessary here to offset "outside" or
+        # "inside"
+        with trace.kev("pyclipper"):
+            if self._outline.direction() < 0:
+                offset_outlines = pc.Execute(-distance)
+            else:
+                offset_outlines = pc.Execute(distance)
+
+        pc.Clear()
+        for isl in self._islands:
+            pc.AddPath(isl.flattened().coords, join, pyclipper.ET_CLOSEDPOLYGON)
+
+        if self._outline.direction() < 0:
+            offset_islands = pc.Execute(distance)
+        else:
+            offset_islands = pc.Execute(-distance)
+
+        return offset_outlines, offset_islands
+
+    def _plan_offsets(self):
+        """
+        Like `_plan` but for `offsets`, sharing one Voronoi diagram.
+        """
+        offset_outlines = []
+        offset_islands = []
+        for stock in self.offsets:
+            # Only drawn, so round to match the trimmed dags
+            outlines, islands = self._offset(TOOL_RADIUS + stock, pyclipper.JT_ROUND)
+            offset_outlines.extend(outlines)
+            offset_islands.extend(islands)
+
+        with trace.kev("pyvoronoi"):
+            vor = Voronoi(Poly(self._outline, list(self._islands)))
+
+        with trace.kev("dag"):
+            dags = [
+                dag
+                for stock in self.offsets
+                for dag in vor.dags(self.path_threshold, offset=TOOL_RADIUS + stock)
+            ]
+
+        return offset_outlines, offset_islands, [vor], dags
+
     def preview(self, ctx):
         # cut width
         for pts in self._offset_outlines:
-            ctx.move_to(*pts[-1])
-            for v in pts:
-                ctx.line_to(*v)
-            ctx.close_path()
+            path_points(ctx, pts, close=True)
         ctx.set_source_rgb(0.7, 0.7, 0.7)
         ctx.set_line_width(4000)  # 4mm
         ctx.set_line_join(cairo.LineJoin.ROUND)
@@ -1,19 +1,25 @@
 from __future__ import annotations
 
 import logging
-from math import cos, sin, atan2, pi as PI
+from math import atan2, pi as PI
 
 import cairo
-from keke import ktrace
 
-from timcam.types import Point, VariableWidthPolyline
+from timcam.types import Arc, Point, VariableWidthPolyline
 from timcam.base_steps import Step
+from timcam.draw import decimate, pixel_size
+from timcam.trace import DETAILED, ktrace
 from timcam.algo import outer_tangents
 
 logger = logging.getLogger(__name__)
 
+# For `SpiralStep.pts`, in microns
+SPIRAL_TOLERANCE = 10
+
 
 class DrillStep(Step):
+    cost = 0.1
+
     def __init__(self, pt, r, **kwargs):
         self.pt = pt
         self.r = r
@@ -27,6 +33,8 @@ class DrillStep(Step):
 
 
 class HelixStep(Step):
+    cost = 0.1
+
     def __init__(self, pt, r, **kwargs):
         self.pt = pt
         self.r = r
@@ -40,6 +48,8 @@ class HelixStep(Step):
 
 
 class SpiralStep(Step):
+    cost = 0.5
+
     def __init__(self, pt, r, **kwargs):
         self.pt = pt
         self.r = r
@@ -47,28 +57,54 @@ class SpiralStep(Step):
         self.stepover = 500
         super().__init__(**kwargs)
 
-    @ktrace()
+    @ktrace(level=DETAILED)
     def run(self):
+        # Not worth caching on its own; it's cheaper than reading back a pickle
+        self.arcs = self._spiral()
+
+    def _spiral(self) -> list[Arc]:
+        """
+        An approximately Archimedean spiral out from `pt`, as half circles that
+        alternate between two centers half a stepover apart (so they're
+        tangent where they meet), growing by `stepover` each full turn.
+        """
         rotations = (self.r - self.initial_r) / self.stepover
         # TODO initial helix down
-        self.pts = [self.pt]
-        # frange?
-        # TODO choose initial value for `f` based on where we want the final
-        # part of the spiral to end up...
-        for f in range(int(rotations * 100)):
-            angle = f / 100 * 2 * PI
-            r = self.initial_r + (f / 100) * self.stepover
-            x = cos(angle) * r
-            y = sin(angle) * r
-            self.pts.append(self.pt + Point(x, y))
+        # TODO choose where we want the final part of the spiral to end up...
+        arcs = []
+        for k in range(int(rotations * 2)):
+            arcs.append(
+                Arc(
+                    self.pt if k % 2 == 0 else self.pt + Point(self.stepover / 2, 0),
+                    self.initial_r + k * self.stepover / 2,
+                    0.0 if k % 2 == 0 else PI,
+                    PI,
+                )
+            )
+        return arcs
+
+    @property
+    def pts(self) -> list[Point]:
+        """
+        The path as points, starting from the center.
+        """
+        pts = [self.pt]
+        for i, arc in enumerate(self.arcs):
+            arc_pts = arc.points(SPIRAL_TOLERANCE)
+            # Each arc starts where the previous one ended
+            pts.extend(arc_pts[1:] if i else arc_pts)
+        return pts
+
+    def _path(self, ctx) -> None:
+        ctx.move_to(*self.pt)
+        for arc in self.arcs:
+            arc.path(ctx)
 
     def preview(self, ctx):
         ctx.new_sub_path()
         ctx.set_line_width(4000)
         ctx.set_source_rgb(0.9, 0.9, 0.9)
-        ctx.move_to(*self.pts[0])
-        for pt in self.pts[1:]:
-            ctx.line_to(*pt)
+        self._path(ctx)
         ctx.stroke()
 
         ctx.new_sub_path()
@@ -76,21 +112,22 @@ class SpiralStep(Step):
         ctx.set_source_rgb(0, 1, 0)
         # ctx.arc(*self.pt, self.r, 0, PI * 2)
         # ctx.fill()
-        ctx.move_to(*self.pts[0])
-        for pt in self.pts[1:]:
-            ctx.line_to(*pt)
+        self._path(ctx)
         ctx.stroke()
 
 
 class AsymmetricStadiumStep(Step):
+    cost = 0.1
+
     def __init__(self, line, **kwargs):
         self.line = line
         self.discretized = None
+        self.stepover = 500  # TODO: magic number
         super().__init__(**kwargs)
 
     def run(self) -> None:
         assert self.discretized is None
-        self.discretized = list(self.line.iter_width_along(500))  # TODO: magic number
+        self.discretized = list(self.line.iter_width_along(self.stepover))
 
     def approximate_length(self):
         # TODO move this up into traverse?
@@ -115,7 +152,13 @@ class AsymmetricStadiumStep(Step):
         # TODO rounded cap
         ctx.set_source_rgb(0.2, 0.2, 0.2)
         ctx.set_line_width(4000)
-        for x in self.discretized[1:]:
+        # Arcs whose centers are in the same pixel look the same (the radius
+        # can't change faster than the center moves)
+        rest = self.discretized[1:]
+        rest = [
+            rest[i] for i in decimate([tuple(x.point) for x in rest], pixel_size(ctx))
+        ]
+        for x in rest:
             ctx.new_sub_path()
             ctx.arc(*x.point, x.radius, x.theta - x.phi, x.theta + x.phi)
         ctx.stroke()
@@ -123,7 +166,7 @@ class AsymmetricStadiumStep(Step):
         # wide (cutter) path
         ctx.set_source_rgb(0, 1, 0)
         ctx.set_line_width(50)
-        for x in self.discretized[1:]:
+        for x in rest:
             ctx.new_sub_path()
             ctx.arc(*x.point, x.radius, x.theta - x.phi, x.theta + x.phi)
         ctx.stroke()
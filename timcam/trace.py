@@ -0,0 +1,116 @@
+"""
+Thin layer over keke with trace levels, so the spans around per-edge and
+per-step work cost nothing unless they're asked for.
+
+The level comes from the `TIMCAM_TRACE` environment variable (`off`, `stage`
+or `detailed`; `stage` by default) and is fixed when this is first imported,
+because `ktrace` decides at decoration time whether to wrap at all.  Call
+`set_level` before importing the rest of timcam to choose it in code.
+
+High-frequency events are better counted with `count` than traced one by one;
+the totals go in the trace as counter events when `output` finishes.  Counts
+made in worker processes are sent back with each step's results (see
+`take_counts`).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import IO, Any, Callable, Iterator
+
+import keke
+
+OFF = 0
+# Loading, planning and rendering phases, and one span per step
+STAGE = 1
+# Anything per edge, per preview, or inside pyvoronoi
+DETAILED = 2
+
+LEVELS = {"off": OFF, "stage": STAGE, "detailed": DETAILED}
+
+LEVEL = LEVELS[os.environ.get("TIMCAM_TRACE", "stage").lower()]
+
+_NULL = nullcontext()
+
+_counts: Counter[str] = Counter()
+_counts_lock = threading.Lock()
+
+
+def set_level(level: int) -> None:
+    """
+    Changes the level for `kev` and `count` from now on, and for `ktrace` on
+    functions defined from now on.
+    """
+    global LEVEL
+    LEVEL = level
+
+
+def ktrace(*args: str, level: int = STAGE, **kwargs) -> Callable:
+    """
+    `keke.ktrace`, or (below `level`) a decorator that returns the function
+    unchanged.
+    """
+    if LEVEL < level:
+        return lambda func: func
+    return keke.ktrace(*args, **kwargs)
+
+
+def kev(name: str, level: int = STAGE, **kwargs: Any):
+    """
+    `keke.kev`, or (below `level`) a context manager that does nothing.
+    """
+    if LEVEL < level:
+        return _NULL
+    return keke.kev(name, **kwargs)
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Adds `n` to a running total, written once as a counter event rather than
+    an event per call.  Callers in tight loops should add up locally and call
+    this once.
+    """
+    if LEVEL >= STAGE:
+        with _counts_lock:
+            _counts[name] += n
+
+
+def take_counts() -> dict[str, int]:
+    """
+    Returns the totals from `count` so far and starts again from zero, so a
+    worker process can pass what one step counted back to the parent (which
+    adds them with `count`).
+    """
+    global _counts
+    with _counts_lock:
+        totals, _counts = _counts, Counter()
+    return dict(totals)
+
+
+def emit_counts() -> None:
+    """
+    Writes the current totals from `count` to the trace (if there is one).
+    """
+    with _counts_lock:
+        totals = sorted(_counts.items())
+    for name, value in totals:
+        keke.kcount(name, value)
+
+
+@contextmanager
+def output(file: IO[str]) -> Iterator[None]:
+    """
+    Like `keke.TraceOutput(file=file)`, also writing the `count` totals at the
+    end.  Doesn't trace anything at level `OFF`.
+    """
+    if LEVEL == OFF:
+        yield
+        return
+    with keke.TraceOutput(file=file):
+        try:
+            yield
+        finally:
+            emit_counts()
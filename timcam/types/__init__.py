@@ -1,9 +1,11 @@
+from .arc import Arc
 from .poly import Poly, Loop, Jumble
 from .point import Point
 from .voronoi import Voronoi
 from .line import VariableWidthPolyline
 
 __all__ = [
+    "Arc",
     "Poly",
     "Loop",
     "Jumble",
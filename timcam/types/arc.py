@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from math import cos, sin
+
+from ..algo import arc_points
+from .point import Point
+
+
+@dataclass(frozen=True)
+class Arc:
+    """
+    A circular arc of toolpath (what would be a G2/G3 move), counterclockwise
+    for positive `sweep`.  Angles are in radians.
+    """
+
+    center: Point
+    radius: float
+    start_angle: float
+    sweep: float
+
+    def start_point(self) -> Point:
+        return self.center + Point(
+            cos(self.start_angle) * self.radius, sin(self.start_angle) * self.radius
+        )
+
+    def end_point(self) -> Point:
+        end = self.start_angle + self.sweep
+        return self.center + Point(cos(end) * self.radius, sin(end) * self.radius)
+
+    def points(self, tolerance: float) -> list[Point]:
+        """
+        Points along the arc, including both ends, within `tolerance` of it.
+        """
+        return [
+            Point(x, y)
+            for x, y in arc_points(
+                (self.center.x, self.center.y),
+                self.radius,
+                self.start_angle,
+                self.sweep,
+                tolerance,
+            )
+        ]
+
+    def path(self, ctx) -> None:
+        """
+        Continue a cairo path along this arc (with a line to its start, if
+        that isn't the current point).
+        """
+        end = self.start_angle + self.sweep
+        if self.sweep > 0:
+            ctx.arc(*self.center, self.radius, self.start_angle, end)
+        else:
+            ctx.arc_negative(*self.center, self.radius, self.start_angle, end)
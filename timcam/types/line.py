@@ -139,24 +139,39 @@ class VariableWidthPolyline:
         # First point doesn't list angles yet
         yield IterWidthPoint(prev.point, prev.radius, None, None, None, None)
 
+        # The arithmetic is on plain floats (the same operations `Point` would
+        # do), only making `Point`s for what's yielded.
         for each in it:
             assert remainder < stepover
 
             length = each.length
             left = length
-            unit = (each.point - prev.point).norm()
-            pt = prev.point
+            px, py = prev.point
+            dx = each.point.x - px
+            dy = each.point.y - py
+            d = (dx**2 + dy**2) ** 0.5
+            ux = dx / d
+            uy = dy / d
             dr = prev.radius - each.radius  # this is "backwards" on purpose
             left_intersect_vector = Point.from_angle(each.theta + each.phi)
             right_intersect_vector = Point.from_angle(each.theta - each.phi)
+            lx, ly = left_intersect_vector
+            rx, ry = right_intersect_vector
 
             while (remainder + left) >= stepover:
-                pt += unit * (stepover - remainder)
-                left -= stepover - remainder
+                step = stepover - remainder
+                px += ux * step
+                py += uy * step
+                left -= step
                 r = (left / length) * dr + each.radius
-                i1 = pt + left_intersect_vector * r
-                i2 = pt + right_intersect_vector * r
-                yield IterWidthPoint(pt, r, each.theta, each.phi, i1, i2)
+                yield IterWidthPoint(
+                    Point(px, py),
+                    r,
+                    each.theta,
+                    each.phi,
+                    Point(px + lx * r, py + ly * r),
+                    Point(px + rx * r, py + ry * r),
+                )
                 remainder = 0.0
             remainder = left
             prev = each
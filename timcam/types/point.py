@@ -17,14 +17,17 @@ class Point:
         self.x = x
         self.y = y
 
+    # The arithmetic here is on some hot paths; the `__class__ is Point` test
+    # is cheaper than `isinstance` in the common case.
+
     def __add__(self, other: Any) -> Point:
-        if not isinstance(other, Point):
-            other = Point(other)
+        if other.__class__ is not Point and not isinstance(other, Point):
+            other = Point(*other)
         return self.__class__(self.x + other.x, self.y + other.y)
 
     def __sub__(self, other: Any) -> Point:
-        if not isinstance(other, Point):
-            other = Point(other)
+        if other.__class__ is not Point and not isinstance(other, Point):
+            other = Point(*other)
         return self.__class__(self.x - other.x, self.y - other.y)
 
     def __mul__(self, other: float) -> Point:
@@ -41,14 +44,19 @@ class Point:
 
     @classmethod
     def from_dxf_vec(cls, vec, scale_factor) -> Point:
-        # TODO int(round(...))?
-        return cls(int(vec.x * scale_factor), int(vec.y * scale_factor))
+        # Rounded rather than truncated, so that (for example) a computed arc
+        # end at 4.3499999 still meets a line that ends at 4.35
+        return cls(round(vec.x * scale_factor), round(vec.y * scale_factor))
 
     @classmethod
     def from_pyvoronoi_vec(cls, vec) -> Point:
         return cls(vec.X, vec.Y)
 
     def __eq__(self, other):
+        # Exact (and consistent with `__hash__`) for the integer coordinates
+        # most points have; floats get a little slack.
+        if self.x == other.x and self.y == other.y:
+            return True
         return abs(self.x - other.x) < EPSILON and abs(self.y - other.y) < EPSILON
 
     def __hash__(self):
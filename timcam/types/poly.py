@@ -1,9 +1,17 @@
 from __future__ import annotations
 
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass
+from itertools import chain
 from logging import getLogger
+from math import floor
+
+import numpy as np
 
 from .point import Point
-from ..algo import E, lines
+from ..algo import bulge_arc, bulge_points, dedupe_run, lines, sleeve_simplify
+from ..draw import path_points
 
 from typing import Optional
 
@@ -12,30 +20,114 @@ logger = getLogger(__name__)
 EVEN_ODD = 0
 POCKET_ALL = 1
 
+# Upper bound on (point, edge) pairs evaluated at once by `winding_of_many`,
+# to keep temporary arrays to a few tens of MB.
+BATCH_ELEMENTS = 1 << 20
+
+# Default `Loop.tolerance`, in the same units as the points (typically
+# microns).  Kept tight so that the lines can be fit back to arcs later.
+FLATTEN_TOLERANCE = 5
+
+# Default for `Jumble.fixup`, in microns.
+FIXUP_TOLERANCE = 1
+
+
+class PointView(Sequence):
+    """
+    Read-only sequence of `Point` over an (N, 2) coordinate array, creating
+    `Point` objects only on demand.
+    """
+
+    __slots__ = ("_coords",)
+
+    def __init__(self, coords: np.ndarray) -> None:
+        self._coords = coords
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Point(x, y) for x, y in self._coords[i].tolist()]
+        x, y = self._coords[i].tolist()
+        return Point(x, y)
 
-def _min_idx(it):
-    m_idx = -1
-    m_value = None
-    for i, v in enumerate(it):
-        if m_value is None or v < m_value:
-            m_idx = i
-            m_value = v
-    return m_idx
+    def __iter__(self):
+        for x, y in self._coords.tolist():
+            yield Point(x, y)
+
+
+def _as_coords(points) -> np.ndarray:
+    if isinstance(points, np.ndarray):
+        a = points if points.ndim == 2 else points.reshape(-1, 2)
+    else:
+        # Accepts Points, tuples, or pyclipper's lists
+        a = np.fromiter(chain.from_iterable(points), dtype=np.float64).reshape(-1, 2)
+    if a.dtype != np.int64:
+        a = np.rint(a).astype(np.int64)
+    return np.ascontiguousarray(a)
 
 
 class Loop:
     """
-    Simple 2D closed polygon class using (integer) Point coordinates.
+    Simple 2D closed polygon class using integer coordinates.
 
     Widely assumed by other code to be simple (non-self-intersecting), and in
     the "correct" order, but not necessarily convex.
+
+    Coordinates are stored as a contiguous (N, 2) int64 array in `coords`, which
+    can be handed to pyclipper or numpy as-is; `points` is a view that creates
+    `Point` objects on demand.
+
+    Segments can be arcs: `bulges` is either None (all straight) or a float
+    array with, for each vertex, the DXF-style bulge (tan(sweep / 4), positive
+    is counterclockwise) of the segment that starts there.  Geometric queries
+    use `flattened`, and `coords` of a loop with arcs is only its vertices; use
+    `flattened().coords` for anything that only understands polygons.
+    `tolerance` is how far `flattened` can stray from the arcs (the loader's
+    chord tolerance, for loops from a file).
     """
 
-    __slots__ = ("points",)
-    points: list[Point]
+    __slots__ = ("_flat", "bulges", "coords", "tolerance")
+    coords: np.ndarray
+    bulges: Optional[np.ndarray]
 
-    def __init__(self, points=()):
-        self.points = list(points)
+    def __init__(self, points=(), bulges=None, tolerance: float = FLATTEN_TOLERANCE):
+        self.coords = _as_coords(points)
+        if bulges is not None:
+            bulges = np.asarray(bulges, dtype=np.float64)
+            if not bulges.any():
+                bulges = None
+        self.bulges = bulges
+        self.tolerance = tolerance
+        self._flat: Optional[Loop] = None
+
+    @property
+    def points(self) -> PointView:
+        return PointView(self.coords)
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def flattened(self, tolerance: Optional[float] = None) -> Loop:
+        """
+        This loop with arcs replaced by lines within `tolerance` (by default
+        `self.tolerance`) of them, or `self` if there aren't any arcs.
+        """
+        if self.bulges is None:
+            return self
+        if tolerance is None:
+            tolerance = self.tolerance
+        if tolerance == self.tolerance and self._flat is not None:
+            return self._flat
+        c = self.coords.tolist()
+        pts = []
+        for p1, p2, bulge in zip(c, c[1:] + c[:1], self.bulges.tolist()):
+            pts.extend(bulge_points(tuple(p1), tuple(p2), bulge, tolerance)[:-1])
+        flat = Loop(pts)
+        if tolerance == self.tolerance:
+            self._flat = flat
+        return flat
 
     def winding_of(self, pt: Point) -> int:
         """
@@ -44,35 +136,138 @@ class Loop:
         Returns 0 iif the point is outside.
         """
         count = 0
-        for v1, v2 in lines(self.points):
-            if v1.y <= pt.y:
-                if v2.y > pt.y:
-                    if E(v1, v2, pt) > 0:
+        x, y = pt.x, pt.y
+        c = self.flattened().coords.tolist()
+        # This is `E` inlined, on tuples
+        for (x1, y1), (x2, y2) in zip(c, c[1:] + c[:1]):
+            if y1 <= y:
+                if y2 > y:
+                    if (x2 - x1) * (y - y1) - (x - x1) * (y2 - y1) > 0:
                         count += 1
             else:
-                if v2.y <= pt.y:
-                    if E(v1, v2, pt) < 0:
+                if y2 <= y:
+                    if (x2 - x1) * (y - y1) - (x - x1) * (y2 - y1) < 0:
                         count -= 1
         return count
 
+    def winding_of_many(self, pts) -> np.ndarray:
+        """
+        Vectorized `winding_of` for an (N, 2) array-like of points.
+
+        Returns an int array of N winding numbers.  The points are sorted by
+        y, so each edge is only tested against the ones level with it.
+        """
+        pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(pts[:, 1], kind="stable")
+        px = pts[order, 0]
+        py = pts[order, 1]
+        v1 = self.flattened().coords.astype(np.float64)
+        v2 = np.roll(v1, -1, axis=0)
+        x1, y1 = v1.T
+        x2, y2 = v2.T
+        # Edges only count for points with y1 <= y < y2 (going up) or
+        # y2 <= y < y1 (going down), which are a contiguous run of `py`
+        lo = np.searchsorted(py, np.minimum(y1, y2))
+        n = np.searchsorted(py, np.maximum(y1, y2)) - lo
+        ends = np.cumsum(n)
+        starts = ends - n
+
+        count = np.zeros(len(pts), dtype=np.int64)
+        i = 0
+        while i < len(v1):
+            # At least one edge per batch, however many points it has
+            j = max(
+                i + 1, int(np.searchsorted(ends, starts[i] + BATCH_ELEMENTS, "right"))
+            )
+            edge = np.repeat(np.arange(i, j), n[i:j])
+            pt = lo[edge] + np.arange(len(edge)) - (starts[edge] - starts[i])
+            # Same as `E` but for all (point, edge) pairs in the batch
+            ex, ey = x1[edge], y1[edge]
+            dx, dy = x2[edge] - ex, y2[edge] - ey
+            e = dx * (py[pt] - ey) - (px[pt] - ex) * dy
+            delta = np.where(dy > 0, e > 0, -(e < 0).astype(np.int64))
+            count += np.bincount(pt, weights=delta, minlength=len(pts)).astype(np.int64)
+            i = j
+        result = np.empty_like(count)
+        result[order] = count
+        return result
+
     def __contains__(self, pt: Point) -> bool:
         return self.winding_of(pt) != 0
 
+    def _min_idx(self) -> int:
+        # Lowest x, then lowest y
+        return int(np.lexsort((self.coords[:, 1], self.coords[:, 0]))[0])
+
+    def fingerprint(self) -> bytes:
+        """
+        Bytes that are equal for loops with the same vertices (and arcs, and
+        the tolerance they're flattened to) in the same order and direction,
+        regardless of which vertex comes first.
+        """
+        i = self._min_idx()
+        b = np.roll(self.coords, -i, axis=0).tobytes()
+        if self.bulges is not None:
+            b += np.roll(self.bulges, -i).tobytes()
+            b += np.float64(self.tolerance).tobytes()
+        return b
+
     def direction(self) -> int:
-        bi = _min_idx(self.points)
-        ai = (bi - 1) % len(self.points)
-        ci = (bi + 1) % len(self.points)
-        a = self.points[ai]
-        b = self.points[bi]
-        c = self.points[ci]
-        det = (b.x - a.x) * (c.y - a.y) - (c.x - a.x) * (b.y - a.y)
+        if self.bulges is not None:
+            return self.flattened().direction()
+        n = len(self.coords)
+        bi = self._min_idx()
+        (ax, ay), (bx, by), (cx, cy) = self.coords[
+            [(bi - 1) % n, bi, (bi + 1) % n]
+        ].tolist()
+        det = (bx - ax) * (cy - ay) - (cx - ax) * (by - ay)
         return det
 
+    def bounds(self) -> tuple[int, int, int, int]:
+        coords = self.flattened().coords
+        (min_x, min_y), (max_x, max_y) = (
+            coords.min(axis=0).tolist(),
+            coords.max(axis=0).tolist(),
+        )
+        return (min_x, max_x, min_y, max_y)
+
+    def segments(self) -> list[list[list[int]]]:
+        """
+        Returns [[x1, y1], [x2, y2]] for each edge (of the flattened loop),
+        which is the form pyvoronoi wants.
+        """
+        coords = self.flattened().coords
+        return np.stack([coords, np.roll(coords, -1, axis=0)], 1).tolist()
+
+    def path(self, ctx) -> None:
+        """
+        Add this loop to a cairo context's path as a closed sub-path, without
+        stroking or filling.  Arcs are drawn as arcs; runs of lines within a
+        pixel are drawn as one.
+        """
+        if self.bulges is None:
+            path_points(ctx, self.coords, close=True)
+        else:
+            c = self.coords.tolist()
+            ctx.move_to(*c[-1])
+            b = self.bulges.tolist()
+            # Segment into vertex i starts at vertex i-1
+            for p1, p2, bulge in zip(c[-1:] + c[:-1], c, b[-1:] + b[:-1]):
+                if bulge == 0:
+                    ctx.line_to(*p2)
+                    continue
+                (cx, cy), r, start, sweep = bulge_arc(p1, p2, bulge)
+                if sweep > 0:
+                    ctx.arc(cx, cy, r, start, start + sweep)
+                else:
+                    ctx.arc_negative(cx, cy, r, start, start + sweep)
+            ctx.close_path()
+
     def line_iter(self):
-        yield from lines(self.points)
+        yield from lines(self.flattened().points)
 
     def point_iter(self):
-        yield from self.points
+        yield from self.flattened().points
 
 
 class Poly:
@@ -86,7 +281,7 @@ class Poly:
     def __repr__(self) -> str:
         return "%s(outline=%d points, holes=%d loops)" % (
             self.__class__.__name__,
-            len(self.outline.points),
+            len(self.outline),
             len(self.holes),
         )
 
@@ -98,6 +293,19 @@ class Poly:
                 return False
         return True
 
+    def contains_many(self, pts) -> np.ndarray:
+        """
+        Vectorized `__contains__` for an (N, 2) array-like of points.
+
+        Returns a bool array; holes are only tested against points that are
+        still inside.
+        """
+        pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+        result = self.outline.winding_of_many(pts) != 0
+        for hole in self.holes:
+            result[result] = hole.winding_of_many(pts[result]) == 0
+        return result
+
     def loop_iter(self):
         r"""
         /!\ Order is subject to change
@@ -113,6 +321,14 @@ class Poly:
         for loop in self.loop_iter():
             yield from loop.line_iter()
 
+    def segments(self) -> list[list[list[int]]]:
+        r"""
+        Like `line_iter` but as lists, in the form pyvoronoi wants.
+
+        /!\ Order is subject to change, and does not contain segment connectivity.
+        """
+        return [seg for loop in self.loop_iter() for seg in loop.segments()]
+
     def point_iter(self):
         r"""
         /!\ Order is subject to change, and does not contain segment connectivity.
@@ -121,84 +337,362 @@ class Poly:
             yield from loop.point_iter()
 
 
+class _Chain:
+    """
+    An open run of points being assembled by `Jumble.add_line`, which can grow
+    from either end.
+    """
+
+    __slots__ = ("bulges", "closing", "points", "seq")
+
+    def __init__(self, points, bulges, seq: int) -> None:
+        self.points = deque(points)
+        # One per segment, from points[i] to points[i + 1]
+        self.bulges = deque(bulges)
+        # For the segment from points[-1] back to points[0], once closed
+        self.closing = 0.0
+        # Order of the first segment, so loops come out in file order
+        self.seq = seq
+
+
 class Jumble:
-    def __init__(self):
+    def __init__(self, tolerance: int = 0, flatten_tolerance=FLATTEN_TOLERANCE):
+        """
+        `tolerance` is the distance (in the same units as the points, typically
+        microns) under which two endpoints are considered the same point.  The
+        default of zero requires exact matches.
+
+        `flatten_tolerance` is the `Loop.tolerance` of the loops it makes.
+        """
+        self.tolerance = tolerance
+        self.flatten_tolerance = flatten_tolerance
         self.partial_loops = []
         self.full_loops: list[Loop] = []
+        # endpoint key -> open chains that start or end there
+        self._ends: dict[tuple, list[_Chain]] = {}
+        self._closed: list[_Chain] = []
+        self._seq = 0
+        self.fixup_stats: Optional[FixupStats] = None
+
+    def _key(self, pt: Point) -> tuple:
+        if self.tolerance:
+            return (floor(pt.x / self.tolerance), floor(pt.y / self.tolerance))
+        return (pt.x, pt.y)
+
+    def _keys_near(self, pt: Point):
+        if self.tolerance:
+            kx, ky = self._key(pt)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    yield (kx + dx, ky + dy)
+        else:
+            yield (pt.x, pt.y)
+
+    def _same(self, a: Point, b: Point) -> bool:
+        if self.tolerance:
+            return (a - b).length_sq() <= self.tolerance**2
+        return a == b
+
+    def _register(self, pt: Point, chain: _Chain) -> None:
+        self._ends.setdefault(self._key(pt), []).append(chain)
+
+    def _unregister(self, pt: Point, chain: _Chain) -> None:
+        key = self._key(pt)
+        chains = self._ends[key]
+        chains.remove(chain)
+        if not chains:
+            del self._ends[key]
+
+    def _take(self, pt: Point) -> tuple[Optional[_Chain], bool]:
+        """
+        Find (and unregister) an open chain with an endpoint at `pt`.
+
+        Returns the chain and whether `pt` is at its end (rather than start).
+        """
+        for key in self._keys_near(pt):
+            chains = self._ends.get(key)
+            if not chains:
+                continue
+            for i, c in enumerate(chains):
+                if self._same(c.points[-1], pt):
+                    at_end = True
+                elif self._same(c.points[0], pt):
+                    at_end = False
+                else:
+                    continue
+                del chains[i]
+                if not chains:
+                    del self._ends[key]
+                return c, at_end
+        return None, False
 
     def add_line(self, pt1, pt2):
         """
         Add one line segment, potentially adding to an existing partial loop.
 
-        Promotion to full loops is done at the end.  Correctness is preserved
-        even if segments from multiple loops are interleaved, but it is less
-        performant to have lots of partial loops sitting around.
+        Segments are joined as they arrive using an index of open endpoints, so
+        this is constant time regardless of how many partial loops are sitting
+        around, and segments may be in either direction.  Promotion to full
+        loops is done at the end.
+        """
+        self.add_arc(pt1, pt2, 0.0)
+
+    def add_arc(self, pt1, pt2, bulge: float):
+        """
+        Like `add_line`, but the segment is an arc from `pt1` to `pt2` with the
+        given DXF-style bulge (tan(sweep / 4), positive is counterclockwise).
+
+        An end within `tolerance` of an open chain's endpoint is snapped to
+        that endpoint: the segment starts or ends at the point that's already
+        there, and `pt1`/`pt2` itself isn't kept, so loops close exactly.
         """
-        for p in self.partial_loops:
-            if p[-1] == pt1:
-                p.append(pt2)
-                break
+        if self._same(pt1, pt2):
+            return
+
+        c1, at_end1 = self._take(pt1)
+        c2, at_end2 = self._take(pt2)
+
+        if c1 is None and c2 is None:
+            c = _Chain((pt1, pt2), (bulge,), self._seq)
+            self._seq += 1
+            self._register(pt1, c)
+            self._register(pt2, c)
+        elif c2 is None:
+            self._grow(c1, at_end1, pt2, bulge)
+        elif c1 is None:
+            self._grow(c2, at_end2, pt1, -bulge)
+        elif c1 is c2:
+            # Both endpoints of one chain; the segment is implied by closing.
+            c1.closing = bulge if at_end1 else -bulge
+            self._closed.append(c1)
         else:
-            self.partial_loops.insert(0, [pt1, pt2])
+            self._join(c1, at_end1, c2, at_end2, bulge)
+
+    def _grow(self, c: _Chain, at_end: bool, pt: Point, bulge: float) -> None:
+        # `bulge` is for the segment from the chain's end to `pt`
+        if at_end:
+            c.points.append(pt)
+            c.bulges.append(bulge)
+        else:
+            c.points.appendleft(pt)
+            c.bulges.appendleft(-bulge)
+        self._register(pt, c)
+
+    def _join(
+        self, a: _Chain, a_at_end: bool, b: _Chain, b_at_end: bool, bulge: float
+    ) -> None:
+        # `bulge` is for the new segment from a's end to b's end.  Copy the
+        # shorter chain onto the longer one, so that any point is copied
+        # O(log N) times.
+        if len(a.points) < len(b.points):
+            a, a_at_end, b, b_at_end = b, b_at_end, a, a_at_end
+            bulge = -bulge
+
+        far = b.points[0] if b_at_end else b.points[-1]
+        self._unregister(far, b)
+        # Points (and segments) of b, starting at the joined end
+        if b_at_end:
+            run = reversed(b.points)
+            run_bulges = [-i for i in reversed(b.bulges)]
+        else:
+            run = b.points
+            run_bulges = b.bulges
+        if a_at_end:
+            a.points.extend(run)
+            a.bulges.append(bulge)
+            a.bulges.extend(run_bulges)
+        else:
+            # extendleft reverses, so everything is in the other direction
+            a.points.extendleft(run)
+            a.bulges.appendleft(-bulge)
+            a.bulges.extendleft(-i for i in run_bulges)
+        a.seq = min(a.seq, b.seq)
+        self._register(far, a)
 
     def close_loops(self) -> None:
         """
-        Well-behaved input has relatively few loops and no duplicated points, so
-        I'm not concerned about performance here (I think it's N for normal
-        input, or N^3 worst case).
-        """
-        part = self.partial_loops[:]
-        iterations = 0
-        change_made = True
-        while change_made:
-            iterations += 1
-            change_made = False
-            for i in range(len(part) - 1, -1, -1):
-                # Join (doesn't need to check for final item), and order doesn't
-                # matter here because two halves can be joined in either order
-                for j in range(len(part) - 1, i, -1):
-                    if part[i][-1] == part[j][0]:
-                        part[i].extend(part[j][1:])
-                        del part[j]
-                        change_made = True
-
-                # Promote if `i` is now closed
-                if len(part[i]) >= 3 and part[i][0] == part[i][-1]:
-                    part[i].pop(-1)
-                    self.full_loops.append(Loop(part.pop(i)))
-                    # Doesn't set flag, on purpose?
-
-            if iterations > 10:
-                logger.warning(
-                    "Closing loops is taking a while, iteration %d", iterations
+        Promote the chains that closed during `add_line` to full loops (in the
+        order their first segment was added), leaving the rest in
+        `partial_loops`.
+        """
+        for c in sorted(self._closed, key=lambda c: c.seq):
+            if len(c.points) >= 3 or (len(c.points) == 2 and c.closing):
+                self.full_loops.append(
+                    Loop(c.points, (*c.bulges, c.closing), self.flatten_tolerance)
                 )
+            else:
+                logger.warning("Ignoring degenerate loop: %r", list(c.points))
+        self._closed = []
 
-        logger.warning("Closing loops took %d iterations", iterations)
-
+        part = {id(c): c for chains in self._ends.values() for c in chains}
+        part = sorted(part.values(), key=lambda c: c.seq)
         if part:
-            logger.warning("Ignoring leftover partial loops: %r", part)
-        self.partial_loops[:] = part
+            logger.warning(
+                "Ignoring leftover partial loops: %r", [list(c.points) for c in part]
+            )
+        self.partial_loops[:] = [list(c.points) for c in part]
 
     def parent_info(self) -> dict[int, set[int]]:
-        # depth, immediate parent idx
-        inside = {i: set() for i in range(len(self.full_loops))}
-        for i in range(len(self.full_loops)):
-            pt = self.full_loops[i].points[0]  # arbitrarily
-            for j in range(len(self.full_loops)):
-                if i != j:
-                    if pt in self.full_loops[j]:
-                        inside[i].add(j)
-        return inside
+        return containment(self.full_loops)
+
+    def extend(self, other: Jumble) -> None:
+        """
+        Add the already-closed loops (and leftover partial loops) of `other`,
+        for example another file or layer of the same job.
+        """
+        self.full_loops.extend(other.full_loops)
+        self.partial_loops.extend(other.partial_loops)
 
-    def fixup(self) -> None:
-        pass
+    def fixup(self, tolerance: float = FIXUP_TOLERANCE) -> FixupStats:
+        """
+        Simplify `full_loops` in place: remove (near-)duplicate vertices, merge
+        collinear runs, and drop vertices that are within `tolerance` of a
+        straight line through their neighbors.  Vertices at the ends of arcs
+        are kept.  Linear time in the number of vertices.
+
+        The stats are also kept in `fixup_stats`.
+        """
+        stats = FixupStats()
+        for i, loop in enumerate(self.full_loops):
+            stats.loops += 1
+            stats.vertices_before += len(loop)
+            new, dups = _simplify_loop(loop, tolerance)
+            stats.duplicates += dups
+            stats.vertices_after += len(new)
+            self.full_loops[i] = new
+        if stats.removed:
+            logger.info("fixup: %s", stats)
+        self.fixup_stats = stats
+        return stats
 
     def bounds(self) -> tuple[int, int, int, int]:
-        min_x = min(v.x for loop in self.full_loops for v in loop.points)
-        max_x = max(v.x for loop in self.full_loops for v in loop.points)
-        min_y = min(v.y for loop in self.full_loops for v in loop.points)
-        max_y = max(v.y for loop in self.full_loops for v in loop.points)
-        return (min_x, max_x, min_y, max_y)
+        b = [loop.bounds() for loop in self.full_loops]
+        return (
+            min(i[0] for i in b),
+            max(i[1] for i in b),
+            min(i[2] for i in b),
+            max(i[3] for i in b),
+        )
+
+
+@dataclass
+class FixupStats:
+    loops: int = 0
+    vertices_before: int = 0
+    vertices_after: int = 0
+    # Included in `removed`
+    duplicates: int = 0
+
+    @property
+    def removed(self) -> int:
+        return self.vertices_before - self.vertices_after
+
+
+def _simplify_loop(loop: Loop, tolerance: float) -> tuple[Loop, int]:
+    """
+    Returns (simplified loop, number of duplicates removed) for `Jumble.fixup`,
+    or the original loop if simplifying would leave it degenerate.
+    """
+    n = len(loop)
+    c = [tuple(p) for p in loop.coords.tolist()]
+    if loop.bulges is None:
+        b = [0.0] * n
+        # Lowest (x, y) is on the convex hull, so it's a real corner
+        fixed = [loop._min_idx()]
+    else:
+        b = loop.bulges.tolist()
+        fixed = [i for i in range(n) if b[i] or b[i - 1]]
+
+    points: list[tuple[int, int]] = []
+    bulges: list[float] = []
+    dups = 0
+    for start, end in zip(fixed, fixed[1:] + [fixed[0] + n]):
+        if b[start]:
+            # An arc, which only runs to the next vertex (which is fixed too)
+            points.append(c[start])
+            bulges.append(b[start])
+            continue
+        run = [c[i % n] for i in range(start, end + 1)]
+        run, d = dedupe_run(run, tolerance)
+        dups += d
+        run = sleeve_simplify(run, tolerance)
+        points.extend(run[:-1])
+        bulges.extend([0.0] * (len(run) - 1))
+
+    if len(points) < 3 and not any(bulges):
+        return loop, 0
+    if len(points) == n:
+        return loop, 0
+    return Loop(points, bulges, loop.tolerance), dups
+
+
+class _GridIndex:
+    """
+    Uniform grid of bounding boxes, to find the few boxes that contain a point
+    without testing all of them.  Boxes are (min_x, max_x, min_y, max_y) like
+    `Loop.bounds`.
+    """
+
+    def __init__(self, boxes: list[tuple[int, int, int, int]]) -> None:
+        self.boxes = boxes
+        self.min_x = min(b[0] for b in boxes)
+        self.min_y = min(b[2] for b in boxes)
+        w = max(b[1] for b in boxes) - self.min_x
+        h = max(b[3] for b in boxes) - self.min_y
+        # Roughly one box per cell for evenly sized boxes; a box that spans the
+        # whole grid costs one entry per cell, which is still linear.
+        self.n = max(1, int(len(boxes) ** 0.5))
+        self.cell_w = max(w / self.n, 1)
+        self.cell_h = max(h / self.n, 1)
+        self.cells: list[list[list[int]]] = [
+            [[] for _ in range(self.n)] for _ in range(self.n)
+        ]
+        for i, (x0, x1, y0, y1) in enumerate(boxes):
+            for cx in range(self._cx(x0), self._cx(x1) + 1):
+                for cy in range(self._cy(y0), self._cy(y1) + 1):
+                    self.cells[cx][cy].append(i)
+
+    def _cx(self, x) -> int:
+        return min(self.n - 1, max(0, int((x - self.min_x) / self.cell_w)))
+
+    def _cy(self, y) -> int:
+        return min(self.n - 1, max(0, int((y - self.min_y) / self.cell_h)))
+
+    def query(self, pt: Point):
+        """
+        Yields indices of boxes containing `pt` (inclusive of their edges).
+        """
+        for i in self.cells[self._cx(pt.x)][self._cy(pt.y)]:
+            x0, x1, y0, y1 = self.boxes[i]
+            if x0 <= pt.x <= x1 and y0 <= pt.y <= y1:
+                yield i
+
+
+def containment(loops: list[Loop]) -> dict[int, set[int]]:
+    """
+    Returns {loop index: indices of all loops that contain it}, suitable for
+    `toposort`.
+
+    The (relatively expensive) winding test is only done for pairs where the
+    containing loop's bounding box encloses the other loop's bounding box.
+    """
+    inside: dict[int, set[int]] = {i: set() for i in range(len(loops))}
+    if not loops:
+        return inside
+
+    boxes = [loop.bounds() for loop in loops]
+    index = _GridIndex(boxes)
+    for i, loop in enumerate(loops):
+        pt = loop.points[0]  # arbitrarily
+        bi = boxes[i]
+        for j in index.query(pt):
+            if i == j:
+                continue
+            bj = boxes[j]
+            if bj[0] <= bi[0] and bi[1] <= bj[1] and bj[2] <= bi[2] and bi[3] <= bj[3]:
+                if pt in loops[j]:
+                    inside[i].add(j)
+    return inside
 
 
 class Job:
@@ -209,6 +703,27 @@ class Job:
         self.outer = outer
         self.inner = inner
 
+    @classmethod
+    def from_loops(
+        cls, outer: Loop, loops: list[Loop], parents: Optional[dict] = None
+    ) -> Job:
+        """
+        Builds `inner` using even-odd nesting: loops at even depth are
+        outlines, and the loops directly inside them are their holes.
+
+        `parents` is `containment(loops)`, if the caller already has it.
+        """
+        if parents is None:
+            parents = containment(loops)
+        depth = {i: len(p) for i, p in parents.items()}
+        polys = {i: Poly(loops[i], []) for i, d in depth.items() if d % 2 == 0}
+        for i, d in depth.items():
+            if d % 2:
+                # The innermost container is the one with the most parents
+                parent = max(parents[i], key=lambda j: depth[j])
+                polys[parent].holes.append(loops[i])
+        return cls(outer, [polys[i] for i in sorted(polys)])
+
     def __repr__(self):
         return "%s(outer=%s, inner=%s)" % (
             self.__class__.__name__,
@@ -1,18 +1,17 @@
 from __future__ import annotations
 
-import sys
-
-from math import atan2, pi as PI
-from typing import Generator
+from math import atan2, hypot, pi as PI, sqrt
+from typing import Generator, Optional
 
 import cairo
+import numpy as np
 import pyvoronoi
-from keke import ktrace, kev
 
 from .point import Point
 from .poly import Poly
 from .line import Polyline, VariableWidthPolyline
-from ..algo import pt_line_distance, angle_similarity
+from ..draw import path_points, pixel_size
+from ..trace import DETAILED, count, kev, ktrace
 
 INSIDE = 1
 TERMINAL = 2
@@ -31,31 +30,145 @@ class Voronoi:
     """
 
     def __init__(self, poly: Poly) -> None:
+        segments = poly.segments()
+        self._construct(segments)
+        with kev("readback", level=DETAILED):
+            self._readback(poly, np.array(segments, dtype=np.float64).reshape(-1, 2, 2))
+
+    def _construct(self, segments: list) -> None:
         self._raw = pyvoronoi.Pyvoronoi(1)
-        with kev("addsegment"):
-            for line in poly.line_iter():
-                self._raw.AddSegment(line)
-        with kev("construct"):
+        with kev("addsegment", level=DETAILED):
+            for segment in segments:
+                self._raw.AddSegment(segment)
+        with kev("construct", level=DETAILED):
             self._raw.Construct()
 
-        with kev("readback"):
-            self.edge_points = set(poly.point_iter())
-            self.vertex_indices_on_edge: set[int] = set()
-            self.vertex_indices_inside: set[int] = set()
-
-            for i, v in enumerate(self._raw.GetVertices()):
-                pt = Point.from_pyvoronoi_vec(v)
-                if pt in self.edge_points:
-                    self.vertex_indices_on_edge.add(i)
-                elif pt in poly:
-                    self.vertex_indices_inside.add(i)
-
-            # This part can be simplified once there's a fix for
-            # https://github.com/fabanc/pyvoronoi/issues/42
-            self.vertex_outgoing_edges: dict[int, list[int]] = {}
-            for i, e in enumerate(self._raw.GetEdges()):
-                # if e.start not in self.vertex_indices_on_edge and e.start in self.vertex_indices_inside:
-                self.vertex_outgoing_edges.setdefault(e.start, []).append(i)
+    def _readback(self, poly: Poly, segments: np.ndarray) -> None:
+        """
+        Reads everything `dags` needs out of pyvoronoi in one pass over each of
+        vertices, edges and cells, into flat arrays indexed by vertex or edge
+        number, and computes the inscribed radius at both ends of every edge.
+        """
+        vertices = self._raw.GetVertices()
+        self._vertex_xy = np.array(
+            [(v.X, v.Y) for v in vertices], dtype=np.float64
+        ).reshape(-1, 2)
+        edges = np.array(
+            [(e.start, e.end, e.twin, e.cell) for e in self._raw.GetEdges()],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        # start, end vertex (-1 for infinite)
+        self._edge_ends = np.ascontiguousarray(edges[:, :2])
+        self._edge_twin = edges[:, 2].copy()
+        cells = np.array(
+            [
+                (c.site, c.contains_point, c.source_category)
+                for c in self._raw.GetCells()
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+
+        # Each edge's site: either a whole input segment, or one of its ends
+        # (source category 2 is the end point, 1 the start)
+        site, is_point, category = cells[edges[:, 3]].T
+        seg = segments[site]
+        a = seg[:, 0]
+        b = seg[:, 1]
+        site_pt = np.where((category == 2)[:, None], b, a)
+        # What the radius is measured to, for `trim`: the site point twice, or
+        # the segment
+        self._edge_site = np.where(
+            (is_point == 1)[:, None, None], site_pt[:, None, :], seg
+        )
+        self._edge_is_point = is_point == 1
+        # Same arithmetic as `pyvoronoi.Distance` and `pt_line_distance`, so
+        # ties between equal radii break the same way
+        (x1, y1), (x2, y2) = a.T, b.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._edge_rad = np.full((len(edges), 2), np.nan)
+            for k in (0, 1):
+                idx = self._edge_ends[:, k]
+                x0, y0 = (self._vertex_xy[np.maximum(idx, 0)] if len(vertices) else a).T
+                to_pt = np.sqrt((x0 - site_pt[:, 0]) ** 2 + (y0 - site_pt[:, 1]) ** 2)
+                to_line = (
+                    np.abs((y2 - y1) * x0 - (x2 - x1) * y0 + x2 * y1 - y2 * x1)
+                    / ((y2 - y1) ** 2 + (x2 - x1) ** 2) ** 0.5
+                )
+                self._edge_rad[:, k] = np.where(
+                    idx >= 0, np.where(is_point == 1, to_pt, to_line), np.nan
+                )
+        self._edge_min_rad = self._min_radius(site_pt, seg)
+
+        # Vertices that are exactly input points, and ones inside the polygon
+        input_points = set(map(tuple, segments[:, 0].tolist()))
+        self._on_edge = np.fromiter(
+            (tuple(v) in input_points for v in self._vertex_xy.tolist()),
+            dtype=bool,
+            count=len(vertices),
+        )
+        self._inside = poly.contains_many(self._vertex_xy) & ~self._on_edge
+
+        # This part can be simplified once there's a fix for
+        # https://github.com/fabanc/pyvoronoi/issues/42
+        self.vertex_outgoing_edges: dict[int, list[int]] = {}
+        for i, start in enumerate(self._edge_ends[:, 0].tolist()):
+            self.vertex_outgoing_edges.setdefault(start, []).append(i)
+
+    def _min_radius(self, site_pt: np.ndarray, seg: np.ndarray) -> np.ndarray:
+        """
+        The smallest inscribed radius anywhere along each edge.  That's at one
+        end, except when one of the edge's sites is a point: then the edge is
+        a parabola (or, between two points, a straight line) whose radius is
+        smallest at its apex, which can be partway along.
+        """
+        twin = self._edge_twin
+        point = self._edge_is_point
+        other_point = point[twin]
+        # One point site; the other site is a point or a segment
+        p = np.where(point[:, None], site_pt, site_pt[twin])
+        q = np.where(point[:, None], site_pt[twin], site_pt)
+        other_seg = np.where(point[:, None, None], seg[twin], seg)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Between two points: the apex is their midpoint, and the edge
+            # runs across the line through them
+            vx, vy = (q - p).T
+            apart = np.hypot(vx, vy)
+            ux, uy = -vy / apart, vx / apart
+            origin = (p + q) / 2
+            apex_rad = apart / 2
+            # Between a point and a segment: the apex is level with the point
+            # along the segment, half way to it
+            line = other_seg[:, 1] - other_seg[:, 0]
+            length = np.hypot(line[:, 0], line[:, 1])
+            seg_ux, seg_uy = line[:, 0] / length, line[:, 1] / length
+            to_line = np.abs(
+                (p[:, 0] - other_seg[:, 0, 0]) * seg_uy
+                - (p[:, 1] - other_seg[:, 0, 1]) * seg_ux
+            )
+            curved = point != other_point
+            ux = np.where(curved, seg_ux, ux)
+            uy = np.where(curved, seg_uy, uy)
+            origin = np.where(curved[:, None], p, origin)
+            apex_rad = np.where(curved, to_line / 2, apex_rad)
+
+            # How far each end is past the apex, along the edge's axis
+            ends = self._vertex_xy[np.maximum(self._edge_ends, 0)] - origin[:, None]
+            along = ends[:, :, 0] * ux[:, None] + ends[:, :, 1] * uy[:, None]
+            # Ignores ends that are (to rounding) at the apex, as when the
+            # point is one end of the segment, so the edge is straight
+            eps = 1e-9 * (np.abs(origin).sum(axis=1) + 1)
+            through = (point | other_point) & (
+                ((along[:, 0] < -eps) & (along[:, 1] > eps))
+                | ((along[:, 0] > eps) & (along[:, 1] < -eps))
+            )
+        return np.where(through, apex_rad, np.fmin(*self._edge_rad.T))
+
+    def __getstate__(self):
+        # The pyvoronoi object can't be pickled, but everything else (including
+        # what `dags` needs) is in plain arrays.
+        state = self.__dict__.copy()
+        state["_raw"] = None
+        return state
 
     def draw(self, ctx: cairo.Context) -> None:
         """
@@ -65,98 +178,272 @@ class Voronoi:
         1. Only draws curved edges as if they were straight
         2. Does not draw the original input points [do that yourself first]
         3. Does not color code anything
+        4. Leaves out edges that are within one pixel
         """
-        vertices = self._raw.GetVertices()
-        for i, e in enumerate(self._raw.GetEdges()):
-            if e.start != -1 and e.end != -1:
-                ctx.move_to(vertices[e.start].X, vertices[e.start].Y)
-                ctx.line_to(vertices[e.end].X, vertices[e.end].Y)
+        vertices = self._vertex_xy.tolist()
+        ends = self._edge_ends
+        finite = (ends >= 0).all(axis=1)
+        cells = np.floor(self._vertex_xy / pixel_size(ctx))
+        # Each edge is there twice (once per direction), so only draw one
+        visible = finite & (ends[:, 0] < ends[:, 1])
+        visible[visible] = (cells[ends[visible, 0]] != cells[ends[visible, 1]]).any(
+            axis=1
+        )
+        for start, end in ends[visible].tolist():
+            ctx.move_to(*vertices[start])
+            ctx.line_to(*vertices[end])
         ctx.set_source_rgb(0, 0, 0)
         ctx.stroke()
 
-    def dag(self, path_threshold=500.0) -> Dag:
+    def dag(self, path_threshold=500.0, offset=0.0) -> Dag:
         """
         Compute a DAG for this Voronoi diagram, that contains all _useful_ nodes.
 
         `path_threshold` is the minimum whisker length to leave; real-world
         polygons tend to have about half the paths unhelpful for medial line
         calculation.  By convention this value is in microns.
-        """
-        vii = self.vertex_indices_inside
-        vioe = self.vertex_indices_on_edge
 
-        edges: dict[int, DagEdge] = {}
-
-        for i, e in enumerate(self._raw.GetEdges()):
-            if e.start == -1 or e.end == -1:
-                # remove infinite-only edges, because if we forget and pass -1 to
-                # GetVertex it will crash :/
-                # See https://github.com/fabanc/pyvoronoi/issues/41
-                continue
+        See `dags` for `offset`; this returns only the one with the largest
+        inscribed circle.
+        """
+        return self.dags(path_threshold, offset)[0]
 
-            # This flag is only used for color-coding in Dag today, but having
-            # it makes the `if` structure a lot more obvious.
-            flag = 0
-            if e.start in vii and e.end in vii:
-                flag = INSIDE
-            elif e.start in vii and e.end in vioe:
-                flag = TERMINAL
-            else:
-                # 1. Excludes edges that _begin_ at any polygon edge; those are
-                # uninteresting because the only way to reach them is from other
-                # edges we'd rather visit first.
-                # 2. Excludes edges that are entirely outside the polygon, those
-                # will never be part of the inside skeleton
-                continue
+    def dags(self, path_threshold=500.0, offset=0.0) -> list[Dag]:
+        """
+        Like `dag`, but for the polygon shrunk by `offset`.  Because the medial
+        axis of that is the part of this one whose inscribed radius is over
+        `offset`, that's done by trimming rather than building another
+        diagram, so one `Voronoi` can be reused for many offsets.  Radii in the
+        result are relative to the shrunk polygon.
+
+        Shrinking can split the polygon into several pieces, so this returns
+        one Dag per piece, largest inscribed circle first.
+        """
+        ends = self._edge_ends
+        finite = (ends >= 0).all(axis=1)
+        starts = np.where(finite, ends[:, 0], 0)
+        stops = np.where(finite, ends[:, 1], 0)
+        start_inside = finite & self._inside[starts]
+        # 1. Excludes edges that _begin_ at any polygon edge; those are
+        # uninteresting because the only way to reach them is from other edges
+        # we'd rather visit first.
+        # 2. Excludes edges that are entirely outside the polygon, those will
+        # never be part of the inside skeleton
+        # 3. Excludes infinite edges (-1 vertices, see
+        # https://github.com/fabanc/pyvoronoi/issues/41)
+        flags = np.where(
+            start_inside & self._inside[stops],
+            INSIDE,
+            np.where(start_inside & self._on_edge[stops], TERMINAL, 0),
+        )
+        if offset:
+            flags[self._edge_rad[:, 0] <= offset] = 0
+
+        # Python lists are much faster than numpy for one element at a time
+        vertices = self._vertex_xy.tolist()
+        ends_list = ends.tolist()
+        twins = self._edge_twin.tolist()
+        rads = self._edge_rad.tolist()
+        if offset:
+            sites = self._edge_site.tolist()
+            site_is_point = self._edge_is_point.tolist()
+            min_rads = self._edge_min_rad.tolist()
 
-            edges[i] = DagEdge(self._raw, i, flag)
+        edges: dict[int, DagEdge] = {}
+        for i in np.flatnonzero(flags).tolist():
+            start, end = ends_list[i]
+            edge = DagEdge(
+                i,
+                int(flags[i]),
+                start,
+                end,
+                twins[i],
+                vertices[start],
+                vertices[end],
+                *rads[i],
+            )
+            if offset:
+                t = twins[i]
+                edge.trim(
+                    offset,
+                    sites[i][0] if site_is_point[i] else sites[i],
+                    sites[t][0] if site_is_point[t] else sites[t],
+                    min_rads[i],
+                )
+            edges[i] = edge
 
         # This constructs a graph with many trivial cycles; these are removed in
-        # the Dag constructor.
+        # the Dag constructor.  Terminal edges end outside (or on the edge of)
+        # the polygon, so nothing follows them.
         for i, edge in edges.items():
-            for v in self.vertex_outgoing_edges.get(edge._edge.end, ()):
+            if edge.flag == TERMINAL:
+                continue
+            for v in self.vertex_outgoing_edges.get(edge.end_idx, ()):
                 if v in edges:
                     edge.next.append(edges[v])
 
+        # Group edges into connected pieces by their start vertex
+        parent: dict[int, int] = {}
+
+        def find(v: int) -> int:
+            root = v
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while v != root:
+                parent[v], v = root, parent[v]
+            return root
+
+        for edge in edges.values():
+            if edge.flag == INSIDE:
+                a, b = find(edge.start_idx), find(edge.end_idx)
+                if a != b:
+                    parent[a] = b
+        pieces: dict[int, list[DagEdge]] = {}
+        for edge in edges.values():
+            pieces.setdefault(find(edge.start_idx), []).append(edge)
+
         # Choose the item with the largest inscribed circle, breaking ties
         # towards the right (ties are broken to make testing easier; right
         # chosen for standard endmills cutting conventionally this means more of
         # the chips are thrown behind the machine).
-        lic_vertex_idx = max(
-            edges.items(),
-            key=(lambda x: (x[1].start_rad, x[1].start_pt.x, x[1].start_pt.y)),
-        )[1]._edge.start
-
-        # N.b. there are references to the values from our `edges` in what we're
-        # setting here; that's how the children get included.
-        d = Dag(self._raw, lic_vertex_idx)
-        for i in self.vertex_outgoing_edges[lic_vertex_idx]:
-            if i in edges:
-                if edges[i]._edge.twin in edges:
-                    edges[edges[i]._edge.twin].next = []
-                d.next.append(edges[i])
-                d.start_rad = edges[i].start_rad
-        new = d.simplify(path_threshold)
-        return new
+        def rank(x: DagEdge):
+            return (x.start_rad, x.start_pt.x, x.start_pt.y)
+
+        result = []
+        for piece in sorted(
+            pieces.values(), key=lambda p: rank(max(p, key=rank)), reverse=True
+        ):
+            lic_vertex_idx = max(piece, key=rank).start_idx
+
+            # N.b. there are references to the values from our `edges` in what
+            # we're setting here; that's how the children get included.
+            d = Dag(Point(*vertices[lic_vertex_idx]))
+            for i in self.vertex_outgoing_edges[lic_vertex_idx]:
+                if i in edges:
+                    if edges[i].twin in edges:
+                        edges[edges[i].twin].next = []
+                    d.next.append(edges[i])
+                    d.start_rad = edges[i].start_rad
+            result.append(d.simplify(path_threshold))
+        return result
+
+
+def _point_at_radius(p1, p2, rad1, rad2, site, other_site, r):
+    """
+    Where the medial-axis edge from `p1` (radius `rad1`) to `p2` (`rad2`)
+    between `site` and `other_site` (each a point or a segment, as for
+    `DagEdge.trim`) has radius `r`, which is between the two.
+
+    Between two segments the edge is straight and the radius linear along it.
+    Between two points it's straight but the radius isn't.  Between a point
+    and a segment it's a parabola, which the straight `p1`-`p2` doesn't
+    follow, so the result is on the parabola rather than that chord.  Where
+    the radius dips below `r` and back, this is the crossing nearer `p1`.
+    """
+    point = not isinstance(site[0], list)
+    other_point = not isinstance(other_site[0], list)
+    (x1, y1), (x2, y2) = p1, p2
+    vx, vy = x2 - x1, y2 - y1
+
+    if not point and not other_point:
+        t = (rad1 - r) / (rad1 - rad2)
+        return x1 + vx * t, y1 + vy * t
+
+    if point and other_point:
+        # |p1 + t v - site| = r, decreasing through r, so the smaller root
+        wx, wy = x1 - site[0], y1 - site[1]
+        a = vx * vx + vy * vy
+        b = wx * vx + wy * vy
+        c = wx * wx + wy * wy - r * r
+        t = (-b - sqrt(max(b * b - a * c, 0.0))) / a
+        return x1 + vx * t, y1 + vy * t
+
+    if not point:
+        site, other_site = other_site, site
+    # Distance r from the point, and r from the segment's line on the point's
+    # side: one of the two places a circle meets a line
+    (ax, ay), (bx, by) = other_site
+    length = hypot(bx - ax, by - ay)
+    ux, uy = (bx - ax) / length, (by - ay) / length
+    nx, ny = -uy, ux
+    d = (site[0] - ax) * nx + (site[1] - ay) * ny
+    if d < 0:
+        nx, ny, d = -nx, -ny, -d
+    fx, fy = site[0] + (r - d) * nx, site[1] + (r - d) * ny
+    h = sqrt(max(r * r - (r - d) ** 2, 0.0))
+    # The radius only falls towards the parabola's axis, so the crossing
+    # nearer `p1` is on its side
+    if (x1 - site[0]) * ux + (y1 - site[1]) * uy < 0:
+        h = -h
+    return fx + h * ux, fy + h * uy
 
 
 class BaseDag:
+    # Big pockets make a lot of these, so none of them have a __dict__
+    __slots__ = ()
+
     next: list[BaseDag]
 
+    # These use an explicit stack rather than recursion; a long thin slot can
+    # have thousands of medial-axis edges in a row.
+
     def visit_preorder(self, parent=None) -> Generator[BaseDag, None, None]:
-        yield (parent, self)
-        for x in self.next:
-            yield from x.visit_preorder(parent=self)
+        stack = [(parent, self)]
+        while stack:
+            parent, node = stack.pop()
+            yield (parent, node)
+            # Reads `next` after the yield, so callers can filter it in place
+            stack.extend((node, x) for x in reversed(node.next))
 
     def visit_postorder(self, parent=None) -> Generator[BaseDag, None, None]:
-        for x in self.next:
-            yield from x.visit_postorder(parent=self)
-        yield (parent, self)
+        stack = [(parent, self, False)]
+        while stack:
+            parent, node, expanded = stack.pop()
+            if expanded:
+                yield (parent, node)
+            else:
+                stack.append((parent, node, True))
+                stack.extend((node, x, False) for x in reversed(node.next))
+
+    def __reduce__(self):
+        # Pickled as a flat list of nodes plus child indices rather than
+        # nested, which would recurse once per level (as would copying).
+        index = {id(self): 0}
+        nodes = [self]
+        for node in nodes:
+            for child in node.next:
+                if id(child) not in index:
+                    index[id(child)] = len(nodes)
+                    nodes.append(child)
+        states = []
+        for node in nodes:
+            state = {}
+            for cls in type(node).__mro__:
+                for name in cls.__dict__.get("__slots__", ()):
+                    if name != "next" and hasattr(node, name):
+                        state[name] = getattr(node, name)
+            states.append((type(node), state))
+        children = [[index[id(child)] for child in node.next] for node in nodes]
+        return _unflatten, (states, children)
+
+
+def _unflatten(states, children) -> BaseDag:
+    nodes = []
+    for cls, state in states:
+        node = cls.__new__(cls)
+        for name, value in state.items():
+            setattr(node, name, value)
+        nodes.append(node)
+    for node, idx in zip(nodes, children):
+        node.next = [nodes[i] for i in idx]
+    return nodes[0]
 
 
 class Dag(BaseDag):
-    def __init__(self, vor: pyvoronoi.Pyvoronoi, starting_vertex: int):
-        self.start_pt = Point.from_pyvoronoi_vec(vor.GetVertex(starting_vertex))
+    __slots__ = ("_edge_idx", "next", "path_length", "start_pt", "start_rad")
+
+    def __init__(self, start_pt: Point):
+        self.start_pt = start_pt
         self.start_rad = None
         self._edge_idx = -999
         self.next = []
@@ -171,35 +458,37 @@ class Dag(BaseDag):
         (that are short and unproductive), and ensures that extra edges get
         removed so it is actually a DAG.
 
-        This can probably be done more with fewer visits, but split out to be
-        more understandable.
+        This is two walks: one top-down to drop revisited edges, then one
+        bottom-up (over the first one's order, reversed) that does everything
+        else for an edge's children once all their descendants are done.
         """
-        sys.setrecursionlimit(10000)
         # 1. Ensure edges all have a parent set
         # 2. Filter out non-optimal paths [by hop count]; this is more about
         # removing the opposing half-edges than optimizing the cut path.
         seen: set[int] = set()
+        order = []
         for parent_edge, this_edge in self.visit_preorder():
             seen.add(this_edge._edge_idx)
+            order.append(this_edge)
 
             this_edge.next = [
                 edge
                 for edge in this_edge.next
-                if (edge._edge_idx not in seen and edge._edge.twin not in seen)
+                if (edge._edge_idx not in seen and edge.twin not in seen)
             ]
 
-        # Calculate bottom-up length (to the edge of the circle at the tip,
-        # typically zero)
-        for parent_edge, this_edge in self.visit_postorder():
+        joins = 0
+        for this_edge in reversed(order):
+            # Calculate bottom-up length (to the edge of the circle at the tip,
+            # typically zero)
             if not this_edge.next:
                 this_edge.path_length = this_edge.length() + this_edge.end_rad
-            else:
-                this_edge.path_length = this_edge.length() + max(
-                    [e.path_length for e in this_edge.next]
-                )
+                continue
+            this_edge.path_length = this_edge.length() + max(
+                [e.path_length for e in this_edge.next]
+            )
 
-        # Remove unproductive whiskers
-        for parent_edge, this_edge in self.visit_preorder():
+            # Remove unproductive whiskers
             this_edge.next = [
                 edge
                 for edge in this_edge.next
@@ -207,20 +496,28 @@ class Dag(BaseDag):
             ]
             this_edge.next.sort(key=lambda e: (e.path_length, -e.end_pt.y, e.end_pt.x))
 
-        # Attempt to join single-next edges
-        for parent_edge, this_edge in self.visit_postorder():
-            this_edge.join()
+            # Attempt to join single-next edges; their own children are final
+            # by now, and joining waits until our comparisons above are done
+            # because it changes their `path_length` and `end_pt`.
+            for edge in this_edge.next:
+                edge.join()
+            joins += len(this_edge.next)
 
+        # Far too many to trace one by one
+        count("DagEdge", len(order) - 1)
+        count("DagEdge.join", joins)
         return self
 
-    @ktrace()
+    @ktrace(level=DETAILED)
     def draw(self, ctx):
         for parent_edge, this_edge in self.visit_preorder():
             if parent_edge is None:
                 continue
-            ctx.move_to(*this_edge.start_pt)
-            for pt in this_edge.line.ptr:
-                ctx.line_to(*pt.point)
+            path_points(
+                ctx,
+                [tuple(this_edge.start_pt)]
+                + [tuple(pt.point) for pt in this_edge.line.ptr],
+            )
         ctx.set_source_rgb(0, 0, 1)
         ctx.set_line_width(200)
         ctx.stroke()
@@ -230,57 +527,103 @@ class Dag(BaseDag):
 
 
 class DagEdge(BaseDag):
-    def __init__(self, vor: pyvoronoi.Pyvoronoi, edge_idx: int, flag: int) -> None:
-        self._edge_idx = edge_idx
-        self._edge = vor.GetEdge(edge_idx)
+    """
+    One (half-)edge of the medial axis, made from the arrays read back by
+    `Voronoi._readback` rather than asking pyvoronoi.
 
-        cell = vor.GetCell(self._edge.cell)
-        try:
-            if cell.contains_point:
-                self.site_pt1 = Point(*vor.RetrievePoint(cell))
-                self.site_pt2 = None
-            else:
-                values = vor.RetrieveSegment(cell)
-                self.site_pt1 = Point(*values[0])
-                self.site_pt2 = Point(*values[1])
-        except IndexError:
-            print(
-                "XXX",
-                self._edge.cell,
-                cell.cell_identifier,
-                cell.vertices,
-                cell.source_category,
-                cell.site,
-                cell.is_open,
-                cell.edges,
-            )
-            print("XXX linear", self._edge.is_linear)
-            print("XXX", Point.from_pyvoronoi_vec(vor.GetVertex(self._edge.start)))
-            print("XXX", Point.from_pyvoronoi_vec(vor.GetVertex(self._edge.end)))
-            print("XXX", cell.contains_point)
-            print("XXX", vor.inputSegments)
-            raise
-
-        self.start_pt = Point.from_pyvoronoi_vec(vor.GetVertex(self._edge.start))
-        self.end_pt = Point.from_pyvoronoi_vec(vor.GetVertex(self._edge.end))
-        self.vector = self.end_pt - self.start_pt
-        self.start_rad = self._rad(self.start_pt)
-        self.end_rad = self._rad(self.end_pt)
-        self.line = VariableWidthPolyline(self.start_pt, self.start_rad)
-        self.line.add_point(self.end_pt, self.end_rad)
+    `line` is only built when something asks for it, which most edges (the
+    ones `Dag.simplify` prunes) never do.
+    """
+
+    __slots__ = (
+        "_edge_idx",
+        "_line",
+        "end_idx",
+        "end_pt",
+        "end_rad",
+        "flag",
+        "next",
+        "path_length",
+        "start_idx",
+        "start_pt",
+        "start_rad",
+        "twin",
+    )
+
+    def __init__(
+        self,
+        edge_idx: int,
+        flag: int,
+        start_idx: int,
+        end_idx: int,
+        twin: int,
+        start_xy: tuple[float, float],
+        end_xy: tuple[float, float],
+        start_rad: float,
+        end_rad: float,
+    ) -> None:
+        self._edge_idx = edge_idx
+        self.flag = flag
+        self.start_idx = start_idx
+        self.end_idx = end_idx
+        self.twin = twin
+        self.start_pt = Point(*start_xy)
+        self.end_pt = Point(*end_xy)
+        self.start_rad = start_rad
+        self.end_rad = end_rad
+        self._line: Optional[VariableWidthPolyline] = None
 
         self.next = []
 
-    def _rad(self, pt):
-        if self.site_pt2 is None:
-            return pyvoronoi.Distance(pt, self.site_pt1)
-        else:
-            return pt_line_distance(pt, self.site_pt1, self.site_pt2)
+    @property
+    def vector(self) -> Point:
+        return self.end_pt - self.start_pt
+
+    @property
+    def line(self) -> VariableWidthPolyline:
+        if self._line is None:
+            self._line = VariableWidthPolyline(self.start_pt, self.start_rad)
+            self._line.add_point(self.end_pt, self.end_rad)
+        return self._line
+
+    def trim(
+        self, offset: float, site, other_site, min_rad: Optional[float] = None
+    ) -> None:
+        """
+        Shorten this edge to where the inscribed radius first is `offset` (if
+        it gets that small), and make radii relative to that.  Call before
+        `next` is populated.
+
+        `site` and `other_site` are the input point (x, y) or segment
+        ((x1, y1), (x2, y2)) on each side of the edge, which the radius is the
+        distance to.  `min_rad` is the smallest radius along the edge
+        (default, the end's), which for a curved one can be less than at
+        either end; then the part past the dip is left to the twin edge, which
+        is trimmed the same way from the other end.
+        """
+        if min_rad is None:
+            min_rad = self.end_rad
+        if min_rad < offset:
+            self.end_pt = Point(
+                *_point_at_radius(
+                    tuple(self.start_pt),
+                    tuple(self.end_pt),
+                    self.start_rad,
+                    self.end_rad,
+                    site,
+                    other_site,
+                    offset,
+                )
+            )
+            self.end_rad = offset
+            self.flag = TERMINAL
+        self.start_rad -= offset
+        self.end_rad -= offset
+        self._line = None
 
     def length(self):
         return self.vector.length()
 
-    @ktrace()
     def join(self):
         if len(self.next) == 1:
             if self.line.can_add_point(
@@ -291,6 +634,5 @@ class DagEdge(BaseDag):
                 self.line.extend(self.next[0].line)
                 self.end_pt = self.next[0].end_pt
                 self.end_rad = self.next[0].end_rad
-                self.vector = self.end_pt - self.start_pt
                 self.path_length = self.length() + self.next[0].path_length
                 self.next = self.next[0].next